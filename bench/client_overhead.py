@@ -0,0 +1,64 @@
+"""
+Micro-benchmark of per-call client overhead in the model adapters.
+
+Starts a local stub HTTP server that answers OpenAI chat completion and Anthropic messages requests with a canned
+response, then times generate_response with a fresh client per call (the previous behaviour) against the persistent,
+pooled client owned by each model instance.
+
+Usage: python bench/client_overhead.py [--calls 200]
+"""
+import argparse
+import json
+from pathlib import Path
+import statistics
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from examgrader.models.anthropic_model import AnthropicModel
+from examgrader.models.openai_model import OpenAIModel
+from bench.stub_server import StubServer
+
+
+def time_calls(model, calls, persistent):
+    messages = [{"role": "user", "content": "What is 2 + 2?"}]
+    timings = []
+    for _ in range(calls):
+        if not persistent:
+            model.close()  # forces a new client and connection pool on the next call
+        start = time.perf_counter()
+        model.generate_response(messages)
+        timings.append(time.perf_counter() - start)
+    model.close()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200, help="Number of calls per model and mode.")
+    args = parser.parse_args()
+
+    results = {}
+    with StubServer() as server:
+        models = {
+            "openai": OpenAIModel("stub-key", "gpt-4-turbo-preview", model_params={},
+                                  client_params={"base_url": f"{server.base_url}/v1"}),
+            "anthropic": AnthropicModel("stub-key", "claude-3-opus-20240229", model_params={},
+                                        client_params={"base_url": server.base_url}),
+        }
+
+        for name, model in models.items():
+            for mode, persistent in (("client_per_call", False), ("persistent_client", True)):
+                timings = time_calls(model, args.calls, persistent)
+                results[f"{name}/{mode}"] = {
+                    "mean_ms": statistics.mean(timings) * 1000,
+                    "p50_ms": statistics.median(timings) * 1000,
+                    "p95_ms": statistics.quantiles(timings, n=20)[-1] * 1000,
+                }
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
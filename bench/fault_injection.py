@@ -0,0 +1,148 @@
+"""
+Exercise the retry and rate-limit layer of BaseModel.generate_response against a local stub server that injects
+429 (with Retry-After), 500, 503 and 529 responses.
+
+For each provider, three cases are run from --concurrency threads:
+    faults: --calls requests with --failure_rate of them failed by the stub (under a loose --rpm limit). Checks that
+            every request eventually succeeds and that every failure injected by the server was retried (connection
+            errors under load may add a few more retries).
+    requests_per_minute: --limited_calls requests under a --limited_rpm limit, --limited_calls - --limited_rpm more
+                         than the bucket's initial burst, so the limiter has to make the threads wait.
+    tokens_per_minute: --limited_calls requests under a --limited_tpm limit, sized so that each stub response
+                       (STUB_TOKENS tokens) leaves room for the same burst. max_tokens is set to STUB_TOKENS so the
+                       limiter's estimate covers every response; with an underestimate, up to --concurrency requests
+                       can be admitted on credit before their real usage is charged to the bucket.
+
+The limited cases check that the run took at least as long as the limit allows for the calls beyond the burst, that
+the server received those calls at no more than the limit's rate, and that no window of the run holds more requests
+than the token bucket allows.
+
+Usage: python bench/fault_injection.py [--calls 100] [--concurrency 8] [--failure_rate 0.3] [--rpm 1200]
+                                       [--limited_calls 128] [--limited_rpm 120] [--limited_tpm 1440]
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+from pathlib import Path
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from examgrader.models.anthropic_model import AnthropicModel
+from examgrader.models.openai_model import OpenAIModel
+from bench.stub_server import StubServer
+
+# Input plus output tokens the stub reports for every response
+STUB_TOKENS = 12
+
+# Tolerance on the achieved rate (timer and scheduling jitter)
+RATE_TOLERANCE = 1.15
+
+
+def run_provider(model_class, model_name, base_url, provider, calls, concurrency, rate_limits, model_params=None):
+    # Fast retries keep the benchmark short; Retry-After from the stub still applies
+    model = model_class("stub-key", model_name, model_params=model_params or {}, client_params={"base_url": base_url},
+                        provider=provider, rate_limits=rate_limits,
+                        retry_params={"max_retries": 10, "initial_delay": 0.01, "max_delay": 0.2})
+    messages = [{"role": "user", "content": "What is 2 + 2?"}]
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        responses = list(executor.map(lambda _: model.generate_response(messages, verbose=False), range(calls)))
+    elapsed = time.monotonic() - start
+    model.close()
+
+    return responses, elapsed
+
+
+def check_limited(server, elapsed, calls, burst, per_second):
+    """
+    Results of a rate-limited case, checked against the limit: the run takes at least the time the limit allows for the
+    calls beyond the initial burst, those calls arrive at no more than the limit's rate over the run, and no window
+    of the run holds more requests than a token bucket allows (the burst plus the rate times the window's length).
+    """
+    times = server.request_times
+    span = times[-1] - times[0]
+    # Requests beyond the burst per second of the run, i.e. the rate achieved once the initial burst is spent
+    achieved = (len(times) - burst) / span if span > 0 else float("inf")
+    excess = max(j - i + 1 - burst - per_second * RATE_TOLERANCE * (times[j] - times[i])
+                 for i in range(len(times)) for j in range(i, len(times)))
+    result = {
+        "calls": calls,
+        "server_requests": server.requests,
+        "burst": burst,
+        "elapsed_s": round(elapsed, 3),
+        "min_elapsed_s": round((calls - burst) / per_second, 3),
+        "post_burst_rate_per_s": round(achieved, 3),
+        "max_rate_per_s": round(per_second, 3),
+        "max_window_excess_requests": round(excess, 2),
+    }
+    assert server.requests == calls, result
+    assert elapsed >= result["min_elapsed_s"] / RATE_TOLERANCE, result
+    assert achieved <= per_second * RATE_TOLERANCE, result
+    assert excess <= 1, result
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=100, help="Number of requests per provider in the fault case.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Number of threads sending requests.")
+    parser.add_argument("--failure_rate", type=float, default=0.3, help="Fraction of requests the stub fails.")
+    parser.add_argument("--rpm", type=float, default=1200, help="Client-side requests-per-minute limit (fault case).")
+    parser.add_argument("--limited_calls", type=int, default=128,
+                        help="Number of requests per provider in each rate-limited case.")
+    parser.add_argument("--limited_rpm", type=int, default=120,
+                        help="Requests-per-minute limit of the requests_per_minute case (also its burst).")
+    parser.add_argument("--limited_tpm", type=int, default=1440,
+                        help=f"Tokens-per-minute limit of the tokens_per_minute case; its burst is "
+                             f"limited_tpm / {STUB_TOKENS} requests.")
+    args = parser.parse_args()
+
+    tpm_burst = args.limited_tpm // STUB_TOKENS
+    if args.limited_calls <= max(args.limited_rpm, tpm_burst):
+        parser.error("--limited_calls must exceed the burst of both rate-limited cases.")
+
+    providers = {
+        "openai": (OpenAIModel, "gpt-4-turbo-preview", "/v1"),
+        "anthropic": (AnthropicModel, "claude-3-opus-20240229", ""),
+    }
+
+    results = {}
+    for name, (model_class, model_name, path) in providers.items():
+        results[name] = {}
+        with StubServer(failure_rate=args.failure_rate, retry_after=0.05) as server:
+            responses, elapsed = run_provider(model_class, model_name, server.base_url + path, f"stub-{name}-faults",
+                                              args.calls, args.concurrency, {"requests_per_minute": args.rpm})
+            retries = sum(response["retries"] for response in responses)
+            result = results[name]["faults"] = {
+                "calls": len(responses),
+                "succeeded": sum(response["response_text"] == "stub answer" for response in responses),
+                "server_requests": server.requests,
+                "injected_failures": server.failures,
+                "reported_retries": retries,
+                "elapsed_s": round(elapsed, 3),
+            }
+            assert result["succeeded"] == args.calls, result
+            assert retries >= server.failures, result
+
+        # Each case gets its own provider name, so it starts from a full bucket of its own
+        limited_cases = {
+            "requests_per_minute": ({"requests_per_minute": args.limited_rpm}, {}, args.limited_rpm,
+                                    args.limited_rpm / 60),
+            "tokens_per_minute": ({"tokens_per_minute": args.limited_tpm}, {"max_tokens": STUB_TOKENS}, tpm_burst,
+                                  args.limited_tpm / 60 / STUB_TOKENS),
+        }
+        for case, (rate_limits, model_params, burst, per_second) in limited_cases.items():
+            with StubServer() as server:
+                _, elapsed = run_provider(model_class, model_name, server.base_url + path, f"stub-{name}-{case}",
+                                          args.limited_calls, args.concurrency, rate_limits, model_params)
+                results[name][case] = check_limited(server, elapsed, args.limited_calls, burst, per_second)
+        print(json.dumps({name: results[name]}), file=sys.stderr)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
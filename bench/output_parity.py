@@ -0,0 +1,103 @@
+"""
+Check that every execution mode of examgrader.main writes the same output columns.
+
+Runs `python -m examgrader.main --grading` on a synthetic exam against the local mock provider in the DataFrame mode and with --stream,
+--pipeline and --pipeline --stream, for each output format, and compares the columns (names and order) and row
+counts of exam_responses and graded_exam with those of the DataFrame mode.
+
+Exits with status 1 on any difference, so it can guard the output parity of the row-by-row paths in CI.
+
+Usage: python bench/output_parity.py [--questions 12] [--formats csv,jsonl,parquet] [--output parity_results.json]
+"""
+import argparse
+import json
+from pathlib import Path
+import subprocess
+import sys
+import tempfile
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from examgrader.exam_io import OUTPUT_FORMATS, read_frame
+
+MODES = {"dataframe": [], "stream": ["--stream"], "pipeline": ["--pipeline"],
+         "pipeline_stream": ["--pipeline", "--stream"]}
+
+
+def make_exam(path, questions):
+    with open(path, 'w') as exam_file:
+        for i in range(questions):
+            exam_file.write(json.dumps({
+                "index": i,
+                "question": f"Question {i}: describe the role of enzyme number {i} in cellular respiration.",
+                "answer": f"Enzyme {i} catalyses step {i % 10} of the pathway.",
+                "points": float(1 + i % 3),
+                "image": [],
+                "question_type": "fr",
+            }) + '\n')
+
+
+def make_config(path, seed):
+    path.write_text(json.dumps({"system_prompt": "You are taking a biology exam.", "model_name": "mock-model",
+                                "model_params": {"latency": {"distribution": "fixed", "seconds": 0.001},
+                                                 "error_rate": 0, "seed": seed}}))
+
+
+def run_mode(work_dir, mode, output_format):
+    output_path = work_dir / f"{mode}_{output_format}"
+    subprocess.run([sys.executable, "-m", "examgrader.main", str(work_dir / "exam.jsonl"), str(work_dir / "student.json"),
+                    "--grading", "--grader_config", str(work_dir / "grader.json"), "--output_path", str(output_path),
+                    "--output_format", output_format, "--catalog", str(work_dir / "runs.sqlite"), *MODES[mode]],
+                   cwd=ROOT, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    outputs = {}
+    for name in ("exam_responses", "graded_exam"):
+        df = read_frame(output_path / f"{name}.{output_format}")
+        outputs[name] = {"columns": list(df.columns), "rows": len(df)}
+    return outputs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", type=int, default=12, help="Questions in the synthetic exam.")
+    parser.add_argument("--formats", type=lambda s: s.split(','), default=list(OUTPUT_FORMATS),
+                        help="Output formats to check, separated by commas.")
+    parser.add_argument("--output", type=Path, help="Write the results to this JSON file.")
+    args = parser.parse_args()
+
+    results = {"cases": [], "failures": []}
+    with tempfile.TemporaryDirectory() as work_dir:
+        work_dir = Path(work_dir)
+        make_exam(work_dir / "exam.jsonl", args.questions)
+        make_config(work_dir / "student.json", 0)
+        make_config(work_dir / "grader.json", 1)
+        for output_format in args.formats:
+            reference = run_mode(work_dir, "dataframe", output_format)
+            for mode in MODES:
+                outputs = reference if mode == "dataframe" else run_mode(work_dir, mode, output_format)
+                case = {"mode": mode, "format": output_format,
+                        **{f"{name}_shape": [output["rows"], len(output["columns"])] for name, output in outputs.items()}}
+                print(json.dumps(case), file=sys.stderr)
+                results["cases"].append(case)
+                for name, output in outputs.items():
+                    expected = reference[name]
+                    if set(output["columns"]) != set(expected["columns"]):
+                        results["failures"].append(
+                            f"{mode} ({output_format}) {name}: missing columns "
+                            f"{sorted(set(expected['columns']) - set(output['columns']))}, extra columns "
+                            f"{sorted(set(output['columns']) - set(expected['columns']))}")
+                    elif output["columns"] != expected["columns"]:
+                        results["failures"].append(f"{mode} ({output_format}) {name}: columns in a different order")
+                    if output["rows"] != expected["rows"]:
+                        results["failures"].append(f"{mode} ({output_format}) {name}: {output['rows']} rows instead "
+                                                   f"of {expected['rows']}")
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+    if results["failures"]:
+        sys.exit("Output parity failures:\n  " + "\n  ".join(results["failures"]))
+
+
+if __name__ == "__main__":
+    main()
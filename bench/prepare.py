@@ -0,0 +1,137 @@
+"""
+Micro-benchmark of payload preparation over a growing conversation history.
+
+Prepares the student and grader payload of every question of a synthetic exam in order, as the serial runners do, with
+the full history replayed (context "full", no token budget) and with a sliding window of --window_size turns. No
+request is sent. For each exam size it reports the time per question over the first and the last tenth of the exam.
+
+The shared Conversation renders each history turn once, so with a window the time per question stays flat at any
+exam size. With the full history it grows only by copying the message references into the payload list. That copy is
+linear in the replayed history, like the request body itself. The previous implementation re-rendered every replayed
+turn for each question. It is reproduced here for comparison on exams up to --legacy_max_size questions.
+
+Usage: python bench/prepare.py [--sizes 1000,5000,10000] [--window_size 50] [--legacy_max_size 2000]
+                               [--output prepare_results.json]
+"""
+import argparse
+import json
+from pathlib import Path
+import platform
+import statistics
+import sys
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from examgrader.models.anthropic_model import AnthropicModel
+from examgrader.models.openai_model import OpenAIModel
+from examgrader.records import ExamRecord
+
+SYSTEM_PROMPT = "You are taking a biology exam."
+
+
+def make_exam(rows):
+    return [ExamRecord.from_dict({
+        "index": i,
+        "question": f"Question {i}: describe the role of enzyme number {i} in cellular respiration.",
+        "answer": f"Enzyme {i} catalyses step {i % 10} of the pathway.",
+        "points": float(1 + i % 3),
+        "image": [],
+        "question_type": "fr",
+        "student_response": f"Enzyme {i} is involved in step {i % 10}. " * 4,
+        "grader_response": '{"grader_score": 1, "grader_justification": "Mostly correct."}',
+    }) for i in range(rows)]
+
+
+def legacy_prepare_grader_input(model, question, conversation_history):
+    """
+    The grader payload as previously assembled by OpenAIModel.prepare_grader_input (the student payload differed only
+    in its prompt), re-rendering every history entry for each question.
+    """
+    def prepare_grader_prompt(question, student_response, answer, points):
+        return (f"Question: {question}\n"
+                f"Student response: {student_response}\n"
+                f"Answer key: {answer}\n"
+                f"Total points available: {points}\n")
+
+    current_prompt = prepare_grader_prompt(question['question'], question['student_response'], question['answer'],
+                                           question['points'])
+    start, model.history_tokens_saved = model.context.update(
+        conversation_history,
+        lambda entry: prepare_grader_prompt(entry['question'], entry['student_response'], entry['answer'],
+                                            entry['points']) + f"{entry['grader_response']}",
+        len(current_prompt) // 4 + 1)
+
+    messages = [{"role": "system", "content": model.system_prompt}]
+    for entry in conversation_history[start:]:
+        prompt = prepare_grader_prompt(entry['question'], entry['student_response'], entry['answer'], entry['points'])
+        messages.append({"role": "user", "content": prompt})
+        messages.append({"role": "assistant", "content": entry["grader_response"]})
+    messages.append({"role": "user", "content": current_prompt})
+    return messages
+
+
+def time_prepare(prepare, exam):
+    """
+    Microseconds spent preparing each question's payload, with the history growing as in the serial runners.
+    """
+    history = []
+    timings = []
+    for question in exam:
+        start = time.perf_counter()
+        prepare(question, history)
+        timings.append((time.perf_counter() - start) * 1e6)
+        history.append(question)
+    return timings
+
+
+def summarize(timings):
+    tenth = max(1, len(timings) // 10)
+    return {"first_tenth_us": round(statistics.mean(timings[:tenth]), 2),
+            "last_tenth_us": round(statistics.mean(timings[-tenth:]), 2),
+            "mean_us": round(statistics.mean(timings), 2),
+            "total_ms": round(sum(timings) / 1000, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=lambda s: [int(size) for size in s.split(',')], default=[1000, 5000, 10000],
+                        help="Exam sizes (number of questions), separated by commas.")
+    parser.add_argument("--window_size", type=int, default=50, help="Turns replayed in the \"window\" context.")
+    parser.add_argument("--legacy_max_size", type=int, default=2000,
+                        help="Largest exam size to time the previous implementation on.")
+    parser.add_argument("--output", type=Path, help="Write the results to this JSON file.")
+    args = parser.parse_args()
+
+    results = {"python": platform.python_version(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "cases": []}
+    for rows in args.sizes:
+        exam = make_exam(rows)
+        cases = []
+        for context in ({"mode": "full"}, {"mode": "window", "window_size": args.window_size}):
+            for model_class in (OpenAIModel, AnthropicModel):
+                for stage in ("student", "grader"):
+                    model = model_class("bench-key", "bench-model", system_prompt=SYSTEM_PROMPT, model_params={},
+                                        context_params=context)
+                    prepare = model.prepare_student_input if stage == "student" else model.prepare_grader_input
+                    cases.append({"implementation": model_class.__name__, "context": context["mode"], "stage": stage,
+                                  **summarize(time_prepare(prepare, exam))})
+            if rows <= args.legacy_max_size:
+                model = OpenAIModel("bench-key", "bench-model", system_prompt=SYSTEM_PROMPT, model_params={},
+                                    context_params=context)
+                timings = time_prepare(lambda question, history: legacy_prepare_grader_input(model, question, history),
+                                       exam)
+                cases.append({"implementation": "legacy OpenAIModel", "context": context["mode"], "stage": "grader",
+                              **summarize(timings)})
+
+        for case in cases:
+            case = {"questions": rows, **case}
+            print(json.dumps(case), file=sys.stderr)
+            results["cases"].append(case)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Offline check of the Anthropic prompt-caching payloads on the history-replay path.
+
+Builds the student requests for a synthetic exam with full conversation history (no API calls), checks that every
+request carries cache_control breakpoints on the system prompt and on the latest turn, and estimates how many input
+tokens each request could read from the cache written by the previous one. Cost is reported relative to sending every
+request uncached, using Anthropic's multipliers for cache writes (1.25x) and reads (0.1x).
+
+Usage: python bench/prompt_cache.py [--questions 50] [--answer_chars 800]
+"""
+import argparse
+import json
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from examgrader.models.anthropic_model import AnthropicModel
+from examgrader.models.base_model import estimate_tokens
+
+CACHE_WRITE_MULTIPLIER = 1.25
+CACHE_READ_MULTIPLIER = 0.1
+
+
+def text_of(content):
+    if isinstance(content, str):
+        return content
+    return "".join(part.get("text", "") for part in content)
+
+
+def breakpoints(params):
+    system = params.get("system")
+    marked = [block for block in system if "cache_control" in block] if isinstance(system, list) else []
+    for message in params["messages"]:
+        if isinstance(message["content"], list):
+            marked += [block for block in message["content"] if "cache_control" in block]
+    return len(marked)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", type=int, default=50, help="Number of exam questions.")
+    parser.add_argument("--answer_chars", type=int, default=800, help="Length of each simulated student answer.")
+    args = parser.parse_args()
+
+    system_prompt = load_system_prompt()
+    model = AnthropicModel("offline-key", "claude-3-opus-20240229", system_prompt=system_prompt, model_params={},
+                           prompt_caching=True)
+
+    history = []
+    uncached_tokens = cached_cost = read_tokens = write_tokens = 0
+    previous_prefix_tokens = 0
+    for index in range(args.questions):
+        question = {"index": index, "question": f"Question {index}: explain process number {index}.", "image": []}
+        messages = model.prepare_student_input(question, history)
+        params = model.build_request_params(messages)
+
+        expected = 2 if len(messages) > 1 else 1
+        assert breakpoints(params) == expected, f"question {index}: expected {expected} cache breakpoints"
+        assert "cache_control" not in json.dumps(messages), "payload messages must not be modified"
+
+        total = estimate_tokens(system_prompt) + sum(estimate_tokens(text_of(m["content"])) for m in params["messages"])
+        read = previous_prefix_tokens if len(messages) > 1 else estimate_tokens(system_prompt) * (index > 0)
+        write = total - read
+        uncached_tokens += total
+        read_tokens += read
+        write_tokens += write
+        cached_cost += read * CACHE_READ_MULTIPLIER + write * CACHE_WRITE_MULTIPLIER
+        previous_prefix_tokens = total
+
+        history.append({**question, "student_response": "x" * args.answer_chars})
+
+    print(json.dumps({
+        "questions": args.questions,
+        "estimated_input_tokens": uncached_tokens,
+        "estimated_cache_read_tokens": read_tokens,
+        "estimated_cache_write_tokens": write_tokens,
+        "cached_fraction": read_tokens / uncached_tokens,
+        "relative_input_cost": cached_cost / uncached_tokens,
+    }, indent=2))
+
+
+def load_system_prompt():
+    role_path = Path(__file__).resolve().parent.parent / "roles" / "claude-student-config.json"
+    return json.loads(role_path.read_text())["system_prompt"]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Micro-benchmark of per-row bookkeeping overhead in the exam runners.
+
+Runs the student and grader stages over a synthetic exam with a stub model that answers instantly, so the measured
+time is the runners' own work: iterating rows, recording results and building the output DataFrame. The previous
+implementation (DataFrame.iterrows with pandas Series mutation) is reproduced here for comparison against the
+ExamRecord-based runners.
+
+Usage: python bench/row_overhead.py [--rows 10000]
+"""
+import argparse
+from datetime import datetime
+import json
+from pathlib import Path
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from examgrader.models.base_model import BaseModel
+from examgrader.runners import grader_grade_exam, student_take_exam
+
+STUDENT_RESPONSE = {"response_text": "4", "model": "stub-model", "input_tokens": 12, "output_tokens": 1,
+                    "stop_reason": "stop", "model_params": {"temperature": 0}, "system_prompt": "You are a student."}
+GRADER_RESPONSE = dict(STUDENT_RESPONSE, response_text='{"grader_score": 1, "grader_justification": "Correct."}')
+
+
+class StubModel(BaseModel):
+    """
+    Zero-latency model: builds a one-message payload and returns a canned response without any I/O.
+    """
+
+    def __init__(self, response):
+        super().__init__("stub-key", "stub-model", model_params={}, context_params={"mode": "stateless"})
+        self.response = response
+
+    def prepare_student_input(self, question, conversation_history):
+        return [{"role": "user", "content": question['question']}]
+
+    def prepare_grader_input(self, question, conversation_history):
+        return [{"role": "user", "content": question['student_response']}]
+
+    def generate_response(self, messages, verbose=True, on_text=None):
+        return dict(self.response)
+
+
+def make_exam(rows):
+    return pd.DataFrame({
+        "index": range(rows),
+        "question": [f"What is {i} + {i}?" for i in range(rows)],
+        "answer": [str(2 * i) for i in range(rows)],
+        "points": [1.0] * rows,
+        "image": [[] for _ in range(rows)],
+        "question_type": ["fr"] * rows,
+    })
+
+
+def legacy_student_take_exam(exam_df, student_model):
+    student_history = []
+    for _, question in exam_df.iterrows():
+        student_payload = student_model.prepare_student_input(question, student_history)
+        student_response = student_model.generate_response(student_payload)
+        question["student_response"] = student_response["response_text"]
+        question["student_response_time"] = datetime.now().isoformat()
+        question["student_model_specified"] = student_model.model_name
+        question["student_model_used"] = student_response["model"]
+        question["student_input_tokens"] = student_response["input_tokens"]
+        question["student_output_tokens"] = student_response["output_tokens"]
+        question["student_stop_reason"] = student_response["stop_reason"]
+        question["student_model_params"] = student_response["model_params"]
+        question["student_system_prompt"] = student_response["system_prompt"]
+        student_history.append(question)
+    return pd.DataFrame(student_history)
+
+
+def legacy_grader_grade_exam(exam_df, grader_model):
+    grader_history = []
+    for _, question in exam_df.iterrows():
+        grader_payload = grader_model.prepare_grader_input(question, grader_history)
+        grader_response = grader_model.generate_response(grader_payload)
+        question["grader_response"] = grader_response["response_text"]
+        json_response = json.loads(question["grader_response"])
+        question["grader_score"] = json_response["grader_score"]
+        question["grader_justification"] = json_response["grader_justification"]
+        question["grader_response_time"] = datetime.now().isoformat()
+        question["grader_model_specified"] = grader_model.model_name
+        question["grader_model_used"] = grader_response["model"]
+        question["grader_input_tokens"] = grader_response["input_tokens"]
+        question["grader_output_tokens"] = grader_response["output_tokens"]
+        question["grader_stop_reason"] = grader_response["stop_reason"]
+        question["grader_model_params"] = grader_response["model_params"]
+        question["grader_system_prompt"] = grader_response["system_prompt"]
+        grader_history.append(question)
+    return pd.DataFrame(grader_history)
+
+
+def time_stage(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10000, help="Number of exam rows.")
+    args = parser.parse_args()
+
+    exam_df = make_exam(args.rows)
+    student, grader = StubModel(STUDENT_RESPONSE), StubModel(GRADER_RESPONSE)
+
+    implementations = {
+        "iterrows_series": (legacy_student_take_exam, legacy_grader_grade_exam),
+        "exam_records": (student_take_exam, grader_grade_exam),
+    }
+
+    results = {}
+    for name, (take_exam, grade_exam) in implementations.items():
+        student_df, student_seconds = time_stage(take_exam, exam_df, student)
+        _, grader_seconds = time_stage(grade_exam, student_df, grader)
+        results[name] = {
+            "rows": args.rows,
+            "student_seconds": student_seconds,
+            "grader_seconds": grader_seconds,
+            "overhead_us_per_row": (student_seconds + grader_seconds) / (2 * args.rows) * 1e6,
+        }
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
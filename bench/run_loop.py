@@ -0,0 +1,157 @@
+"""
+Benchmark of the run loop (student, grader and combined student + grader flows) against the local mock provider.
+
+Each case runs in a fresh subprocess on a synthetic exam and reports:
+    questions_per_second: questions completed per wall-clock second (for the combined flow, graded questions).
+    latency_p50_ms / latency_p95_ms: per-request latency as seen by the runner, including retries.
+    peak_memory_mb: peak resident memory of the case's process above its baseline after imports.
+    overhead_us_per_row: wall-clock time per row not spent waiting on the (simulated) API, i.e. the runner's own work.
+
+Results are printed and, with --output, written as JSON so that regressions can be tracked between commits.
+
+Usage: python bench/run_loop.py [--sizes 100,1000,10000] [--flows student,grader,combined] [--concurrency 8]
+                                [--latency_ms 5] [--error_rate 0] [--output bench_results.json]
+"""
+import argparse
+import json
+import multiprocessing
+from pathlib import Path
+import platform
+import resource
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+FLOWS = ("student", "grader", "combined")
+
+
+def make_exam(rows):
+    import pandas as pd
+
+    return pd.DataFrame({
+        "index": range(rows),
+        "question": [f"Question {i}: describe the role of enzyme number {i} in cellular respiration." for i in range(rows)],
+        "answer": [f"Enzyme {i} catalyses step {i % 10} of the pathway." for i in range(rows)],
+        "points": [float(1 + i % 3) for i in range(rows)],
+        "image": [[] for _ in range(rows)],
+        "question_type": ["fr"] * rows,
+    })
+
+
+def mock_model(model_params, seed):
+    from examgrader.models.mock_model import MockModel
+
+    return MockModel(None, "mock-model", system_prompt="You are taking a biology exam.",
+                     model_params={**model_params, "seed": seed}, provider="mock",
+                     retry_params={"max_retries": 10, "initial_delay": 0.001, "max_delay": 0.01})
+
+
+def time_requests(model, latencies, simulated):
+    """
+    Record the runner-visible latency of every generate_response call and the simulated API time of every attempt.
+    """
+    generate_response, sample_latency = model.generate_response, model.sample_latency
+    lock = threading.Lock()
+
+    def timed_generate_response(messages, verbose=True, on_text=None):
+        start = time.perf_counter()
+        response = generate_response(messages, verbose, on_text)
+        with lock:
+            latencies.append(time.perf_counter() - start)
+        return response
+
+    def recorded_sample_latency():
+        seconds = sample_latency()
+        with lock:
+            simulated.append(seconds)
+        return seconds
+
+    model.generate_response = timed_generate_response
+    model.sample_latency = recorded_sample_latency
+
+
+def run_case(flow, rows, concurrency, model_params):
+    from examgrader.runners import grader_grade_exam, student_take_exam
+
+    exam_df = make_exam(rows)
+    student, grader = mock_model(model_params, seed=0), mock_model(model_params, seed=1)
+    if flow == "grader":
+        # Grade a pre-answered exam; the student pass is not timed
+        exam_df = student_take_exam(exam_df, student, concurrency=concurrency)
+
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    latencies, simulated = [], []
+    for model in (student, grader):
+        time_requests(model, latencies, simulated)
+
+    start = time.perf_counter()
+    if flow in ("student", "combined"):
+        exam_df = student_take_exam(exam_df, student, concurrency=concurrency)
+    if flow in ("grader", "combined"):
+        exam_df = grader_grade_exam(exam_df, grader, concurrency=concurrency)
+    elapsed = time.perf_counter() - start
+
+    requests_per_row = 2 if flow == "combined" else 1
+    return {
+        "flow": flow,
+        "rows": rows,
+        "concurrency": concurrency,
+        "seconds": elapsed,
+        "questions_per_second": rows / elapsed,
+        "latency_p50_ms": statistics.median(latencies) * 1000,
+        "latency_p95_ms": statistics.quantiles(latencies, n=20)[-1] * 1000 if len(latencies) > 1 else latencies[0] * 1000,
+        "peak_memory_mb": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline_kb) / 1024,
+        "overhead_us_per_row": max(0.0, elapsed - sum(simulated) / concurrency) / (rows * requests_per_row) * 1e6,
+    }
+
+
+def run_case_in_subprocess(*args):
+    # A fresh process per case keeps peak memory measurements independent
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(run_case, args)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=lambda s: [int(size) for size in s.split(',')], default=[100, 1000, 10000],
+                        help="Exam sizes (number of questions), separated by commas.")
+    parser.add_argument("--flows", type=lambda s: s.split(','), default=list(FLOWS),
+                        help=f"Flows to run, separated by commas: {', '.join(FLOWS)}.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Questions sent to the mock in parallel.")
+    parser.add_argument("--latency_ms", type=float, default=5.0, help="Median simulated API latency (lognormal).")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="Fraction of simulated requests that fail.")
+    parser.add_argument("--output", type=Path, help="Write the results to this JSON file.")
+    args = parser.parse_args()
+
+    unknown_flows = set(args.flows) - set(FLOWS)
+    if unknown_flows:
+        parser.error(f"Unknown flows: {', '.join(sorted(unknown_flows))}.")
+
+    model_params = {
+        "latency": {"distribution": "lognormal", "median": args.latency_ms / 1000, "sigma": 0.5},
+        "error_rate": args.error_rate,
+        "output_tokens": {"min": 20, "max": 200},
+    }
+
+    results = {
+        "python": platform.python_version(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "settings": {"concurrency": args.concurrency, "latency_ms": args.latency_ms, "error_rate": args.error_rate},
+        "cases": [],
+    }
+    for rows in args.sizes:
+        for flow in args.flows:
+            case = run_case_in_subprocess(flow, rows, args.concurrency, model_params)
+            print(json.dumps(case), file=sys.stderr)
+            results["cases"].append(case)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
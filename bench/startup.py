@@ -0,0 +1,117 @@
+"""
+Startup-time benchmark of the examgrader command line.
+
+Runs `python -m examgrader.cli <command> --help` for each subcommand in fresh subprocesses and reports:
+    median_ms / min_ms: wall-clock time of the whole process, from spawn to exit.
+    top_imports: the modules imported directly by the process that took longest to import (from -X importtime),
+                 in milliseconds including their own imports.
+    heavy_imports: heavy dependencies (pandas, numpy, tqdm, the provider SDKs, pyarrow, Pillow) that were imported.
+
+Exits with status 1 if a command's median time exceeds --budget_ms or a command other than report (which is built on
+pandas) imports a heavy dependency, so it can guard against startup regressions in CI.
+
+Usage: python bench/startup.py [--commands run,students,grade,catalog,report] [--repeats 5] [--budget_ms 150]
+                               [--output startup_results.json]
+"""
+import argparse
+import json
+from pathlib import Path
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from examgrader.cli import COMMANDS
+
+HEAVY_MODULES = ("pandas", "numpy", "openai", "anthropic", "pyarrow", "PIL", "tqdm")
+
+# Commands allowed to import heavy modules while printing their help
+HEAVY_COMMANDS = {"report"}
+
+
+def parse_importtime(stderr):
+    """
+    (module, cumulative microseconds, nesting depth) for each line of -X importtime output.
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue  # header line
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((name.strip(), int(cumulative), depth))
+    return imports
+
+
+def time_command(command, repeats):
+    arguments = [sys.executable, "-m", "examgrader.cli", command, "--help"]
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(arguments, cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    # A separate traced run, since -X importtime slows the process down
+    traced = subprocess.run([sys.executable, "-X", "importtime", *arguments[1:]], cwd=ROOT, check=True,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    imports = parse_importtime(traced.stderr)
+    top_level = sorted((item for item in imports if item[2] == 0), key=lambda item: item[1], reverse=True)
+    heavy = sorted({name.split(".")[0] for name, _, _ in imports if name.split(".")[0] in HEAVY_MODULES})
+    return {
+        "command": command,
+        "median_ms": round(statistics.median(timings), 1),
+        "min_ms": round(min(timings), 1),
+        "top_imports": {name: round(cumulative / 1000, 1) for name, cumulative, _ in top_level[:8]},
+        "heavy_imports": heavy,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--commands", type=lambda s: s.split(','), default=list(COMMANDS),
+                        help=f"Commands to time, separated by commas: {', '.join(COMMANDS)}.")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed runs per command.")
+    parser.add_argument("--budget_ms", type=float, default=150.0,
+                        help="Maximum median startup time per command (commands that may import heavy modules are "
+                             "reported but not held to it).")
+    parser.add_argument("--output", type=Path, help="Write the results to this JSON file.")
+    args = parser.parse_args()
+
+    unknown_commands = set(args.commands) - set(COMMANDS)
+    if unknown_commands:
+        parser.error(f"Unknown commands: {', '.join(sorted(unknown_commands))}.")
+
+    results = {
+        "python": platform.python_version(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "settings": {"repeats": args.repeats, "budget_ms": args.budget_ms},
+        "cases": [],
+    }
+    failures = []
+    for command in args.commands:
+        case = time_command(command, args.repeats)
+        print(json.dumps(case), file=sys.stderr)
+        results["cases"].append(case)
+        if command in HEAVY_COMMANDS:
+            continue
+        if case["median_ms"] > args.budget_ms:
+            failures.append(f"{command}: median startup {case['median_ms']} ms exceeds the {args.budget_ms:g} ms budget")
+        if case["heavy_imports"]:
+            failures.append(f"{command}: --help imports {', '.join(case['heavy_imports'])}")
+
+    results["failures"] = failures
+    print(json.dumps(results, indent=2))
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+    if failures:
+        sys.exit("Startup regressions:\n  " + "\n  ".join(failures))
+
+
+if __name__ == "__main__":
+    main()
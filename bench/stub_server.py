@@ -0,0 +1,106 @@
+"""
+Local stub of the OpenAI chat completions and Anthropic messages endpoints used by the benchmarks.
+
+The server can inject failures (e.g. 429 with Retry-After, 500, 529) at a given rate and add fixed latency, so retry,
+rate-limit and client behaviour can be exercised without calling the real APIs.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import threading
+import time
+
+OPENAI_RESPONSE = {
+    "id": "chatcmpl-stub", "object": "chat.completion", "created": 0, "model": "gpt-4-turbo-preview",
+    "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "stub answer"}}],
+    "usage": {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12},
+}
+
+ANTHROPIC_RESPONSE = {
+    "id": "msg_stub", "type": "message", "role": "assistant", "model": "claude-3-opus-20240229",
+    "content": [{"type": "text", "text": "stub answer"}], "stop_reason": "end_turn", "stop_sequence": None,
+    "usage": {"input_tokens": 10, "output_tokens": 2},
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so pooled connections are reused
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+
+        with server.lock:
+            server.requests += 1
+            server.request_times.append(time.monotonic())
+            fail = server.random.random() < server.failure_rate
+            if fail:
+                server.failures += 1
+                status = server.random.choice(server.failure_statuses)
+
+        if fail:
+            payload = json.dumps({"error": {"type": "stub_error", "message": f"Injected {status}"}}).encode()
+            self.send_response(status)
+            if status == 429 and server.retry_after is not None:
+                self.send_header("Retry-After", str(server.retry_after))
+        else:
+            body = OPENAI_RESPONSE if self.path.endswith("/chat/completions") else ANTHROPIC_RESPONSE
+            payload = json.dumps(body).encode()
+            self.send_response(200)
+
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer:
+    """
+    Context manager running the stub on a free local port. base_url gives the root URL (append /v1 for OpenAI).
+    """
+
+    def __init__(self, failure_rate=0.0, failure_statuses=(429, 500, 503, 529), retry_after=None, latency=0.0, seed=0):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        self.httpd.failure_rate = failure_rate
+        self.httpd.failure_statuses = list(failure_statuses)
+        self.httpd.retry_after = retry_after
+        self.httpd.latency = latency
+        self.httpd.random = random.Random(seed)
+        self.httpd.lock = threading.Lock()
+        self.httpd.requests = 0
+        self.httpd.request_times = []
+        self.httpd.failures = 0
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}"
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    @property
+    def request_times(self):
+        """
+        time.monotonic() at which each request was received, in arrival order.
+        """
+        return list(self.httpd.request_times)
+
+    @property
+    def failures(self):
+        return self.httpd.failures
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
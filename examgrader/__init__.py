@@ -0,0 +1,4 @@
+"""
+ExamGrader: have LLMs take exams and grade the answers with grader models. The command line entry point is
+examgrader.cli, installed as the `examgrader` command.
+"""
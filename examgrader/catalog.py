@@ -0,0 +1,236 @@
+"""
+Index of run outputs, so runs can be found by exam, model, config and date and compared without opening every output
+directory. main.py, student_main.py and grader_main.py add their outputs automatically; runs written before the catalog
+existed can be added with:
+
+    examgrader catalog index responses/
+"""
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+import argparse
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+
+from examgrader.exam_io import OUTPUT_FORMATS, read_frame, scan_columns
+from examgrader.sharding import PARTS_DIR
+
+DEFAULT_CATALOG_PATH = Path('responses') / 'runs.sqlite'
+
+# Default output directories are named <exam>_output_<timestamp>
+_RUN_DIR_NAME = re.compile(r"^(?P<exam>.+)_output_(?P<timestamp>\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})$")
+
+
+def exam_from_path(output_file: Path) -> str:
+    """
+    Exam name of a run output, from its default output directory name (<exam>_output_<timestamp>) or else the name of
+    the directory itself.
+    """
+    run_dir = Path(output_file).resolve().parent
+    match = _RUN_DIR_NAME.match(run_dir.name)
+    return match["exam"] if match else run_dir.name
+
+
+def saved_config(output_file: Path, role: str):
+    """
+    (config name, config) of the role config saved next to a run output, or (None, None) if there is none. The config
+    name is None for the default <role>.json; student_main.py and grader ensembles name outputs and configs after
+    each config (exam_responses_<name>, graded_exam_<name> and <name>.json).
+    """
+    output_file = Path(output_file)
+    prefix = "exam_responses_" if role == "student" else "graded_exam_"
+    config_stem = output_file.stem[len(prefix):] if output_file.stem.startswith(prefix) else None
+    config_path = output_file.parent / (f"{config_stem}.json" if config_stem else f"{role}.json")
+    return config_stem, json.loads(config_path.read_text()) if config_path.exists() else None
+
+
+def config_hash(config: Dict) -> str:
+    """
+    Stable short hash of a role config (model, system prompt, model_params, ...), independent of key order.
+    """
+    serialized = json.dumps(config, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(serialized.encode()).hexdigest()[:16]
+
+
+def saved_config_hash(output_file: Path, role: str) -> Optional[str]:
+    """
+    Config hash of the role config saved next to a run output (see saved_config), or None if there is none.
+    """
+    config = saved_config(output_file, role)[1]
+    return config_hash(config) if config else None
+
+
+class RunCatalog:
+    """
+    SQLite catalog with one entry per output file (the exam responses of a student config or a graded exam). Each
+    entry records the exam, role, model, config hash, creation date, output format and the run's token usage and
+    estimated cost. runs() selects entries; load() reads the selected outputs with only the requested columns.
+    """
+
+    def __init__(self, catalog_path: Union[str, Path] = DEFAULT_CATALOG_PATH):
+        self.catalog_path = Path(catalog_path)
+        self.catalog_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.catalog_path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        self._connection.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS runs (
+                output_file TEXT PRIMARY KEY,
+                run_dir TEXT NOT NULL,
+                exam TEXT NOT NULL,
+                role TEXT NOT NULL,
+                model TEXT,
+                config_hash TEXT,
+                config TEXT,
+                created_at TEXT NOT NULL,
+                output_format TEXT NOT NULL,
+                questions INTEGER,
+                input_tokens INTEGER,
+                output_tokens INTEGER,
+                estimated_cost_usd REAL
+            );
+            CREATE INDEX IF NOT EXISTS runs_exam ON runs (exam);
+            CREATE INDEX IF NOT EXISTS runs_model ON runs (model);
+            CREATE INDEX IF NOT EXISTS runs_config_hash ON runs (config_hash);
+            CREATE INDEX IF NOT EXISTS runs_created_at ON runs (created_at);
+        """)
+
+    def record(self, output_file: Path, exam: str, role: str, config: Optional[Dict], summary: Optional[Dict] = None,
+               created_at: Optional[datetime] = None):
+        """
+        Add or replace the entry for an output file. summary is the stage's StageMetrics summary (or usage) if known.
+        """
+        output_file = Path(output_file).resolve()
+        summary = summary or {}
+        entry = (str(output_file), str(output_file.parent), exam, role, (config or {}).get("model_name"),
+                 config_hash(config) if config else None, json.dumps(config) if config else None,
+                 (created_at or datetime.now()).isoformat(timespec='seconds'), output_file.suffix[1:],
+                 summary.get("questions"), summary.get("input_tokens"), summary.get("output_tokens"),
+                 summary.get("estimated_cost_usd"))
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", entry)
+            self._connection.commit()
+
+    def exam_of(self, output_file: Path) -> str:
+        """
+        Exam that a run output (e.g. the exam responses given to grader_main.py) was produced from: its catalog entry,
+        else as given by exam_from_path.
+        """
+        output_file = Path(output_file).resolve()
+        with self._lock:
+            row = self._connection.execute("SELECT exam FROM runs WHERE output_file = ?", (str(output_file),)).fetchone()
+        return row["exam"] if row is not None else exam_from_path(output_file)
+
+    def config_hash_of(self, output_file: Path, role: str) -> Optional[str]:
+        """
+        Config hash of a run output: its catalog entry, else the hash of the config saved next to it (see
+        saved_config), else None.
+        """
+        output_file = Path(output_file).resolve()
+        with self._lock:
+            row = self._connection.execute("SELECT config_hash FROM runs WHERE output_file = ?",
+                                           (str(output_file),)).fetchone()
+        return row["config_hash"] if row is not None and row["config_hash"] else saved_config_hash(output_file, role)
+
+    def runs(self, exam: Optional[str] = None, role: Optional[str] = None, model: Optional[str] = None,
+             config_hash: Optional[str] = None, since: Optional[str] = None, until: Optional[str] = None) -> List[Dict]:
+        """
+        Catalog entries matching every given filter, oldest first. since/until are ISO dates or datetimes.
+        """
+        filters = {"exam = ?": exam, "role = ?": role, "model = ?": model, "config_hash = ?": config_hash,
+                   "created_at >= ?": since, "created_at <= ?": until}
+        conditions = [condition for condition, value in filters.items() if value is not None]
+        query = "SELECT * FROM runs" + (" WHERE " + " AND ".join(conditions) if conditions else "")
+        with self._lock:
+            rows = self._connection.execute(query + " ORDER BY created_at, output_file",
+                                            [value for value in filters.values() if value is not None]).fetchall()
+        return [dict(row) for row in rows]
+
+    def load(self, columns: Optional[List[str]] = None, **filters):
+        """
+        Concatenate the outputs of the runs matching filters (see runs()) into one DataFrame, with the catalog's
+        exam, role, model, config_hash and created_at columns prepended. Only the given columns are read from Parquet
+        outputs; CSV and JSONL outputs are parsed in full and then pruned.
+        """
+        import pandas as pd
+
+        frames = []
+        for run in self.runs(**filters):
+            if not Path(run["output_file"]).exists():
+                continue
+            if columns is not None:
+                names = scan_columns(run["output_file"])
+                df = read_frame(run["output_file"], [column for column in columns if column in names])
+            else:
+                df = read_frame(run["output_file"])
+            for position, key in enumerate(("exam", "role", "model", "config_hash", "created_at")):
+                df.insert(position, key, run[key])
+            frames.append(df)
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    def index_directory(self, root: Path) -> int:
+        """
+        Add the outputs found in the run directories under root (as written by main.py, student_main.py and
+        grader_main.py). The exam and date come from default directory names (<exam>_output_<timestamp>), falling
+        back to the directory name and file modification time. The parts of sharded runs are skipped in favour of
+        their merged outputs. Returns the number of outputs indexed.
+        """
+        indexed = 0
+        for output_file in sorted(Path(root).rglob("*")):
+            role = ("grader" if output_file.stem.startswith("graded_exam")
+                    else "student" if output_file.stem.startswith("exam_responses") else None)
+            if role is None or output_file.suffix[1:] not in OUTPUT_FORMATS or output_file.parent.name == PARTS_DIR:
+                continue
+
+            run_dir = output_file.parent
+            match = _RUN_DIR_NAME.match(run_dir.name)
+            created_at = (datetime.strptime(match["timestamp"], "%Y-%m-%d_%H-%M-%S") if match
+                          else datetime.fromtimestamp(output_file.stat().st_mtime))
+            exam = exam_from_path(output_file)
+
+            config_stem, config = saved_config(output_file, role)
+
+            metadata_path = run_dir / "run_metadata.json"
+            metrics_path = run_dir / "run_metrics.json"
+            summary_path = metrics_path if metrics_path.exists() else metadata_path
+            summary = json.loads(summary_path.read_text()).get(config_stem or role) if summary_path.exists() else None
+
+            self.record(output_file, exam, role, config, summary, created_at)
+            indexed += 1
+        return indexed
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index and list runs in the run catalog.")
+    parser.add_argument("--catalog", type=Path, default=DEFAULT_CATALOG_PATH, help="Filepath to the run catalog (SQLite).")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    index_parser = subparsers.add_parser("index", help="Add the outputs of existing run directories.")
+    index_parser.add_argument("roots", type=Path, nargs="+", help="Run directories or directories containing them.")
+    list_parser = subparsers.add_parser("list", help="List catalogued runs.")
+    for key in ("exam", "role", "model", "config_hash", "since", "until"):
+        list_parser.add_argument(f"--{key}")
+    args = parser.parse_args(argv)
+
+    catalog = RunCatalog(args.catalog)
+    if args.command == "index":
+        for root in args.roots:
+            print(f"Indexed {catalog.index_directory(root)} output(s) under {root}.")
+    else:
+        runs = catalog.runs(exam=args.exam, role=args.role, model=args.model, config_hash=args.config_hash,
+                            since=args.since, until=args.until)
+        for run in runs:
+            print(f"{run['created_at']}  {run['exam']}  {run['role']:<7}  {run['model']}  {run['config_hash']}  "
+                  f"{run['output_file']}")
+    catalog.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+"""
+Print the total points available in an exam file (JSONL, CSV or Parquet).
+
+Usage: python -m examgrader.check_total_points [exam_path]
+"""
+import argparse
+import math
+
+from examgrader.exam_io import iter_rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Total the points of the questions in an exam file.")
+    parser.add_argument("exam_path", nargs="?", default='exams/7.26-Exam1-2024.jsonl', help="Filepath to the exam.")
+    args = parser.parse_args(argv)
+
+    total_points = 0
+    for question_data in iter_rows(args.exam_path):
+        points = question_data.get("points")
+        # Questions without points (None, NaN or empty in CSV) count as 0
+        if points is not None and points != "" and not (isinstance(points, float) and math.isnan(points)):
+            total_points += float(points)
+
+    print(f"Total points across all questions: {total_points:g}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+from pathlib import Path
+import json
+import threading
+import warnings
+
+
+def to_json_value(value):
+    # numpy scalars and arrays appear in rows built from pandas objects; checked by duck typing so numpy is not imported
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return str(value)
+
+
+class RunJournal:
+    """
+    Append-only JSONL journal of completed rows. Each row is written and flushed as soon as it finishes, so an
+    interrupted run can be resumed without re-requesting (and re-paying for) the rows already completed.
+
+    Every line records the stage ("student" or "grader"), the model, the question index and the full output row.
+    """
+
+    def __init__(self, journal_path: Path):
+        self.journal_path = Path(journal_path)
+        self._lock = threading.Lock()
+
+    def append(self, stage: str, model_name: str, row):
+        row = dict(row)
+        record = {"stage": stage, "model": model_name, "index": row["index"], "row": row}
+        line = json.dumps(record, default=to_json_value)
+        with self._lock:
+            with open(self.journal_path, 'a') as journal_file:
+                journal_file.write(line + '\n')
+                journal_file.flush()
+
+    def completed(self, stage: str, model_name: str):
+        """
+        Return the journaled rows for a stage and model, keyed by question index. A partially written last line (e.g.
+        from a crash mid-write) is skipped with a warning.
+        """
+        rows = {}
+        if not self.journal_path.exists():
+            return rows
+
+        with open(self.journal_path, 'r') as journal_file:
+            for line_number, line in enumerate(journal_file, start=1):
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    warnings.warn(f"Skipping unreadable line {line_number} in journal {self.journal_path}.")
+                    continue
+                if record["stage"] == stage and record["model"] == model_name:
+                    rows[record["index"]] = record["row"]
+
+        return rows
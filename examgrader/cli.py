@@ -0,0 +1,52 @@
+"""
+Single entry point for the ExamGrader scripts (modules of the examgrader package), installed as the `examgrader` command:
+
+    examgrader run exams/exam.jsonl configs/student.json --grading --grader_config configs/grader.json
+    examgrader students exams/exam.jsonl configs/student_a.json,configs/student_b.json
+    examgrader grade responses/<run>/exam_responses.csv configs/grader.json
+    examgrader report responses/
+    examgrader catalog list --exam exam
+    examgrader merge exams/exam.jsonl responses/<run>
+
+Each subcommand takes the same arguments as the script it runs. Only the selected script is imported, and the scripts
+import pandas, the runners and the provider SDKs only once their arguments are parsed, so `--help` and usage errors
+return without loading them.
+"""
+import importlib
+import sys
+
+# Subcommand: (module, description)
+COMMANDS = {
+    "run": ("examgrader.main", "Take an exam with a student model and optionally grade it."),
+    "students": ("examgrader.student_main", "Take an exam with several student configs side by side."),
+    "grade": ("examgrader.grader_main", "Grade exam responses with one or more grader configs."),
+    "report": ("examgrader.report", "Score and usage report over graded runs."),
+    "catalog": ("examgrader.catalog", "Index and list runs in the run catalog."),
+    "merge": ("examgrader.sharding", "Merge the parts of a sharded run into the run outputs."),
+}
+
+
+def usage() -> str:
+    width = max(len(command) for command in COMMANDS)
+    lines = [f"  {command:<{width}}  {description}" for command, (_, description) in COMMANDS.items()]
+    return "usage: examgrader <command> [arguments]\n\ncommands:\n" + "\n".join(lines) + \
+        "\n\nRun `examgrader <command> --help` for the arguments of a command."
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if not argv or argv[0] in ("-h", "--help"):
+        print(usage())
+        return
+    command, arguments = argv[0], argv[1:]
+    if command not in COMMANDS:
+        sys.exit(f"{usage()}\n\nexamgrader: unknown command '{command}'")
+
+    # argparse names the program after sys.argv[0] in usage and error messages
+    sys.argv[0] = f"examgrader {command}"
+    module = importlib.import_module(COMMANDS[command][0])
+    module.main(arguments)
+
+
+if __name__ == "__main__":
+    main()
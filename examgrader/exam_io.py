@@ -0,0 +1,322 @@
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+import ast
+import csv
+import importlib.util
+import json
+import math
+
+from examgrader.checkpoint import to_json_value
+
+OUTPUT_FORMATS = ("csv", "jsonl", "parquet")
+
+# Parquet (typed columns, column-pruned reads) when pyarrow is installed
+DEFAULT_OUTPUT_FORMAT = "parquet" if importlib.util.find_spec("pyarrow") else "csv"
+
+# Columns that need their type restored when an exam or response file is read back from CSV
+CSV_CONVERTERS = {
+    "index": int,
+    "points": float,
+    "image": ast.literal_eval,
+    "grader_sample_scores": ast.literal_eval,
+}
+
+
+def _convert_csv_row(row: Dict[str, str]) -> Dict:
+    for column, convert in CSV_CONVERTERS.items():
+        if row.get(column):
+            row[column] = convert(row[column])
+    return row
+
+
+def iter_rows(path: Path) -> Iterator[Dict]:
+    """
+    Lazily yield rows from a JSONL, CSV or Parquet exam or response file, one dict at a time.
+    """
+    path = Path(path)
+    if path.suffix == ".csv":
+        with open(path, 'r', newline='') as file:
+            for row in csv.DictReader(file):
+                yield _convert_csv_row(row)
+    elif path.suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches():
+            yield from batch.to_pylist()
+    else:
+        with open(path, 'r') as file:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def scan_columns(path: Path) -> List[str]:
+    """
+    Column names of an exam or response file in first-seen order. Reads the file once without keeping any rows,
+    so writers can emit a stable header even when some rows omit optional keys.
+    """
+    path = Path(path)
+    if path.suffix == ".csv":
+        with open(path, 'r', newline='') as file:
+            return next(csv.reader(file), [])
+    if path.suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        return pq.ParquetFile(path).schema_arrow.names
+
+    columns = {}
+    for row in iter_rows(path):
+        columns.update(dict.fromkeys(row))
+    return list(columns)
+
+
+def _clean_value(value):
+    # Missing scores are NaN floats; write them as empty/null like pandas does
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def _concrete_type(arrow_type):
+    import pyarrow as pa
+
+    if pa.types.is_null(arrow_type):
+        return pa.string()
+    if pa.types.is_list(arrow_type) and pa.types.is_null(arrow_type.value_type):
+        return pa.list_(pa.string())
+    return arrow_type
+
+
+# Parquet types of the exam and result columns, by column name or by the name after the "student_"/"grader_" prefix.
+# Other columns are inferred from their values, so dicts such as model_params are stored as structs.
+PARQUET_COLUMN_TYPES = {
+    "index": "int64", "points": "float64", "image": "list<string>",
+    "question": "string", "answer": "string", "question_type": "string",
+}
+PARQUET_RESULT_TYPES = {
+    "response": "string", "justification": "string", "parse_error": "string", "model_specified": "string",
+    "model_used": "string", "stop_reason": "string", "system_prompt": "string",
+    "response_time": "timestamp", "score": "float64", "cache_hit": "bool",
+    "samples": "int64", "sample_scores": "list<float64>", "score_median": "float64", "score_variance": "float64",
+    "prepare_seconds": "float64", "latency_seconds": "float64", "queue_seconds": "float64", "ttft_seconds": "float64",
+    "retries": "int64", "reasks": "int64", "input_tokens": "int64", "cache_read_tokens": "int64",
+    "cache_write_tokens": "int64", "history_tokens_saved": "int64", "output_tokens": "int64",
+}
+
+
+def parquet_column_type(column: str) -> Optional[str]:
+    if column in PARQUET_COLUMN_TYPES:
+        return PARQUET_COLUMN_TYPES[column]
+    role, _, name = column.partition("_")
+    return PARQUET_RESULT_TYPES.get(name) if role in ("student", "grader") else None
+
+
+def _plain(value):
+    # Values read back from Parquet through pandas come as numpy scalars/arrays and pandas Timestamps
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()} or None
+    if isinstance(value, list):
+        return [_plain(item) for item in value]
+    if hasattr(value, "tolist"):  # numpy scalars and arrays, without importing numpy
+        return _plain(value.tolist())
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def _typed_value(value, type_name: str):
+    if value is None or value == "":
+        return None
+    if type_name == "string":
+        return value if isinstance(value, str) else str(value)
+    if type_name == "int64":
+        return int(float(value))
+    if type_name == "float64":
+        return float(value)
+    if type_name == "bool":
+        return value in (True, "True", "true")
+    if type_name == "timestamp":
+        if value != value:  # NaT
+            return None
+        return value if isinstance(value, datetime) else datetime.fromisoformat(value)
+    if type_name == "list<string>":
+        return [str(item) for item in (ast.literal_eval(value) if isinstance(value, str) else value)]
+    if type_name == "list<float64>":
+        return [None if item is None else float(item) for item in (ast.literal_eval(value) if isinstance(value, str) else value)]
+    return value
+
+
+def parquet_table(rows: List[Dict], columns: List[str], schema=None):
+    """
+    Build a typed Arrow table from output rows: known columns get the types in PARQUET_COLUMN_TYPES and
+    PARQUET_RESULT_TYPES (e.g. token counts as integers, response times as timestamps), other columns are inferred,
+    falling back to JSON text for values Arrow cannot represent. With a schema (from an earlier row group), the
+    columns are converted to it instead.
+    """
+    import pyarrow as pa
+
+    arrays = []
+    for position, column in enumerate(columns):
+        type_name = parquet_column_type(column)
+        values = [_plain(row.get(column)) for row in rows]
+        if type_name is not None:
+            values = [_typed_value(value, type_name) for value in values]
+        if schema is not None:
+            arrays.append(pa.array(values, type=schema.field(position).type))
+            continue
+        if type_name is not None:
+            arrow_type = {"timestamp": pa.timestamp("us"), "list<string>": pa.list_(pa.string()),
+                          "list<float64>": pa.list_(pa.float64()),
+                          "bool": pa.bool_()}.get(type_name) or pa.type_for_alias(type_name)
+            arrays.append(pa.array(values, type=arrow_type))
+            continue
+        try:
+            array = pa.array(values)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            array = pa.array([None if value is None else json.dumps(value, default=to_json_value) for value in values])
+        arrays.append(array.cast(_concrete_type(array.type)))
+    return pa.Table.from_arrays(arrays, names=list(columns)) if schema is None else pa.Table.from_arrays(arrays, schema=schema)
+
+
+class RowWriter:
+    """
+    Write output rows one at a time to CSV, JSONL or Parquet, chosen from the file suffix. Memory use does not grow
+    with the number of rows: CSV/JSONL rows are written immediately and Parquet rows are flushed in row groups.
+
+    columns gives the leading columns in order (usually from scan_columns on the input); columns first seen in the
+    first written row are appended after them.
+    """
+
+    def __init__(self, path: Path, columns: List[str] = None, row_group_size: int = 1000):
+        self.path = Path(path)
+        self.format = self.path.suffix[1:]
+        if self.format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unsupported output format '{self.path.suffix}'. Expected one of {OUTPUT_FORMATS}.")
+        self.columns = list(columns or [])
+        self.row_group_size = row_group_size
+        self.rows_written = 0
+        self._file = None
+        self._csv_writer = None
+        self._parquet_writer = None
+        self._buffer = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _open(self, row):
+        self.columns += [column for column in row if column not in self.columns]
+        if self.format == "csv":
+            self._file = open(self.path, 'w', newline='')
+            self._csv_writer = csv.DictWriter(self._file, fieldnames=self.columns, restval="", extrasaction='ignore')
+            self._csv_writer.writeheader()
+        elif self.format == "jsonl":
+            self._file = open(self.path, 'w')
+
+    def write(self, row):
+        row = {column: _clean_value(value) for column, value in dict(row).items()}
+        if self.rows_written == 0 and not self._buffer:
+            self._open(row)
+
+        if self.format == "csv":
+            self._csv_writer.writerow(row)
+        elif self.format == "jsonl":
+            self._file.write(json.dumps(row, default=to_json_value) + '\n')
+        else:
+            self._buffer.append(row)
+            if len(self._buffer) >= self.row_group_size:
+                self._flush_parquet()
+        self.rows_written += 1
+
+    def _flush_parquet(self):
+        import pyarrow.parquet as pq
+
+        if not self._buffer:
+            return
+        if self._parquet_writer is None:
+            # Columns (or list items, e.g. image paths) that are empty in the first row group default to text rather
+            # than the untyped null type
+            table = parquet_table(self._buffer, self.columns)
+            self._parquet_writer = pq.ParquetWriter(self.path, table.schema)
+        else:
+            table = parquet_table(self._buffer, self.columns, self._parquet_writer.schema)
+        self._parquet_writer.write_table(table)
+        self._buffer = []
+
+    def close(self):
+        if self.format == "parquet":
+            self._flush_parquet()
+            if self._parquet_writer is not None:
+                self._parquet_writer.close()
+        elif self._file is not None:
+            self._file.close()
+
+
+def write_frame(df, path: Path):
+    """
+    Write a complete output DataFrame in the format given by the file suffix.
+    """
+    path = Path(path)
+    if path.suffix == ".jsonl":
+        df.to_json(path, orient="records", lines=True)
+    elif path.suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        pq.write_table(parquet_table(df.to_dict('records'), list(df.columns)), path)
+    else:
+        df.to_csv(path, index=False)
+
+
+class FrameWriter:
+    """
+    Same interface as RowWriter, but collects the rows and writes them with write_frame on close, so row-by-row
+    producers (such as the pipelined runner) give exactly the output of the DataFrame code path.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, row):
+        self.rows.append(dict(row))
+
+    def close(self):
+        import pandas as pd
+
+        write_frame(pd.DataFrame(self.rows), self.path)
+
+
+def read_frame(path: Path, columns: Optional[List[str]] = None):
+    """
+    Read an exam or response file into a DataFrame, restoring the image column to lists for CSV input. columns
+    restricts the result to those columns; for Parquet only they are read from disk.
+    """
+    import pandas as pd
+
+    path = Path(path)
+    if path.suffix == ".csv":
+        df = pd.read_csv(path, usecols=columns)
+        if 'image' in df.columns:
+            df['image'] = df['image'].apply(lambda x: ast.literal_eval(x))  # interpret image col as list
+        if 'grader_sample_scores' in df.columns:
+            df['grader_sample_scores'] = df['grader_sample_scores'].apply(
+                lambda x: ast.literal_eval(x) if isinstance(x, str) else None)
+        return df
+    if path.suffix == ".parquet":
+        df = pd.read_parquet(path, columns=columns)
+        if 'image' in df.columns:
+            df['image'] = df['image'].apply(lambda x: [] if x is None else list(x))  # numpy arrays to lists
+        if 'grader_sample_scores' in df.columns:
+            df['grader_sample_scores'] = df['grader_sample_scores'].apply(lambda x: None if x is None else _plain(x))
+        return df
+    df = pd.read_json(path, lines=True)
+    return df if columns is None else df[columns]
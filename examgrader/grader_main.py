@@ -0,0 +1,171 @@
+import argparse
+from datetime import datetime
+import time
+from examgrader.utils import *
+from examgrader.catalog import DEFAULT_CATALOG_PATH, RunCatalog
+from examgrader.exam_io import DEFAULT_OUTPUT_FORMAT, OUTPUT_FORMATS, RowWriter, iter_rows, read_frame, scan_columns, write_frame
+from examgrader.models.image_cache import image_cache
+from examgrader.checkpoint import RunJournal
+from examgrader.models.response_cache import ResponseCache
+import shutil
+import sys
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("exam_path", type=Path, help="Filepath to the student exam responses (CSV, JSONL or Parquet).")
+    parser.add_argument("grader_config", type=Path, nargs="+",
+                        help="Filepath(s) to grader model configs (JSON). Several configs grade the exam as an ensemble.")
+    parser.add_argument("--output_path", type=Path,
+                        help="Directory to save the processed exams. If not provided, defaults to the exam name with a timestamp.")
+    parser.add_argument("--verbose", action='store_true', help="Enable verbose output.", default=False)
+    parser.add_argument("--log_config", action='store_true', help="Log model configurations to output .csv and .jsonl files", default=False)
+    parser.add_argument("--resume", type=Path,
+                        help="Output directory of an interrupted run to resume. Rows already recorded in its journal are skipped.")
+    parser.add_argument("--image_cache_dir", type=Path,
+                        help="Directory for an on-disk store of encoded images, reused across runs. Images are always cached in memory within a run.")
+    parser.add_argument("--cache", choices=ResponseCache.modes, default="off",
+                        help="Response cache mode: 'read' reuses cached responses for identical requests and stores new ones, "
+                             "'write' always calls the API and refreshes the cache, 'off' disables caching.")
+    parser.add_argument("--cache_path", type=Path, default=Path('.cache') / 'responses.sqlite',
+                        help="SQLite file for the response cache.")
+    parser.add_argument("--cache_max_mb", type=int, default=1024,
+                        help="Maximum size of cached responses in MB; least recently used entries are evicted.")
+    parser.add_argument("--batch", action='store_true', default=False,
+                        help="Grade through the provider batch API: all questions are submitted at once, each graded without grading history.")
+    parser.add_argument("--batch_poll_interval", type=float, default=30,
+                        help="Seconds between batch status checks when --batch is enabled.")
+    parser.add_argument("--stream", action='store_true', default=False,
+                        help="Read questions lazily and write each output row as soon as it is ready, without building "
+                             "DataFrames. Memory stays flat with --concurrency > 1 or a stateless context.")
+    parser.add_argument("--output_format", choices=OUTPUT_FORMATS, default=DEFAULT_OUTPUT_FORMAT,
+                        help="File format of the output files.")
+    parser.add_argument("--catalog", type=Path, default=DEFAULT_CATALOG_PATH,
+                        help="Run catalog (SQLite) to which the outputs of this run are added.")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="Number of questions to grade in parallel. Values above 1 grade each question "
+                             "independently, without grading history.")
+    parser.add_argument("--stream_responses", action='store_true', default=False,
+                        help="Stream model responses token by token: records time to first token and stops reading each "
+                             "response as soon as the grading JSON is complete. Not used for --batch requests.")
+    parser.add_argument("--rule_grading", action='store_true', default=False,
+                        help="Grade true/false and multiple-choice questions whose chosen option can be read from the "
+                             "student response against the answer key, without a grader request. Other questions are "
+                             "sent to the grader model. Not available with --stream.")
+    parser.add_argument("--samples", type=int,
+                        help="Grades to sample per question from each grader config that does not set \"samples\" "
+                             "itself. Scores are aggregated to their mean, median and variance.")
+
+    args = parser.parse_args(argv)
+
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1.")
+
+    if args.samples is not None and args.samples < 1:
+        parser.error("--samples must be at least 1.")
+
+    if args.stream and args.batch:
+        parser.error("--batch needs every question up front and cannot be combined with --stream.")
+
+    if args.stream and args.rule_grading:
+        parser.error("--rule_grading grades the whole exam at once and cannot be combined with --stream.")
+
+    # Resuming writes back into the interrupted run's output directory
+    if args.resume is not None:
+        if args.output_path is not None and args.output_path != args.resume:
+            parser.error("--output_path and --resume must refer to the same directory.")
+        args.output_path = args.resume
+
+    # Set default output_path after parsing if it wasn't explicitly provided
+    if args.output_path is None:
+        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        # Construct the default output_path based on exam_path and timestamp
+        default_output_name = args.exam_path.stem + f"_output_{timestamp}"
+        args.output_path = Path('responses') / default_output_name
+
+    return args
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+
+    # The runners (and pandas) are only needed past argument parsing
+    from examgrader.runners import (ensemble_scores, grader_grade_ensemble, grader_grade_exam, grader_grade_exam_batch,
+                         grader_grade_exam_streaming)
+    from examgrader.metrics import StageMetrics
+
+    # Make output directory; save student and grader config
+    args.output_path.mkdir(parents=True, exist_ok=args.resume is not None)
+    journal = RunJournal(args.output_path / 'journal.jsonl')
+
+    if args.image_cache_dir:
+        image_cache.configure(sidecar_dir=args.image_cache_dir)
+
+    response_cache = ResponseCache(args.cache_path, args.cache_max_mb * 1024 ** 2) if args.cache != "off" else None
+
+    # Load grader models
+    GRADER_CONFIGS = [load_config(grader_config_path) for grader_config_path in args.grader_config]
+    grader_models = []
+    for GRADER_CONFIG in GRADER_CONFIGS:
+        if args.samples is not None:
+            GRADER_CONFIG.setdefault("samples", args.samples)
+        grader_model = model_factory(GRADER_CONFIG)
+        grader_model.use_response_cache(response_cache, args.cache)
+        grader_model.stream_responses = args.stream_responses
+        grader_models.append(grader_model)
+
+    ensemble = len(grader_models) > 1 or grader_models[0].samples > 1
+    if ensemble and (args.stream or args.batch):
+        sys.exit("Grader ensembles (several grader configs or samples) cannot be combined with --stream or --batch.")
+
+    # With several grader configs, each gets its own output, config copy, journal and metadata entry, named after it
+    if len(grader_models) > 1:
+        names = [grader_config_path.stem for grader_config_path in args.grader_config]
+        output_paths = [args.output_path / f'graded_exam_{name}.{args.output_format}' for name in names]
+        journals = [RunJournal(args.output_path / f'journal_{name}.jsonl') for name in names]
+    else:
+        names = ["grader"]
+        output_paths = [args.output_path / f'graded_exam.{args.output_format}']
+        journals = [journal]
+    for grader_config_path, name in zip(args.grader_config, names):
+        shutil.copy(grader_config_path, args.output_path / f'{name}.json')
+
+    started = time.perf_counter()
+    if args.stream:
+        with RowWriter(output_paths[0], scan_columns(args.exam_path)) as writer:
+            grader_metrics = [grader_grade_exam_streaming(iter_rows(args.exam_path), grader_model, writer, args.verbose,
+                                                          args.concurrency, journal)]
+    else:
+        # Load exam responses (CSV, JSONL or Parquet output of the student run)
+        df_exam = read_frame(args.exam_path)
+        if ensemble:
+            df_graded_exams = grader_grade_ensemble(df_exam, grader_models, args.verbose, args.concurrency, journals,
+                                                    rule_grading=args.rule_grading)
+        elif args.batch:
+            df_graded_exams = [grader_grade_exam_batch(df_exam, grader_model, args.verbose, journal, args.batch_poll_interval,
+                                                       rule_grading=args.rule_grading)]
+        else:
+            df_graded_exams = [grader_grade_exam(df_exam, grader_model, args.verbose, args.concurrency, journal,
+                                                 rule_grading=args.rule_grading)]
+        for df_graded_exam, output_path in zip(df_graded_exams, output_paths):
+            write_frame(df_graded_exam, output_path)
+        if len(df_graded_exams) > 1:
+            write_frame(ensemble_scores(df_graded_exams), args.output_path / f'ensemble_scores.{args.output_format}')
+        grader_metrics = [StageMetrics.from_frame(df_graded_exam, "grader", grader_model)
+                          for df_graded_exam, grader_model in zip(df_graded_exams, grader_models)]
+    # Graders of an ensemble share its wall-clock time
+    grader_seconds = time.perf_counter() - started
+
+    grader_summaries = [metrics.summary(grader_seconds) for metrics in grader_metrics]
+    save_json({name: metrics.usage() for name, metrics in zip(names, grader_metrics)},
+              args.output_path / 'run_metadata.json')
+    save_json(dict(zip(names, grader_summaries)), args.output_path / 'run_metrics.json')
+
+    catalog = RunCatalog(args.catalog)
+    exam = catalog.exam_of(args.exam_path)
+    for output_path, GRADER_CONFIG, grader_summary in zip(output_paths, GRADER_CONFIGS, grader_summaries):
+        catalog.record(output_path, exam, "grader", GRADER_CONFIG, grader_summary)
+    catalog.close()
+
+
+if __name__ == "__main__":
+    main()
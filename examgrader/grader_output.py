@@ -0,0 +1,122 @@
+from typing import Optional, Tuple
+import json
+import math
+import re
+
+from examgrader.models.base_model import GRADER_OUTPUT_SCHEMA
+
+GRADER_KEYS = tuple(GRADER_OUTPUT_SCHEMA["required"])
+
+_FENCED_BLOCK = re.compile(r"```[a-zA-Z]*\s*(.*?)```", re.DOTALL)
+
+
+class GraderOutputError(ValueError):
+    """
+    Grader response without a usable grade. The message says what was wrong; it is recorded in grader_parse_error and
+    sent back to the grader when the row is re-asked.
+    """
+
+
+def _loads_object(text: str) -> Optional[dict]:
+    try:
+        value = json.loads(text)
+    except json.JSONDecodeError:
+        return None
+    return value if isinstance(value, dict) else None
+
+
+def _object_end(text: str, start: int) -> Optional[int]:
+    """
+    Position just after the brace closing the object that opens at text[start], or None if it is not closed yet.
+    """
+    depth, in_string, escaped = 0, False, False
+    for position in range(start, len(text)):
+        char = text[position]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return position + 1
+    return None
+
+
+def extract_json_object(text: Optional[str]) -> Optional[dict]:
+    """
+    First JSON object in a model response: the whole response, the contents of a fenced code block, or the first
+    balanced {...} that parses, in that order. Returns None if the response holds no complete object (yet), so it can
+    also be applied to a partially streamed response.
+    """
+    text = (text or "").strip()
+    if text.startswith("{"):
+        value = _loads_object(text)
+        if value is not None:
+            return value
+
+    if "```" in text:
+        for block in _FENCED_BLOCK.findall(text):
+            value = _loads_object(block.strip())
+            if value is not None:
+                return value
+
+    start = text.find("{")
+    while start >= 0:
+        end = _object_end(text, start)
+        if end is None:
+            return None
+        value = _loads_object(text[start:end])
+        if value is not None:
+            return value
+        start = text.find("{", start + 1)
+    return None
+
+
+def _points_available(points) -> Optional[float]:
+    try:
+        points = float(points)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(points) else points
+
+
+def parse_grader_output(text: Optional[str], points=None) -> Tuple[float, str]:
+    """
+    Extract and validate the grade in a grader response. Returns (grader_score, grader_justification); raises
+    GraderOutputError if there is no grading JSON, a key is missing, or the score is not a number between 0 and the
+    points available for the question.
+    """
+    grade = extract_json_object(text)
+    if grade is None:
+        raise GraderOutputError("no JSON object found in the response")
+
+    missing = [key for key in GRADER_KEYS if key not in grade]
+    if missing:
+        raise GraderOutputError(f"missing key(s) {', '.join(repr(key) for key in missing)}")
+
+    score = grade["grader_score"]
+    if isinstance(score, str):
+        try:
+            score = float(score.strip())
+        except ValueError:
+            raise GraderOutputError(f"grader_score {score!r} is not a number") from None
+    if isinstance(score, bool) or not isinstance(score, (int, float)) or math.isnan(score):
+        raise GraderOutputError(f"grader_score {score!r} is not a number")
+    if score < 0:
+        raise GraderOutputError(f"grader_score {score} is negative")
+    points = _points_available(points)
+    if points is not None and score > points:
+        raise GraderOutputError(f"grader_score {score} exceeds the {points:g} points available")
+
+    justification = grade["grader_justification"]
+    if not isinstance(justification, str):
+        justification = json.dumps(justification)
+    return score, justification
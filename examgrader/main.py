@@ -0,0 +1,287 @@
+import argparse
+from datetime import datetime
+import time
+from examgrader.utils import *
+from examgrader.catalog import DEFAULT_CATALOG_PATH, RunCatalog
+from examgrader.exam_io import DEFAULT_OUTPUT_FORMAT, OUTPUT_FORMATS, FrameWriter, RowWriter, iter_rows, scan_columns, write_frame
+from examgrader.models.image_cache import image_cache
+from examgrader.checkpoint import RunJournal
+from examgrader.models.response_cache import ResponseCache
+from examgrader.sharding import claim_merge, merge_parts, parse_shard, run_queue_worker, run_shard
+import shutil
+import sys
+import warnings
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("exam_path", type=Path, help="Filepath to the input exam (JSONL).")
+    parser.add_argument("student_config", type=Path, help="Filepath to student config (JSON)")
+    parser.add_argument("--output_path", type=Path,
+                        help="Directory to save the processed exams. If not provided, defaults to the exam name with a timestamp.")
+    parser.add_argument("--verbose", action='store_true', help="Enable verbose output.", default=False)
+    parser.add_argument("--log_config", action='store_true', help="Log model configurations to output .csv and .jsonl files", default=False)
+    parser.add_argument("--grading", action='store_true', help="Enable automated model grading of the responses.", default=False)
+    parser.add_argument("--grader_config", type=Path,
+                        help="Filepath to the grader model config (JSON), required if grading is enabled.")
+    parser.add_argument("--resume", type=Path,
+                        help="Output directory of an interrupted run to resume. Rows already recorded in its journal are skipped.")
+    parser.add_argument("--image_cache_dir", type=Path,
+                        help="Directory for an on-disk store of encoded images, reused across runs. Images are always cached in memory within a run.")
+    parser.add_argument("--cache", choices=ResponseCache.modes, default="off",
+                        help="Response cache mode: 'read' reuses cached responses for identical requests and stores new ones, "
+                             "'write' always calls the API and refreshes the cache, 'off' disables caching.")
+    parser.add_argument("--cache_path", type=Path, default=Path('.cache') / 'responses.sqlite',
+                        help="SQLite file for the response cache.")
+    parser.add_argument("--cache_max_mb", type=int, default=1024,
+                        help="Maximum size of cached responses in MB; least recently used entries are evicted.")
+    parser.add_argument("--batch", action='store_true', default=False,
+                        help="Grade through the provider batch API: all questions are submitted at once, each graded without grading history.")
+    parser.add_argument("--batch_poll_interval", type=float, default=30,
+                        help="Seconds between batch status checks when --batch is enabled.")
+    parser.add_argument("--stream", action='store_true', default=False,
+                        help="Read questions lazily and write each output row as soon as it is ready, without building "
+                             "DataFrames. Memory stays flat with --concurrency > 1 or a stateless context.")
+    parser.add_argument("--output_format", choices=OUTPUT_FORMATS, default=DEFAULT_OUTPUT_FORMAT,
+                        help="File format of the exam response and graded exam outputs.")
+    parser.add_argument("--catalog", type=Path, default=DEFAULT_CATALOG_PATH,
+                        help="Run catalog (SQLite) to which the outputs of this run are added.")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="Number of questions to send to the model APIs in parallel. Values above 1 dispatch "
+                             "questions independently, without conversation history.")
+    parser.add_argument("--student_concurrency", type=int,
+                        help="Number of questions to send to the student model in parallel. Defaults to --concurrency.")
+    parser.add_argument("--grader_concurrency", type=int,
+                        help="Number of questions to send to the grader model in parallel. Defaults to --concurrency.")
+    parser.add_argument("--pipeline", action='store_true', default=False,
+                        help="Grade each student answer as soon as it is ready instead of after the whole student pass. "
+                             "Requires --grading; output files are the same as without --pipeline.")
+    parser.add_argument("--rule_grading", action='store_true', default=False,
+                        help="Grade true/false and multiple-choice questions whose chosen option can be read from the "
+                             "student response against the answer key, without a grader request. Other questions are "
+                             "sent to the grader model. Not available with --stream or --pipeline.")
+    parser.add_argument("--stream_responses", action='store_true', default=False,
+                        help="Stream model responses token by token: records time to first token, stops reading grader responses "
+                             "as soon as the grading JSON is complete and, with --verbose, prints student answers as they arrive.")
+    parser.add_argument("--shard", type=parse_shard,
+                        help="Run only shard i of N (e.g. 0/4) of the exam, split into contiguous ranges of questions. "
+                             "Start one process per shard with the same --output_path; the last one to finish merges "
+                             "the outputs. A \"full\" or \"window\" context resets its history at each shard boundary, "
+                             "and rate limits apply per process, so N shards send up to N times the configured rates.")
+    parser.add_argument("--queue", action='store_true', default=False,
+                        help="Run as a worker of the work queue in --output_path: claim chunks of questions until the "
+                             "exam is done. Any number of workers (on hosts sharing the directory) can join; the last "
+                             "one to finish merges the outputs. A \"full\" or \"window\" context resets its history "
+                             "at each chunk, and rate limits apply per worker, so N workers send up to N times the "
+                             "configured rates.")
+    parser.add_argument("--chunk_size", type=int, default=25,
+                        help="Questions per work-queue chunk when --queue is enabled.")
+    parser.add_argument("--lease_seconds", type=float, default=3600,
+                        help="Seconds after which a claimed chunk whose worker has not finished it is handed to "
+                             "another worker when --queue is enabled.")
+
+    args = parser.parse_args(argv)
+
+    # Check if grading is enabled but grader_config is not provided
+    if args.grading and args.grader_config is None:
+        parser.error("--grader_config is required when --grading is enabled.")
+
+    # Each stage defaults to the shared --concurrency
+    if args.student_concurrency is None:
+        args.student_concurrency = args.concurrency
+    if args.grader_concurrency is None:
+        args.grader_concurrency = args.concurrency
+
+    if min(args.concurrency, args.student_concurrency, args.grader_concurrency) < 1:
+        parser.error("--concurrency, --student_concurrency and --grader_concurrency must be at least 1.")
+
+    if args.pipeline and not args.grading:
+        parser.error("--pipeline requires --grading.")
+
+    if args.pipeline and args.batch:
+        parser.error("--batch grades all questions after the student pass and cannot be combined with --pipeline.")
+
+    if args.stream and args.batch:
+        parser.error("--batch needs every question up front and cannot be combined with --stream.")
+
+    if args.rule_grading and (args.stream or args.pipeline or not args.grading):
+        parser.error("--rule_grading requires --grading and cannot be combined with --stream or --pipeline.")
+
+    if args.shard is not None or args.queue:
+        if args.shard is not None and args.queue:
+            parser.error("--shard and --queue cannot be combined.")
+        if args.stream or args.pipeline:
+            parser.error("--shard and --queue cannot be combined with --stream or --pipeline.")
+        if args.output_path is None and args.resume is None:
+            parser.error("--shard and --queue require --output_path, shared by every shard or worker of the run.")
+        if args.chunk_size < 1:
+            parser.error("--chunk_size must be at least 1.")
+
+    # Resuming writes back into the interrupted run's output directory
+    if args.resume is not None:
+        if args.output_path is not None and args.output_path != args.resume:
+            parser.error("--output_path and --resume must refer to the same directory.")
+        args.output_path = args.resume
+
+    # Set default output_path after parsing if it wasn't explicitly provided
+    if args.output_path is None:
+        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        # Construct the default output_path based on exam_path and timestamp
+        default_output_name = args.exam_path.stem + f"_output_{timestamp}"
+        args.output_path = Path('responses') / default_output_name
+
+    return args
+
+def main(argv=None):
+    args = parse_arguments(argv)
+
+    # Heavy dependencies are imported after argument parsing so that --help and usage errors return immediately
+    import pandas as pd
+    from examgrader.runners import (student_take_exam, student_take_exam_streaming, grader_grade_ensemble, grader_grade_exam,
+                         grader_grade_exam_batch, grader_grade_exam_streaming, pipeline_exam)
+    from examgrader.metrics import StageMetrics
+
+    # Make output directory; save student and grader config. The shards and workers of a sharded run share it.
+    sharded = args.shard is not None or args.queue
+    args.output_path.mkdir(parents=True, exist_ok=args.resume is not None or sharded)
+    journal = RunJournal(args.output_path / 'journal.jsonl')
+
+    if args.image_cache_dir:
+        image_cache.configure(sidecar_dir=args.image_cache_dir)
+
+    response_cache = ResponseCache(args.cache_path, args.cache_max_mb * 1024 ** 2) if args.cache != "off" else None
+
+    # Load student model
+    STUDENT_CONFIG = load_config(args.student_config)
+    student_model = model_factory(STUDENT_CONFIG)
+    student_model.use_response_cache(response_cache, args.cache)
+    student_model.stream_responses = args.stream_responses
+    shutil.copy(args.student_config, args.output_path / 'student.json')
+
+    if args.grading:
+        # Load grader model
+        GRADER_CONFIG = load_config(args.grader_config)
+        grader_model = model_factory(GRADER_CONFIG)
+        grader_model.use_response_cache(response_cache, args.cache)
+        grader_model.stream_responses = args.stream_responses
+        if grader_model.samples > 1 and (args.stream or args.pipeline or args.batch):
+            sys.exit("Grader configs with several samples per question cannot be combined with --stream, --pipeline "
+                     "or --batch.")
+        shutil.copy(args.grader_config, args.output_path / 'grader.json')
+
+    df_exam_responses_output_path = args.output_path / f'exam_responses.{args.output_format}'
+    df_graded_exam_output_path = args.output_path / f'graded_exam.{args.output_format}'
+
+    def grade_exam_responses(df_exam_responses, journal):
+        if args.batch:
+            return grader_grade_exam_batch(df_exam_responses, grader_model, args.verbose, journal, args.batch_poll_interval,
+                                           rule_grading=args.rule_grading)
+        if grader_model.samples > 1:
+            return grader_grade_ensemble(df_exam_responses, [grader_model], args.verbose, args.grader_concurrency,
+                                         [journal], rule_grading=args.rule_grading)[0]
+        return grader_grade_exam(df_exam_responses, grader_model, args.verbose, args.grader_concurrency, journal,
+                                 rule_grading=args.rule_grading)
+
+    if sharded:
+        def take_exam(df_exam, journal):
+            df_exam_responses = student_take_exam(df_exam, student_model, args.verbose, args.student_concurrency, journal)
+            if not args.grading:
+                return {"student": df_exam_responses}
+            return {"student": df_exam_responses, "grader": grade_exam_responses(df_exam_responses, journal)}
+
+        # Serial runs replay the history of a "full" or "window" context, which only covers the current shard or chunk
+        replays_history = [role for role, model, concurrency in
+                           [("student", student_model, args.student_concurrency)] +
+                           ([("grader", grader_model, args.grader_concurrency)]
+                            if args.grading and not args.batch and grader_model.samples == 1 else [])
+                           if concurrency == 1 and model.context.mode != "stateless"]
+        if replays_history:
+            warnings.warn(f"The {' and '.join(replays_history)} conversation history resets at each "
+                          f"{'chunk' if args.queue else 'shard'}, so answers can differ from an unsharded run. Use a "
+                          f"\"stateless\" context to match it.")
+
+        df_exam = pd.read_json(args.exam_path, lines=True)
+        if args.queue:
+            complete = run_queue_worker(args.output_path, df_exam, take_exam, args.output_format, args.chunk_size,
+                                        args.lease_seconds)
+        else:
+            complete = run_shard(args.output_path, df_exam, *args.shard, take_exam, args.output_format)
+
+        # Only one of the processes finishing last merges the parts
+        if not complete or not claim_merge(args.output_path):
+            print(f"Done; the last shard or worker of {args.output_path} to finish merges the outputs.")
+            return
+        models = {"student": student_model, "grader": grader_model if args.grading else None}
+        merged = merge_parts(args.output_path, df_exam["index"].tolist(), args.output_format, models)
+        configs = {"student": STUDENT_CONFIG, "grader": GRADER_CONFIG if args.grading else None}
+        catalog = RunCatalog(args.catalog)
+        for stage, (output_file, summary) in merged.items():
+            catalog.record(output_file, args.exam_path.stem, stage, configs[stage], summary)
+        catalog.close()
+        return
+
+    if args.pipeline:
+        if args.stream:
+            questions = iter_rows(args.exam_path)
+            student_writer = RowWriter(df_exam_responses_output_path, scan_columns(args.exam_path))
+            grader_writer = RowWriter(df_graded_exam_output_path, scan_columns(args.exam_path))
+        else:
+            questions = pd.read_json(args.exam_path, lines=True).to_dict('records')
+            student_writer = FrameWriter(df_exam_responses_output_path)
+            grader_writer = FrameWriter(df_graded_exam_output_path)
+        started = time.perf_counter()
+        with student_writer, grader_writer:
+            student_metrics, grader_metrics = pipeline_exam(questions, student_model, grader_model, student_writer,
+                                                            grader_writer, args.verbose, args.student_concurrency,
+                                                            args.grader_concurrency, journal)
+        # Both stages run over the same wall-clock interval
+        student_seconds = grader_seconds = time.perf_counter() - started
+    else:
+        started = time.perf_counter()
+        if args.stream:
+            with RowWriter(df_exam_responses_output_path, scan_columns(args.exam_path)) as writer:
+                student_metrics = student_take_exam_streaming(iter_rows(args.exam_path), student_model, writer, args.verbose,
+                                                              args.student_concurrency, journal)
+        else:
+            # Load exam
+            df_exam = pd.read_json(args.exam_path, lines=True)
+            df_exam_responses = student_take_exam(df_exam, student_model, args.verbose, args.student_concurrency, journal)
+            write_frame(df_exam_responses, df_exam_responses_output_path)
+            student_metrics = StageMetrics.from_frame(df_exam_responses, "student", student_model)
+        student_seconds = time.perf_counter() - started
+
+        if args.grading:
+            started = time.perf_counter()
+            if args.stream:
+                # Grade from the student output on disk so no stage holds the whole exam in memory
+                with RowWriter(df_graded_exam_output_path, scan_columns(df_exam_responses_output_path)) as writer:
+                    grader_metrics = grader_grade_exam_streaming(iter_rows(df_exam_responses_output_path), grader_model,
+                                                                 writer, args.verbose, args.grader_concurrency, journal)
+            else:
+                df_graded_exam = grade_exam_responses(df_exam_responses, journal)
+                write_frame(df_graded_exam, df_graded_exam_output_path)
+                grader_metrics = StageMetrics.from_frame(df_graded_exam, "grader", grader_model)
+            grader_seconds = time.perf_counter() - started
+
+    run_metadata = {"student": student_metrics.usage()}
+    run_metrics = {"student": student_metrics.summary(student_seconds)}
+    if args.grading:
+        run_metadata["grader"] = grader_metrics.usage()
+        run_metrics["grader"] = grader_metrics.summary(grader_seconds)
+    save_json(run_metrics, args.output_path / 'run_metrics.json')
+    save_json(run_metadata, args.output_path / 'run_metadata.json')
+
+    catalog = RunCatalog(args.catalog)
+    catalog.record(df_exam_responses_output_path, args.exam_path.stem, "student", STUDENT_CONFIG, run_metrics["student"])
+    if args.grading:
+        catalog.record(df_graded_exam_output_path, args.exam_path.stem, "grader", GRADER_CONFIG, run_metrics["grader"])
+    catalog.close()
+
+
+    # if args.log_config:
+    #     df_out["student_config"] = STUDENT_CONFIG
+    #     df_out["grader_config"] = GRADER_CONFIG
+    #     # todo finish implementing / conceptualizing log config. Idea is that we log config info to all df rows
+
+
+if __name__ == "__main__":
+    main()
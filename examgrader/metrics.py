@@ -0,0 +1,144 @@
+from typing import Dict, List, Optional
+import math
+
+import numpy as np
+
+from examgrader.rule_grading import RULE_GRADER
+
+# Per-row timing columns recorded by the runners for each role (prefixed with "student_" or "grader_")
+TIMING_COLUMNS = ("prepare_seconds", "latency_seconds", "queue_seconds", "ttft_seconds")
+
+TOKENS_PER_MILLION = 1_000_000
+
+
+def _number(value) -> Optional[float]:
+    if value is None or isinstance(value, str):
+        return None
+    value = float(value)
+    return None if math.isnan(value) else value
+
+
+def distribution(values: List[float]) -> Optional[Dict]:
+    """
+    Mean, total and percentiles of a list of per-row timings, or None if no row recorded the timing.
+    """
+    if not values:
+        return None
+    values = np.asarray(values, dtype=float)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"mean": float(values.mean()), "p50": float(p50), "p95": float(p95), "p99": float(p99),
+            "max": float(values.max()), "total": float(values.sum())}
+
+
+def estimate_cost(pricing: Optional[Dict], input_tokens: int, output_tokens: int, cache_read_tokens: int = 0,
+                  cache_write_tokens: int = 0, input_includes_cached_tokens: bool = False) -> Optional[float]:
+    """
+    Estimated cost in USD from a pricing entry of models/model_library.json, given in USD per million tokens for
+    "input" and "output" and optionally "cache_read" and "cache_write" (which default to the input price).
+    """
+    if not pricing:
+        return None
+    if input_includes_cached_tokens:
+        input_tokens -= cache_read_tokens
+    cost = (input_tokens * pricing["input"]
+            + cache_read_tokens * pricing.get("cache_read", pricing["input"])
+            + cache_write_tokens * pricing.get("cache_write", pricing["input"])
+            + output_tokens * pricing["output"])
+    return cost / TOKENS_PER_MILLION
+
+
+class StageMetrics:
+    """
+    Token usage, timings and cost of one stage (student or grader) of a run, accumulated row by row so that streamed
+    runs never need a DataFrame. usage() gives the token totals stored in run_metadata.json; summary() the throughput,
+    latency percentiles, tokens/sec and cost stored in run_metrics.json.
+
+    Rows served from the response cache are counted but not billed.
+    """
+
+    def __init__(self, prefix: str, model=None):
+        self.prefix = prefix
+        self.model = model.model_name if model is not None else None
+        self.pricing = getattr(model, "pricing", None)
+        self.input_includes_cached_tokens = getattr(model, "input_includes_cached_tokens", False)
+        self.questions = 0
+        self.input_tokens = 0
+        self.cache_read_tokens = 0
+        self.cache_write_tokens = 0
+        self.output_tokens = 0
+        self.history_tokens_saved = 0
+        self.retries = 0
+        self.reasks = 0
+        self.parse_failures = 0
+        self.cache_hits = 0
+        self.rule_graded = 0
+        self.billed = {"input_tokens": 0, "output_tokens": 0, "cache_read_tokens": 0, "cache_write_tokens": 0}
+        self.timings = {column: [] for column in TIMING_COLUMNS}
+
+    @classmethod
+    def from_frame(cls, df, prefix: str, model=None) -> "StageMetrics":
+        metrics = cls(prefix, model)
+        for row in df.to_dict('records'):
+            metrics.add(row)
+        return metrics
+
+    def add(self, row):
+        prefix = self.prefix
+        self.model = self.model or row.get(f"{prefix}_model_specified")
+        self.questions += 1
+
+        tokens = {name: int(_number(row.get(f"{prefix}_{name}")) or 0) for name in self.billed}
+        self.input_tokens += tokens["input_tokens"]
+        self.output_tokens += tokens["output_tokens"]
+        self.cache_read_tokens += tokens["cache_read_tokens"]
+        self.cache_write_tokens += tokens["cache_write_tokens"]
+        self.history_tokens_saved += int(_number(row.get(f"{prefix}_history_tokens_saved")) or 0)
+        self.retries += int(_number(row.get(f"{prefix}_retries")) or 0)
+        self.reasks += int(_number(row.get(f"{prefix}_reasks")) or 0)
+        if isinstance(row.get(f"{prefix}_parse_error"), str):
+            self.parse_failures += 1
+        if row.get(f"{prefix}_model_used") == RULE_GRADER:
+            self.rule_graded += 1
+
+        if row.get(f"{prefix}_cache_hit") in (True, "True"):
+            self.cache_hits += 1
+        else:
+            for name, count in tokens.items():
+                self.billed[name] += count
+
+        for column in TIMING_COLUMNS:
+            value = _number(row.get(f"{prefix}_{column}"))
+            if value is not None:
+                self.timings[column].append(value)
+
+    def usage(self) -> Dict:
+        """
+        Per-run token totals. history_tokens_saved is the estimated number of input tokens not sent because of
+        context-window truncation; cache_read_tokens and cache_write_tokens are the input tokens served from and
+        written to the provider's prompt cache.
+        """
+        return {"model": self.model, "questions": self.questions, "input_tokens": self.input_tokens,
+                "cache_read_tokens": self.cache_read_tokens, "cache_write_tokens": self.cache_write_tokens,
+                "output_tokens": self.output_tokens, "history_tokens_saved": self.history_tokens_saved}
+
+    def summary(self, wall_seconds: Optional[float] = None) -> Dict:
+        """
+        Throughput and latency summary for the stage. wall_seconds is the stage's elapsed wall-clock time (for a
+        pipelined run, the time of the whole pipeline).
+        """
+        request_seconds = sum(self.timings["latency_seconds"])
+        return {
+            **self.usage(),
+            "wall_seconds": wall_seconds,
+            "questions_per_second": self.questions / wall_seconds if wall_seconds else None,
+            "tokens_per_second": (self.input_tokens + self.output_tokens) / wall_seconds if wall_seconds else None,
+            "output_tokens_per_request_second": self.output_tokens / request_seconds if request_seconds else None,
+            "retries": self.retries,
+            "reasks": self.reasks,
+            "parse_failures": self.parse_failures,
+            "response_cache_hits": self.cache_hits,
+            "rule_graded": self.rule_graded,
+            **{column: distribution(values) for column, values in self.timings.items()},
+            "estimated_cost_usd": estimate_cost(self.pricing, **self.billed,
+                                                input_includes_cached_tokens=self.input_includes_cached_tokens),
+        }
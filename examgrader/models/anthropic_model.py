@@ -0,0 +1,146 @@
+from examgrader.models.base_model import BaseModel, GRADER_OUTPUT_SCHEMA, GRADER_TOOL_DESCRIPTION, GRADER_TOOL_NAME, estimate_tokens
+from examgrader.models.batch import AnthropicBatchTransport
+from typing import Dict, List, Optional, Union
+import warnings
+from pathlib import Path
+import json
+import time
+
+class AnthropicModel(BaseModel):
+    structured_output_modes = ("tool",)
+
+    def __init__(self, api_key: str, model_name: str, vision: bool = False, system_prompt: Optional[str] = None, model_params: Optional[Dict] = None, **kwargs):
+        # kwargs: client, context, rate-limit and retry settings handled by BaseModel
+        super().__init__(api_key, model_name, vision, system_prompt, model_params, **kwargs)
+
+    def create_client(self):
+        import anthropic
+
+        # Retries are handled by BaseModel.generate_response, so the SDK's own retries are disabled
+        return anthropic.Anthropic(api_key=self.api_key, base_url=self.client_params.get("base_url"), max_retries=0,
+                                   http_client=self.create_http_client())
+
+    def image_part(self, encoded_image, media_type):
+        return {"type": "image", "source": {"type": "base64", "media_type": media_type, "data": encoded_image}}
+
+    def build_request_params(self, messages):
+        params = {
+            'model': self.model_name,
+            'messages': messages,
+            'max_tokens': 3000,  # default max_tokens (required param)
+            'temperature': 1.0,  # default
+        }
+
+        # Update params with any model-specific configurations
+        params.update(self.model_params)
+
+        # Add system prompt if defined
+        if self.system_prompt:
+            params['system'] = self.system_prompt
+
+        if self.structured_output == "tool":
+            params['tools'] = [{"name": GRADER_TOOL_NAME, "description": GRADER_TOOL_DESCRIPTION,
+                                "input_schema": GRADER_OUTPUT_SCHEMA}]
+            params['tool_choice'] = {"type": "tool", "name": GRADER_TOOL_NAME}
+
+        if self.prompt_caching:
+            self.add_cache_breakpoints(params)
+
+        return params
+
+    @staticmethod
+    def add_cache_breakpoints(params):
+        """
+        Mark stable request prefixes with cache_control so Anthropic caches them: the system prompt, which is identical
+        for every question, and, when history is replayed, the latest user turn. The next question resends that whole
+        conversation as its prefix and reads it from the cache instead of paying full input price. The breakpoint is
+        skipped for single-message requests, whose content is never repeated. Prefixes below the model's minimum
+        cacheable length are simply not cached.
+        """
+        cache_control = {"type": "ephemeral"}
+        if params.get('system'):
+            params['system'] = [{"type": "text", "text": params['system'], "cache_control": cache_control}]
+
+        messages = params['messages']
+        if len(messages) > 1:
+            # Copy the last message so the payload itself (and its response cache key) is left unchanged
+            content = messages[-1]['content']
+            if isinstance(content, str):
+                content = [{"type": "text", "text": content}]
+            content = content[:-1] + [{**content[-1], "cache_control": cache_control}]
+            params['messages'] = messages[:-1] + [{**messages[-1], "content": content}]
+
+    def parse_response(self, response, verbose=True):
+        if verbose and response.stop_reason not in ('end_turn', 'tool_use'):
+            warnings.warn(f"WARNING: Stop reason is {response.stop_reason}")
+
+        response_dict = {}
+        response_dict["response_text"] = self.response_text(response.content)
+        response_dict["input_tokens"] = response.usage.input_tokens  # excludes tokens read from or written to the cache
+        response_dict["cache_read_tokens"] = getattr(response.usage, "cache_read_input_tokens", None) or 0
+        response_dict["cache_write_tokens"] = getattr(response.usage, "cache_creation_input_tokens", None) or 0
+        response_dict["output_tokens"] = response.usage.output_tokens
+        response_dict["stop_reason"] = response.stop_reason
+        response_dict["model"] = response.model
+        response_dict["model_params"] = self.model_params
+        response_dict["system_prompt"] = self.system_prompt
+
+        return response_dict
+
+    @staticmethod
+    def response_text(content):
+        # Forced tool calls (structured_output "tool") carry the grade as the tool input instead of text
+        for block in content:
+            if block.type == "tool_use":
+                return json.dumps(block.input)
+        return "".join(block.text for block in content if block.type == "text")
+
+    def send_request(self, messages, verbose=True):
+        response = self.client.messages.create(**self.build_request_params(messages))
+        return self.parse_response(response, verbose)
+
+    def stream_request(self, messages, verbose=True, on_text=None):
+        started = time.perf_counter()
+        stream = self.client.messages.create(**self.build_request_params(messages), stream=True)
+        chunks, usage, model, stop_reason, ttft_seconds = [], None, self.model_name, None, None
+        output_tokens = None
+        try:
+            for event in stream:
+                if event.type == "message_start":
+                    model = event.message.model
+                    usage = event.message.usage
+                elif event.type == "content_block_delta" and event.delta.type in ("text_delta", "input_json_delta"):
+                    # Tool input (structured_output "tool") streams as partial JSON
+                    delta = event.delta.text if event.delta.type == "text_delta" else event.delta.partial_json
+                    if ttft_seconds is None:
+                        ttft_seconds = time.perf_counter() - started
+                    chunks.append(delta)
+                    if on_text is not None and on_text(delta, "".join(chunks)):
+                        stop_reason = "early_stop"
+                        break
+                elif event.type == "message_delta":
+                    stop_reason = event.delta.stop_reason
+                    output_tokens = event.usage.output_tokens
+        finally:
+            stream.close()
+
+        if verbose and stop_reason not in ('end_turn', 'tool_use', 'early_stop'):
+            warnings.warn(f"WARNING: Stop reason is {stop_reason}")
+
+        response_dict = {}
+        response_dict["response_text"] = "".join(chunks)
+        # message_start carries the input usage; the output count arrives with message_delta, after the last text
+        response_dict["input_tokens"] = usage.input_tokens if usage is not None else self.estimate_prompt_tokens(messages)
+        response_dict["cache_read_tokens"] = getattr(usage, "cache_read_input_tokens", None) or 0
+        response_dict["cache_write_tokens"] = getattr(usage, "cache_creation_input_tokens", None) or 0
+        response_dict["output_tokens"] = output_tokens if output_tokens is not None else estimate_tokens(response_dict["response_text"])
+        response_dict["stop_reason"] = stop_reason
+        response_dict["ttft_seconds"] = ttft_seconds
+        response_dict["model"] = model
+        response_dict["model_params"] = self.model_params
+        response_dict["system_prompt"] = self.system_prompt
+
+        return response_dict
+
+    def create_batch_transport(self):
+        return AnthropicBatchTransport(self)
@@ -0,0 +1,552 @@
+from typing import List, Optional, Union, Dict
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+import random
+import threading
+import time
+import warnings
+from examgrader.models.image_cache import image_cache
+from examgrader.models.rate_limit import get_concurrency_limit, get_rate_limiter
+from examgrader.models.batch import InProcessBatchTransport
+
+CHARS_PER_TOKEN = 4
+
+# Rough token cost of one image, used only for client-side rate limiting
+IMAGE_TOKEN_ESTIMATE = 1600
+
+# HTTP statuses worth retrying: timeouts, conflicts, rate limits and server-side errors (529 = Anthropic overloaded)
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+# Grading JSON expected from grader models, enforced by the provider when a grader role sets "structured_output"
+GRADER_OUTPUT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "grader_score": {"type": "number", "description": "Points awarded, between 0 and the points available."},
+        "grader_justification": {"type": "string", "description": "Short (1-2 sentence) justification of the score."},
+    },
+    "required": ["grader_score", "grader_justification"],
+    "additionalProperties": False,
+}
+GRADER_TOOL_NAME = "record_grade"
+GRADER_TOOL_DESCRIPTION = "Record the score and justification for the student's response."
+
+# Sent back to the grader, with its previous response, when that response could not be parsed
+GRADER_REASK_PROMPT = ("Your previous response could not be used: {error}. Reply with only a JSON object with the keys "
+                       "'grader_score' (a number between 0 and the points available) and 'grader_justification'.")
+
+
+def estimate_tokens(text) -> int:
+    """
+    Cheap, provider-agnostic token estimate (~4 characters per token) used for context-window budgeting.
+    """
+    return len(str(text)) // CHARS_PER_TOKEN + 1
+
+
+def student_prompt(question) -> str:
+    return question['question']
+
+
+def grader_prompt(question) -> str:
+    """
+    User prompt of a grading request: the question, the student's response, the answer key and the points available.
+    """
+    return (f"Question: {question['question']}\n"
+            f"Student response: {question['student_response']}\n"
+            f"Answer key: {question['answer']}\n"
+            f"Total points available: {question['points']}\n")
+
+
+class ContextWindow:
+    """
+    Sliding window over a growing conversation history.
+
+    Modes:
+        "full": replay the whole history, dropping the oldest turns only when max_tokens would be exceeded.
+        "window": replay at most the last window_size turns, also bounded by max_tokens.
+        "stateless": send only the current question.
+
+    Token counts are cached per turn and the window total is kept as a running sum, so each call only counts the
+    turns appended since the previous call. The window only slides forward while the same history list keeps growing.
+    """
+    modes = {"full", "window", "stateless"}
+
+    def __init__(self, mode: str = "full", max_tokens: Optional[int] = None, window_size: Optional[int] = None):
+        if mode not in self.modes:
+            raise ValueError(f"Unknown context mode '{mode}'. Expected one of {sorted(self.modes)}.")
+        if mode == "window" and window_size is None:
+            raise ValueError("Context mode 'window' requires a window_size.")
+
+        self.mode = mode
+        self.max_tokens = max_tokens
+        self.window_size = 0 if mode == "stateless" else window_size
+        self._lock = threading.Lock()
+        self._reset(None)
+
+    def _reset(self, conversation_history):
+        self._history = conversation_history
+        self._turn_tokens = []
+        self._total_tokens = 0
+        self._window_tokens = 0
+        self._start = 0
+
+    def update(self, conversation_history: List, turn_text, prompt_tokens: int = 0):
+        """
+        Count any new turns and slide the window. Returns (start, tokens_saved), where conversation_history[start:]
+        is the part to send and tokens_saved is the estimated number of history tokens left out.
+        """
+        with self._lock:
+            if conversation_history is not self._history or len(conversation_history) < len(self._turn_tokens):
+                self._reset(conversation_history)
+
+            for entry in conversation_history[len(self._turn_tokens):]:
+                tokens = estimate_tokens(turn_text(entry))
+                self._turn_tokens.append(tokens)
+                self._total_tokens += tokens
+                self._window_tokens += tokens
+
+            n_turns = len(self._turn_tokens)
+            while self._start < n_turns and (
+                    (self.window_size is not None and n_turns - self._start > self.window_size) or
+                    (self.max_tokens is not None and self._window_tokens + prompt_tokens > self.max_tokens)):
+                self._window_tokens -= self._turn_tokens[self._start]
+                self._start += 1
+
+            return self._start, self._total_tokens - self._window_tokens
+
+
+class Conversation:
+    """
+    Rendered history of one role's conversation with a model, shared by the provider adapters. Each history entry (a
+    past question and the model's response to it) is rendered once, when first seen, into its user and assistant
+    messages; later payloads reuse those message dicts, so preparing a question does not re-render the earlier turns.
+    The context window decides which turns are replayed, from the text of each rendered turn.
+
+    Like ContextWindow, the cache follows one history list as it grows and starts over when given a different one.
+    The cached message dicts are shared between payloads and must not be modified.
+    """
+
+    def __init__(self, context: ContextWindow, render_prompt, response_key: str):
+        self.context = context
+        self.render_prompt = render_prompt
+        self.response_key = response_key
+        self._lock = threading.Lock()
+        self._history = None
+        self._messages = []
+        self._turn_texts = []
+
+    def history_messages(self, conversation_history: List, prompt: str):
+        """
+        Returns (messages, tokens_saved): a new list of the user and assistant messages of the history turns to replay
+        before prompt, and the estimated number of history tokens left out.
+        """
+        if not conversation_history:
+            # Requests without history (concurrent dispatch, batches, re-asks) leave the cached conversation alone
+            return [], 0
+
+        with self._lock:
+            if conversation_history is not self._history or len(conversation_history) < len(self._turn_texts):
+                self._history = conversation_history
+                self._messages = []
+                self._turn_texts = []
+
+            for entry in conversation_history[len(self._turn_texts):]:
+                user_prompt = self.render_prompt(entry)
+                response = entry[self.response_key]
+                self._messages.append({"role": "user", "content": user_prompt})
+                self._messages.append({"role": "assistant", "content": response})
+                self._turn_texts.append(f"{user_prompt}{response}")
+
+            start, tokens_saved = self.context.update(self._turn_texts, lambda text: text, estimate_tokens(prompt))
+            return self._messages[2 * start:], tokens_saved
+
+
+class BaseModel:
+    # Connection pool defaults for the provider HTTP client; override per role with the "client_params" config key
+    default_client_params = {
+        "max_connections": 100,
+        "max_keepalive_connections": 20,
+        "keepalive_expiry": 30.0,
+        "timeout": 600.0,
+    }
+
+    # Retry defaults; override per provider with the "retry" key in models/model_library.json
+    default_retry_params = {
+        "max_retries": 5,
+        "initial_delay": 1.0,
+        "max_delay": 60.0,
+    }
+
+    # Output tokens reserved when deriving the history budget from the context window and max_tokens is not set
+    default_output_reserve = 4096
+
+    # Whether the provider's reported input tokens include the tokens read from its prompt cache (for cost estimates)
+    input_includes_cached_tokens = False
+
+    # Supported values of the "structured_output" config key: "json_schema" (schema-constrained response format) and/or
+    # "tool" (a forced call to the GRADER_TOOL_NAME tool, whose arguments are returned as the response text)
+    structured_output_modes = ()
+
+    # Samples a single request can return (the provider's `n` parameter); 1 for providers without one
+    max_samples_per_request = 1
+
+    # Whether the system prompt is sent as the first message (rather than as a separate request parameter)
+    system_message = False
+
+    def __init__(self, api_key: str, model_name: str, vision: bool = False, system_prompt: Optional[str] = None, model_params: Optional[Dict] = None, client_params: Optional[Dict] = None,
+                 context_params: Optional[Dict] = None, context_window: Optional[int] = None, provider: Optional[str] = None,
+                 rate_limits: Optional[Dict] = None, retry_params: Optional[Dict] = None, max_concurrency: Optional[int] = None,
+                 prompt_caching: bool = False, pricing: Optional[Dict] = None, structured_output: Optional[str] = None,
+                 samples: int = 1, image_profile: Optional[Dict] = None):
+        self.api_key = api_key
+        self.model_name = model_name
+        self.vision = vision
+        self.system_prompt = system_prompt
+        self.model_params = model_params
+        self.client_params = {**self.default_client_params, **(client_params or {})}
+        self._client = None
+        self._client_lock = threading.Lock()
+
+        # Context-window management, configured per role with the optional "context" config key
+        context_params = context_params or {}
+        self.context_window = context_window
+        self.context = ContextWindow(mode=context_params.get("mode", "full"),
+                                     max_tokens=context_params.get("max_history_tokens", self.default_history_budget()),
+                                     window_size=context_params.get("window_size"))
+        self.history_tokens_saved = 0
+        self.student_conversation = Conversation(self.context, student_prompt, "student_response")
+        self.grader_conversation = Conversation(self.context, grader_prompt, "grader_response")
+
+        # Retries and client-side rate limiting; the limiter is shared by every model of the same provider
+        self.provider = provider or type(self).__name__
+        self.retry_params = {**self.default_retry_params, **(retry_params or {})}
+        self.rate_limiter = get_rate_limiter(self.provider, rate_limits)
+        self.request_slots = get_concurrency_limit(self.provider, max_concurrency)
+
+        # Provider-side prompt caching of the system prompt and conversation prefix, where the adapter supports it
+        self.prompt_caching = prompt_caching
+
+        # USD per million tokens, from the "pricing" key in models/model_library.json; used for cost estimates
+        self.pricing = pricing
+
+        # Provider-enforced grading JSON (GRADER_OUTPUT_SCHEMA) for grader roles, from the "structured_output" config key
+        if structured_output is not None and structured_output not in self.structured_output_modes:
+            raise ValueError(f"{type(self).__name__} does not support structured_output '{structured_output}'. "
+                             f"Expected one of {list(self.structured_output_modes)}.")
+        self.structured_output = structured_output
+
+        # Grader samples per question (self-consistency), from the "samples" config key; see runners.grader_grade_ensemble
+        if samples < 1:
+            raise ValueError(f"samples must be at least 1, got {samples}.")
+        self.samples = samples
+
+        # Token-by-token streaming of responses (see stream_request), enabled by setting stream_responses
+        self.stream_responses = False
+
+        # Largest image size and output formats worth sending, from the provider's "image_profile" in
+        # models/model_library.json; images are downscaled and recompressed to it before encoding
+        self.image_profile = image_profile
+
+        # Optional response cache, enabled with use_response_cache
+        self.response_cache = None
+        self.cache_mode = "off"
+
+    @property
+    def client(self):
+        """
+        Long-lived provider client, created on first use and shared by every request made through this model
+        (including concurrent ones), so connections are pooled and kept alive between calls.
+        """
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self.create_client()
+        return self._client
+
+    def create_client(self):
+        """
+        Build the provider SDK client.
+        Placeholder method; subclasses should override with model-specific logic.
+        """
+        raise NotImplementedError
+
+    def create_http_client(self):
+        """
+        Build a thread-safe httpx connection pool sized according to client_params.
+        """
+        import httpx
+
+        limits = httpx.Limits(max_connections=self.client_params["max_connections"],
+                              max_keepalive_connections=self.client_params["max_keepalive_connections"],
+                              keepalive_expiry=self.client_params["keepalive_expiry"])
+        return httpx.Client(limits=limits, timeout=self.client_params["timeout"])
+
+    def close(self):
+        """
+        Close the provider client and release its pooled connections.
+        """
+        with self._client_lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+    def encode_image(self, image_path):
+        return image_cache.get(image_path, self.image_profile)[0]
+
+    def load_image(self, image_path):
+        """
+        Return the base64-encoded image, prepared for the provider's image profile, and its media type from the
+        process-wide cache.
+        """
+        return image_cache.get(image_path, self.image_profile)
+
+    def default_history_budget(self) -> Optional[int]:
+        """
+        Tokens available for replayed history: the model's context window minus the output reserve and system prompt.
+        """
+        if self.context_window is None:
+            return None
+        output_reserve = (self.model_params or {}).get("max_tokens") or self.default_output_reserve
+        return self.context_window - output_reserve - estimate_tokens(self.system_prompt or "")
+
+    def prepare_input(self, conversation: Conversation, question, conversation_history: List, prompt: str) -> List:
+        """
+        Messages of a request: the system message (for providers that take it as a message), the history turns that
+        fit the configured context mode and token budget, and the current prompt with the question's images. The
+        estimated number of history tokens left out is stored in history_tokens_saved.
+        """
+        messages, self.history_tokens_saved = conversation.history_messages(conversation_history, prompt)
+        if self.system_prompt and self.system_message:
+            messages.insert(0, {"role": "system", "content": self.system_prompt})
+        messages.append({"role": "user", "content": self.user_content(question, prompt)})
+        return messages
+
+    def prepare_student_input(self, question, conversation_history: List) -> List:
+        return self.prepare_input(self.student_conversation, question, conversation_history, student_prompt(question))
+
+    def prepare_grader_input(self, question, conversation_history: List) -> List:
+        return self.prepare_input(self.grader_conversation, question, conversation_history, grader_prompt(question))
+
+    def user_content(self, question, prompt: str):
+        """
+        Content of the current user message: the prompt, preceded by the question's images for vision models.
+        """
+        images = question.get("image", None)
+        if not self.vision:
+            if images:
+                print(f"\nWarning: Question {question['index']} has images but the selected model does not "
+                      f"have vision capabilities. Ignoring images and processing text only.")
+            return prompt
+        if not images:
+            return prompt
+        # Always append the question text last
+        return [self.image_part(*self.load_image(image_path)) for image_path in images] + [{"type": "text", "text": prompt}]
+
+    def image_part(self, encoded_image: str, media_type: str) -> Dict:
+        """
+        Provider-specific content part of a base64-encoded image.
+        """
+        raise NotImplementedError
+
+    def prepare_grader_reask_input(self, question, error: str, response: Optional[str] = None):
+        """
+        Payload for asking the grader again when its response could not be parsed: the grading request (without
+        grading history), the unusable response (question's grader_response unless given) and what was wrong with it.
+        """
+        messages = self.prepare_grader_input(question, [])
+        response = response if response is not None else question.get('grader_response')
+        messages.append({"role": "assistant", "content": response or "(empty response)"})
+        messages.append({"role": "user", "content": GRADER_REASK_PROMPT.format(error=error)})
+        return messages
+
+    def estimate_request_tokens(self, messages, samples: int = 1) -> int:
+        """
+        Estimate the rate-limit cost of a request: prompt text, images and the requested output tokens of each sample.
+        """
+        return self.estimate_prompt_tokens(messages) + samples * ((self.model_params or {}).get("max_tokens") or 0)
+
+    def estimate_prompt_tokens(self, messages) -> int:
+        """
+        Estimate the input tokens of a request (system prompt, text and images), e.g. when a stream is closed before
+        the provider reports usage.
+        """
+        tokens = estimate_tokens(self.system_prompt or "")
+        for message in messages:
+            content = message["content"]
+            if isinstance(content, str):
+                tokens += estimate_tokens(content)
+                continue
+            for part in content:
+                tokens += estimate_tokens(part["text"]) if part["type"] == "text" else IMAGE_TOKEN_ESTIMATE
+        return tokens
+
+    @staticmethod
+    def is_retryable(error: Exception) -> bool:
+        """
+        Whether an error from the provider SDK is transient: a retryable HTTP status, a timeout or a connection error.
+        """
+        status_code = getattr(error, "status_code", None)
+        if status_code is not None:
+            return status_code in RETRYABLE_STATUS_CODES or status_code >= 500
+        error_names = {cls.__name__ for cls in type(error).__mro__}
+        return bool(error_names & {"APIConnectionError", "APITimeoutError"}) or isinstance(error, (TimeoutError, ConnectionError))
+
+    @staticmethod
+    def retry_after(error: Exception) -> Optional[float]:
+        """
+        Seconds to wait as requested by the provider through the retry-after-ms or Retry-After response headers.
+        """
+        headers = getattr(getattr(error, "response", None), "headers", None)
+        if not headers:
+            return None
+        if headers.get("retry-after-ms"):
+            try:
+                return float(headers["retry-after-ms"]) / 1000
+            except ValueError:
+                pass
+        retry_after = headers.get("retry-after")
+        if not retry_after:
+            return None
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+        try:
+            return max(0.0, (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+    def backoff_delay(self, attempt: int, error: Exception) -> float:
+        """
+        Exponential backoff with jitter (half fixed, half random), never shorter than the provider's Retry-After.
+        """
+        delay = min(self.retry_params["max_delay"], self.retry_params["initial_delay"] * 2 ** attempt)
+        delay = delay / 2 + random.uniform(0, delay / 2)
+        retry_after = self.retry_after(error)
+        return max(delay, retry_after) if retry_after is not None else delay
+
+    def use_response_cache(self, response_cache, cache_mode: str = "read"):
+        """
+        Route generate_response through a ResponseCache in "read", "write" or "off" mode.
+        """
+        self.response_cache = response_cache if cache_mode != "off" else None
+        self.cache_mode = cache_mode
+
+    def generate_response(self, messages, verbose=True, on_text=None, samples=1, first_sample=0):
+        """
+        Send a payload to the model API through send_request (or stream_request if stream_responses is set, passing
+        on_text along), waiting on the provider's rate limiter and concurrency limit first and retrying transient
+        errors (429, 5xx, timeouts) with exponential backoff. The number of retries is reported under "retries" in the
+        response dict, the seconds spent waiting for the rate limiter and concurrency limit under "queue_seconds", and
+        whether it was served from the response cache under "cache_hit".
+
+        With samples > 1 (at most max_samples_per_request), one request returns that many samples of the same prompt,
+        listed under "response_texts" and "stop_reasons"; token counts are the totals of the request, so the prompt
+        is paid for once. Such requests are never streamed. first_sample numbers the samples of a prompt split over
+        several requests, so each request has its own response cache entry.
+        """
+        if samples > self.max_samples_per_request:
+            raise ValueError(f"{type(self).__name__} returns at most {self.max_samples_per_request} sample(s) per request, "
+                             f"got {samples}.")
+        cache_key = None
+        if self.response_cache is not None:
+            model_params = self.model_params
+            if samples > 1 or first_sample > 0:
+                model_params = {**(model_params or {}), "n": samples, "first_sample": first_sample}
+            cache_key = self.response_cache.request_key(self.model_name, model_params, self.system_prompt, messages,
+                                                        self.structured_output)
+            if self.cache_mode == "read":
+                response_dict = self.response_cache.get(cache_key)
+                if response_dict is not None:
+                    response_dict["retries"] = 0
+                    response_dict["queue_seconds"] = 0.0
+                    response_dict["ttft_seconds"] = None
+                    response_dict["cache_hit"] = True
+                    if on_text is not None:
+                        on_text(response_dict["response_text"], response_dict["response_text"])
+                    return response_dict
+
+        estimated_tokens = self.estimate_request_tokens(messages, samples) if self.rate_limiter else 0
+        queue_seconds = 0.0
+
+        for attempt in range(self.retry_params["max_retries"] + 1):
+            queued = time.perf_counter()
+            if self.rate_limiter:
+                self.rate_limiter.acquire(estimated_tokens)
+            if self.request_slots:
+                self.request_slots.acquire()
+            queue_seconds += time.perf_counter() - queued
+            try:
+                if samples > 1:
+                    response_dict = self.send_request(messages, verbose, samples)
+                elif self.stream_responses:
+                    response_dict = self.stream_request(messages, verbose, on_text)
+                else:
+                    response_dict = self.send_request(messages, verbose)
+                error = None
+            except Exception as e:
+                error = e
+            finally:
+                # Free the concurrency slot before any backoff so waiting retries do not block other requests
+                if self.request_slots:
+                    self.request_slots.release()
+            if error is None:
+                break
+
+            if self.rate_limiter:
+                self.rate_limiter.settle(estimated_tokens, 0)  # failed attempts do not consume tokens
+            if attempt == self.retry_params["max_retries"] or not self.is_retryable(error):
+                raise error
+            delay = self.backoff_delay(attempt, error)
+            if verbose:
+                warnings.warn(f"{self.model_name} request failed ({type(error).__name__}: {error}); "
+                              f"retrying in {delay:.1f}s (attempt {attempt + 1}/{self.retry_params['max_retries']}).")
+            time.sleep(delay)
+
+        if self.rate_limiter:
+            actual_tokens = (response_dict["input_tokens"] or 0) + (response_dict["output_tokens"] or 0)
+            self.rate_limiter.settle(estimated_tokens, actual_tokens)
+
+        response_dict["retries"] = attempt
+        response_dict["queue_seconds"] = queue_seconds
+        if cache_key is not None:
+            self.response_cache.put(cache_key, response_dict)
+        response_dict["cache_hit"] = False
+        return response_dict
+
+    def build_request_params(self, messages):
+        """
+        Assemble the provider API request parameters for a payload.
+        Placeholder method; subclasses should override with model-specific logic.
+        """
+        raise NotImplementedError
+
+    def parse_response(self, response, verbose=True):
+        """
+        Convert a provider API response into the response dict returned by generate_response.
+        Placeholder method; subclasses should override with model-specific logic.
+        """
+        raise NotImplementedError
+
+    def create_batch_transport(self):
+        """
+        Transport used for batch execution. Defaults to running requests in-process; subclasses for providers with a
+        batch API should override.
+        """
+        return InProcessBatchTransport(self)
+
+    def send_request(self, messages, verbose=True, samples=1):
+        """
+        Send a single request to the model API and return the response dict. No retries or rate limiting here; those
+        are applied by generate_response. samples > 1 is only passed to providers with max_samples_per_request > 1.
+        Placeholder method; subclasses should override with model-specific logic.
+        """
+        raise NotImplementedError
+
+    def stream_request(self, messages, verbose=True, on_text=None):
+        """
+        Streaming counterpart of send_request. on_text(delta, text) is called with each text chunk and the text so far,
+        and may return True to close the stream early (stop_reason "early_stop"; token counts the provider has not
+        reported yet are estimated). The response dict also reports the time to the first text chunk as "ttft_seconds".
+        Placeholder method; subclasses should override with model-specific logic.
+        """
+        raise NotImplementedError
@@ -0,0 +1,138 @@
+from typing import Dict, List, Tuple, Union
+import json
+import uuid
+
+
+class BatchRequestError(Exception):
+    """
+    A single request inside a batch that did not produce a usable response.
+    """
+
+
+class BatchTransport:
+    """
+    Submits many requests at once and collects their results. Requests are (custom_id, messages) pairs, where messages
+    is a payload from prepare_student_input/prepare_grader_input; results map each custom_id to the model's response
+    dict, or to a BatchRequestError if that request failed.
+
+    The model supplies build_request_params/parse_response, so transports only deal with submission and polling. Remote
+    transports talk to the provider through model.client, which can point at a local fake endpoint via the
+    "base_url" client param.
+    """
+    max_batch_size = 10000
+
+    def __init__(self, model):
+        self.model = model
+
+    def submit(self, requests: List[Tuple[str, List]]) -> str:
+        raise NotImplementedError
+
+    def poll(self, batch_id: str) -> bool:
+        """
+        Return True once the batch has finished processing (successfully or not).
+        """
+        raise NotImplementedError
+
+    def results(self, batch_id: str) -> Dict[str, Union[Dict, BatchRequestError]]:
+        raise NotImplementedError
+
+
+class InProcessBatchTransport(BatchTransport):
+    """
+    Fallback for providers without a batch API: runs each request through model.generate_response when results are
+    collected. Also useful for exercising the batch code path locally.
+    """
+
+    def __init__(self, model):
+        super().__init__(model)
+        self._batches = {}
+
+    def submit(self, requests):
+        batch_id = f"local-{uuid.uuid4().hex}"
+        self._batches[batch_id] = list(requests)
+        return batch_id
+
+    def poll(self, batch_id):
+        return True
+
+    def results(self, batch_id):
+        results = {}
+        for custom_id, messages in self._batches.pop(batch_id):
+            try:
+                results[custom_id] = self.model.generate_response(messages, verbose=False)
+            except Exception as e:
+                results[custom_id] = BatchRequestError(f"{type(e).__name__}: {e}")
+        return results
+
+
+class OpenAIBatchTransport(BatchTransport):
+    """
+    OpenAI Batch API: uploads the requests as a JSONL file and creates a /v1/chat/completions batch.
+    """
+    max_batch_size = 50000
+    endpoint = "/v1/chat/completions"
+    terminal_statuses = {"completed", "failed", "expired", "cancelled"}
+
+    def submit(self, requests):
+        lines = [json.dumps({"custom_id": custom_id, "method": "POST", "url": self.endpoint,
+                             "body": self.model.build_request_params(messages)})
+                 for custom_id, messages in requests]
+        batch_file = self.model.client.files.create(file=("batch_requests.jsonl", "\n".join(lines).encode()),
+                                                    purpose="batch")
+        batch = self.model.client.batches.create(input_file_id=batch_file.id, endpoint=self.endpoint,
+                                                 completion_window="24h")
+        return batch.id
+
+    def poll(self, batch_id):
+        return self.model.client.batches.retrieve(batch_id).status in self.terminal_statuses
+
+    def results(self, batch_id):
+        from openai.types.chat import ChatCompletion
+
+        batch = self.model.client.batches.retrieve(batch_id)
+        results = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in self.model.client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                response = record.get("response") or {}
+                if record.get("error") or response.get("status_code") != 200:
+                    results[record["custom_id"]] = BatchRequestError(str(record.get("error") or response.get("body")))
+                else:
+                    completion = ChatCompletion.model_validate(response["body"])
+                    results[record["custom_id"]] = self.model.parse_response(completion, verbose=False)
+        return results
+
+
+class AnthropicBatchTransport(BatchTransport):
+    """
+    Anthropic Message Batches API.
+    """
+    max_batch_size = 100000
+
+    @property
+    def batches(self):
+        # Message batches moved out of the beta namespace in later SDK versions
+        messages = self.model.client.messages
+        return messages.batches if hasattr(messages, "batches") else self.model.client.beta.messages.batches
+
+    def submit(self, requests):
+        batch = self.batches.create(requests=[{"custom_id": custom_id, "params": self.model.build_request_params(messages)}
+                                              for custom_id, messages in requests])
+        return batch.id
+
+    def poll(self, batch_id):
+        return self.batches.retrieve(batch_id).processing_status == "ended"
+
+    def results(self, batch_id):
+        results = {}
+        for entry in self.batches.results(batch_id):
+            if entry.result.type == "succeeded":
+                results[entry.custom_id] = self.model.parse_response(entry.result.message, verbose=False)
+            else:
+                error = getattr(entry.result, "error", None)
+                results[entry.custom_id] = BatchRequestError(f"{entry.result.type}: {error}")
+        return results
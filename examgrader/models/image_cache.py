@@ -0,0 +1,152 @@
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+import base64
+import hashlib
+import json
+import mimetypes
+import os
+import threading
+
+from examgrader.models.image_processing import prepare_image, profile_key
+
+# Leading bytes identifying the image formats accepted by the model APIs
+IMAGE_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+]
+
+
+def detect_media_type(data: bytes, image_path: Union[str, Path, None] = None) -> str:
+    """
+    Detect the media type of an image from its leading bytes. Falls back to a guess from the file name only for
+    formats without a known signature.
+    """
+    for signature, media_type in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return media_type
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+
+    guessed_type = mimetypes.guess_type(str(image_path))[0] if image_path is not None else None
+    return guessed_type or "application/octet-stream"
+
+
+class ImageCache:
+    """
+    Process-wide cache of base64-encoded images keyed by resolved path, mtime, size and image profile, so an image
+    shared by several questions, by the student and grader passes, or by several models with the same profile is read,
+    downscaled (see image_processing.prepare_image) and encoded only once per process.
+
+    Entries are kept in memory up to max_bytes of encoded data with least-recently-used eviction. If sidecar_dir is
+    set, encoded images are also stored on disk there, keyed by the hash of the source bytes and the profile, and
+    reused across processes.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, sidecar_dir: Union[str, Path, None] = None):
+        self.max_bytes = max_bytes
+        self.sidecar_dir = Path(sidecar_dir) if sidecar_dir is not None else None
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._loading = {}  # per-image locks, so concurrent misses for the same image load it only once
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, max_bytes: Optional[int] = None, sidecar_dir: Union[str, Path, None] = None):
+        with self._lock:
+            if max_bytes is not None:
+                self.max_bytes = max_bytes
+                self._evict()
+            if sidecar_dir is not None:
+                self.sidecar_dir = Path(sidecar_dir)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    @staticmethod
+    def cache_key(image_path: Union[str, Path], profile: Optional[Dict] = None) -> Tuple[str, int, int, Optional[str]]:
+        path = Path(image_path).resolve()
+        stat = path.stat()
+        return str(path), stat.st_mtime_ns, stat.st_size, profile_key(profile)
+
+    def get(self, image_path: Union[str, Path], profile: Optional[Dict] = None) -> Tuple[str, str]:
+        """
+        Return (base64-encoded data, media type) for an image file, prepared for the given image profile.
+        """
+        key = self.cache_key(image_path, profile)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+            loading_lock = self._loading.setdefault(key, threading.Lock())
+
+        with loading_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is None:
+                entry = self._load(key, image_path, profile)
+
+        with self._lock:
+            self._loading.pop(key, None)
+
+        return entry
+
+    def _load(self, key, image_path, profile) -> Tuple[str, str]:
+        with open(image_path, "rb") as image_file:
+            data = image_file.read()
+        sidecar_key = (hashlib.sha256(data).hexdigest(), key[3])
+        entry = self._load_sidecar(sidecar_key)
+        if entry is None:
+            data, media_type = prepare_image(data, detect_media_type(data, image_path), profile)
+            entry = (base64.b64encode(data).decode('utf-8'), media_type)
+            self._store_sidecar(sidecar_key, entry)
+
+        with self._lock:
+            if key not in self._entries and len(entry[0]) <= self.max_bytes:
+                self._entries[key] = entry
+                self._size += len(entry[0])
+                self._evict()
+
+        return entry
+
+    def _evict(self):
+        while self._size > self.max_bytes and self._entries:
+            _, (encoded_image, _) = self._entries.popitem(last=False)
+            self._size -= len(encoded_image)
+
+    def _sidecar_path(self, key) -> Optional[Path]:
+        if self.sidecar_dir is None:
+            return None
+        digest = hashlib.sha256(json.dumps(key).encode()).hexdigest()
+        return self.sidecar_dir / f"{digest}.json"
+
+    def _load_sidecar(self, key) -> Optional[Tuple[str, str]]:
+        sidecar_path = self._sidecar_path(key)
+        if sidecar_path is None or not sidecar_path.exists():
+            return None
+        with open(sidecar_path, 'r') as sidecar_file:
+            data = json.load(sidecar_file)
+        return data["data"], data["media_type"]
+
+    def _store_sidecar(self, key, entry):
+        sidecar_path = self._sidecar_path(key)
+        if sidecar_path is None:
+            return
+        sidecar_path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so concurrent processes never read a partial entry
+        tmp_path = sidecar_path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'w') as sidecar_file:
+            json.dump({"data": entry[0], "media_type": entry[1]}, sidecar_file)
+        os.replace(tmp_path, sidecar_path)
+
+
+image_cache = ImageCache()
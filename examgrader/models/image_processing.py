@@ -0,0 +1,121 @@
+from typing import Dict, Optional, Tuple
+import hashlib
+import io
+import json
+import math
+import threading
+import warnings
+
+# Pillow format names of the output formats an image profile may list
+PIL_FORMATS = {"png": "PNG", "jpeg": "JPEG", "webp": "WEBP"}
+
+_warned = threading.Event()
+
+
+def profile_key(profile: Optional[Dict]) -> Optional[str]:
+    """
+    Stable short hash of an image profile, independent of key order (None without a profile).
+    """
+    if not profile:
+        return None
+    return hashlib.sha256(json.dumps(profile, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def target_size(width: int, height: int, profile: Dict) -> Tuple[int, int]:
+    """
+    Size an image is scaled down to (never up) so that it fits the profile's max_long_side, max_short_side and
+    max_pixels, keeping its aspect ratio.
+    """
+    scale = 1.0
+    if profile.get("max_long_side"):
+        scale = min(scale, profile["max_long_side"] / max(width, height))
+    if profile.get("max_short_side"):
+        scale = min(scale, profile["max_short_side"] / min(width, height))
+    if profile.get("max_pixels"):
+        scale = min(scale, math.sqrt(profile["max_pixels"] / (width * height)))
+    if scale >= 1.0:
+        return width, height
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def _encode(image, output_format: str, profile: Dict, lossy: bool) -> bytes:
+    buffer = io.BytesIO()
+    if output_format == "png":
+        image.save(buffer, "PNG", optimize=True)
+    elif not lossy:
+        image.save(buffer, "WEBP", lossless=True)
+    else:
+        if output_format == "jpeg" and image.mode not in ("RGB", "L"):
+            # JPEG has no alpha channel; flatten transparency onto white
+            from PIL import Image
+
+            rgba = image.convert("RGBA")
+            flattened = Image.new("RGB", rgba.size, (255, 255, 255))
+            flattened.paste(rgba, mask=rgba.getchannel("A"))
+            image = flattened
+        image.save(buffer, PIL_FORMATS[output_format], quality=profile.get("quality", 85), optimize=True)
+    return buffer.getvalue()
+
+
+def is_lossy(data: bytes, media_type: str) -> bool:
+    """
+    Whether an image is already lossily compressed: a JPEG, or a WebP with a lossy (VP8) bitstream.
+    """
+    if media_type in ("image/jpeg", "image/jpg"):
+        return True
+    if media_type == "image/webp":
+        return data[12:16] == b"VP8 " or (data[12:16] == b"VP8X" and b"VP8 " in data[30:])
+    return False
+
+
+def prepare_image(data: bytes, media_type: str, profile: Optional[Dict]) -> Tuple[bytes, str]:
+    """
+    Downscale and recompress an image for a provider's image profile (the "image_profile" key in
+    models/model_library.json):
+        "max_long_side", "max_short_side", "max_pixels": the largest image the provider uses without downscaling it
+                                                          itself; larger images are resized to fit.
+        "formats": lossless output formats to try, among "png" and "webp", default ["png"]. The smallest encoding is
+                   sent.
+        "lossy_formats": lossy output formats, among "jpeg" and "webp", tried only when the source image is already
+                         lossy (JPEG or lossy WebP), when the smallest other candidate is larger than "max_bytes", or
+                         always with "prefer_lossy".
+        "max_bytes": the largest image the provider accepts.
+        "prefer_lossy": send the smallest encoding even when it adds lossy compression to a lossless source, default
+                        false. Lossy artifacts can blur the fine detail of scanned text and handwriting, so this is an
+                        explicit opt-in.
+        "quality": quality of lossy (JPEG/WebP) encodings, default 85.
+
+    Returns (data, media type), the smallest candidate. The original bytes are a candidate whenever they are within
+    "max_bytes", even if larger than the size limits (the provider then downscales them itself, at the same token
+    cost), so re-encoding never makes an image larger. They are also kept for GIFs (which may be animated) and when
+    Pillow is not installed (with a warning).
+    """
+    if not profile or media_type == "image/gif":
+        return data, media_type
+    try:
+        from PIL import Image
+    except ImportError:
+        if not _warned.is_set():
+            _warned.set()
+            warnings.warn("Pillow is not installed; images are sent without downscaling. Install it with "
+                          "`pip install pillow` to apply the provider image profiles.")
+        return data, media_type
+
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+        size = target_size(*image.size, profile)
+        resized = image.resize(size, Image.LANCZOS) if size != image.size else image
+        if resized.mode not in ("RGB", "RGBA", "L", "LA"):
+            resized = resized.convert("RGBA" if "transparency" in image.info else "RGB")
+        candidates = [(_encode(resized, output_format, profile, lossy=False), f"image/{output_format}")
+                      for output_format in profile.get("formats", ["png"]) if output_format in ("png", "webp")]
+        max_bytes = profile.get("max_bytes")
+        if not max_bytes or len(data) <= max_bytes:
+            candidates.append((data, media_type))
+        best = min(candidates, key=lambda candidate: len(candidate[0])) if candidates else (data, media_type)
+
+        if profile.get("prefer_lossy") or is_lossy(data, media_type) or (max_bytes and len(best[0]) > max_bytes):
+            candidates += [(_encode(resized, output_format, profile, lossy=True), f"image/{output_format}")
+                           for output_format in profile.get("lossy_formats", []) if output_format in ("jpeg", "webp")]
+            best = min(candidates, key=lambda candidate: len(candidate[0]))
+    return best
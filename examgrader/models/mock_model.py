@@ -0,0 +1,175 @@
+from examgrader.models.base_model import estimate_tokens
+from examgrader.models.openai_model import OpenAIModel
+from examgrader.models.batch import InProcessBatchTransport
+from typing import Dict, Optional
+import json
+import random
+import re
+import threading
+import time
+
+
+class MockAPIError(Exception):
+    """
+    Simulated provider error. Carries an HTTP status code so BaseModel.generate_response retries it like a real one.
+    """
+
+    def __init__(self, status_code: int):
+        super().__init__(f"Mock API error {status_code}")
+        self.status_code = status_code
+        self.response = None
+
+
+class MockModel(OpenAIModel):
+    """
+    Local stand-in for a provider API, for benchmarking and load-testing the run loop without spending API credits.
+    Payloads are assembled exactly as for OpenAI chat models (including history truncation and image encoding), but
+    requests are answered in-process after a simulated latency.
+
+    Behaviour is configured through model_params in the role config:
+        "latency": {"distribution": "fixed", "seconds": 0.5}, or "uniform" (low, high), "normal" (mean, sd),
+                   "lognormal" (median, sigma) or "exponential" (mean); all in seconds.
+        "error_rate": fraction of requests that fail with one of "error_statuses" (default [429, 500, 503]).
+        "output_tokens": fixed number of output tokens, or {"min": ..., "max": ...}.
+        "malformed_rate": fraction of grading responses without usable JSON (replies to a re-ask are always valid).
+        "seed": seed for latency, error and token sampling.
+        "ttft_fraction": share of the latency spent before the first chunk when streaming; the rest is spread over the
+                         chunks.
+
+    Grading requests are answered with grader JSON (a random score within the question's points), everything else
+    with filler text of the sampled length.
+    """
+    default_mock_params = {
+        "latency": {"distribution": "fixed", "seconds": 0.0},
+        "error_rate": 0.0,
+        "error_statuses": [429, 500, 503],
+        "output_tokens": {"min": 20, "max": 200},
+        "malformed_rate": 0.0,
+        "seed": None,
+        "ttft_fraction": 0.3,
+    }
+
+    def __init__(self, api_key: Optional[str], model_name: str, vision: bool = False, system_prompt: Optional[str] = None, model_params: Optional[Dict] = None, **kwargs):
+        super().__init__(api_key, model_name, vision, system_prompt, model_params, **kwargs)
+        self.mock_params = {**self.default_mock_params,
+                            **{key: value for key, value in (model_params or {}).items() if key in self.default_mock_params}}
+        self.random = random.Random(self.mock_params["seed"])
+        self._random_lock = threading.Lock()
+
+    def create_client(self):
+        return None
+
+    def close(self):
+        pass
+
+    def sample_latency(self) -> float:
+        latency = self.mock_params["latency"]
+        distribution = latency.get("distribution", "fixed")
+        with self._random_lock:
+            if distribution == "fixed":
+                seconds = latency.get("seconds", 0.0)
+            elif distribution == "uniform":
+                seconds = self.random.uniform(latency["low"], latency["high"])
+            elif distribution == "normal":
+                seconds = self.random.gauss(latency["mean"], latency["sd"])
+            elif distribution == "lognormal":
+                seconds = latency["median"] * self.random.lognormvariate(0.0, latency["sigma"])
+            elif distribution == "exponential":
+                seconds = self.random.expovariate(1.0 / latency["mean"]) if latency["mean"] > 0 else 0.0
+            else:
+                raise ValueError(f"Unknown mock latency distribution '{distribution}'.")
+        return max(0.0, seconds)
+
+    def sample_output_tokens(self) -> int:
+        output_tokens = self.mock_params["output_tokens"]
+        if isinstance(output_tokens, dict):
+            with self._random_lock:
+                return self.random.randint(output_tokens["min"], output_tokens["max"])
+        return int(output_tokens)
+
+    @staticmethod
+    def message_text(message) -> str:
+        content = message["content"]
+        return content if isinstance(content, str) else "".join(part.get("text", "") for part in content)
+
+    def mock_response_text(self, messages, output_tokens: int) -> str:
+        # A grading request ends with the grading prompt; a re-ask follows it with the grader's reply and a correction
+        prompts = [self.message_text(message) for message in messages if message["role"] == "user"]
+        grading = [prompt for prompt in prompts[-2:] if "Student response:" in prompt]
+        points = re.search(r"Total points available: ([0-9.]+)", grading[-1]) if grading else None
+        if points:
+            with self._random_lock:
+                score = self.random.randint(0, int(float(points.group(1))))
+                malformed = (grading[-1] == prompts[-1]
+                             and self.random.random() < self.mock_params["malformed_rate"])
+            if malformed:
+                return f"The student deserves {score} points."
+            return json.dumps({"grader_score": score, "grader_justification": "Mock grading."})
+        return ("lorem " * output_tokens)[:output_tokens * 4].strip()
+
+    def raise_sampled_error(self):
+        with self._random_lock:
+            failed = self.random.random() < self.mock_params["error_rate"]
+            status_code = self.random.choice(self.mock_params["error_statuses"])
+        if failed:
+            raise MockAPIError(status_code)
+
+    def send_request(self, messages, verbose=True, samples=1):
+        time.sleep(self.sample_latency())
+        self.raise_sampled_error()
+
+        # Like OpenAI's n, several samples share one request and the prompt is counted once
+        max_tokens = (self.model_params or {}).get("max_tokens")
+        sampled_tokens = [self.sample_output_tokens() for _ in range(samples)]
+        texts = [self.mock_response_text(messages, output_tokens) for output_tokens in sampled_tokens]
+        stop_reasons = ["length" if max_tokens and output_tokens > max_tokens else "stop" for output_tokens in sampled_tokens]
+        response_dict = {}
+        response_dict["response_text"] = texts[0]
+        if samples > 1:
+            response_dict["response_texts"] = texts
+            response_dict["stop_reasons"] = stop_reasons
+        response_dict["input_tokens"] = self.estimate_prompt_tokens(messages)
+        response_dict["cache_read_tokens"] = 0
+        response_dict["cache_write_tokens"] = 0
+        response_dict["output_tokens"] = sum(min(output_tokens, max_tokens) if max_tokens else output_tokens
+                                             for output_tokens in sampled_tokens)
+        response_dict["stop_reason"] = stop_reasons[0]
+        response_dict["model"] = self.model_name
+        response_dict["model_params"] = self.model_params
+        response_dict["system_prompt"] = self.system_prompt
+        return response_dict
+
+    def stream_request(self, messages, verbose=True, on_text=None):
+        started = time.perf_counter()
+        latency = self.sample_latency()
+        time.sleep(latency * self.mock_params["ttft_fraction"])
+        self.raise_sampled_error()
+
+        output_tokens = self.sample_output_tokens()
+        text = self.mock_response_text(messages, output_tokens)
+        chunks = [text[i:i + 16] for i in range(0, len(text), 16)]
+        ttft_seconds = time.perf_counter() - started
+        stop_reason = "stop"
+        for count, chunk in enumerate(chunks, 1):
+            if on_text is not None and on_text(chunk, "".join(chunks[:count])):
+                stop_reason = "early_stop"
+                break
+            time.sleep(latency * (1 - self.mock_params["ttft_fraction"]) / len(chunks))
+        else:
+            count = len(chunks)
+
+        response_dict = {}
+        response_dict["response_text"] = "".join(chunks[:count])
+        response_dict["input_tokens"] = self.estimate_prompt_tokens(messages)
+        response_dict["cache_read_tokens"] = 0
+        response_dict["cache_write_tokens"] = 0
+        response_dict["output_tokens"] = estimate_tokens(response_dict["response_text"])
+        response_dict["stop_reason"] = stop_reason
+        response_dict["ttft_seconds"] = ttft_seconds
+        response_dict["model"] = self.model_name
+        response_dict["model_params"] = self.model_params
+        response_dict["system_prompt"] = self.system_prompt
+        return response_dict
+
+    def create_batch_transport(self):
+        return InProcessBatchTransport(self)
@@ -0,0 +1,134 @@
+from examgrader.models.base_model import BaseModel, GRADER_OUTPUT_SCHEMA, GRADER_TOOL_DESCRIPTION, GRADER_TOOL_NAME, estimate_tokens
+from examgrader.models.batch import OpenAIBatchTransport
+from typing import Dict, List, Optional, Union
+import warnings
+from pathlib import Path
+import json
+import time
+
+class OpenAIModel(BaseModel):
+    models_with_vision = {"gpt-4-vision-preview"}
+    input_includes_cached_tokens = True
+    structured_output_modes = ("json_schema", "tool")
+    max_samples_per_request = 128
+    # Chat completions take the system prompt as the first message
+    system_message = True
+
+    def __init__(self, api_key: str, model_name: str, vision: bool = False, system_prompt: Optional[str] = None, model_params: Optional[Dict] = None, **kwargs):
+        # kwargs: client, context, rate-limit and retry settings handled by BaseModel
+        super().__init__(api_key, model_name, vision, system_prompt, model_params, **kwargs)
+
+    def create_client(self):
+        # The SDK is imported on first use, so runs that never send an OpenAI request (e.g. with the mock) skip it
+        from openai import OpenAI
+
+        # Retries are handled by BaseModel.generate_response, so the SDK's own retries are disabled
+        return OpenAI(api_key=self.api_key, base_url=self.client_params.get("base_url"), max_retries=0,
+                      http_client=self.create_http_client())
+
+    def image_part(self, encoded_image, media_type):
+        return {"type": "image", "image_url": f"data:{media_type};base64,{encoded_image}"}
+
+    def build_request_params(self, messages):
+        params = {
+            'model': self.model_name,
+            'messages': messages,
+            'max_tokens': None,  # by default, no max token limit on output
+            'temperature': 1.0  # default
+        }
+
+        # Update params with any model-specific configurations
+        params.update(self.model_params)
+
+        if self.structured_output == "json_schema":
+            params['response_format'] = {"type": "json_schema",
+                                         "json_schema": {"name": GRADER_TOOL_NAME, "schema": GRADER_OUTPUT_SCHEMA, "strict": True}}
+        elif self.structured_output == "tool":
+            params['tools'] = [{"type": "function", "function": {"name": GRADER_TOOL_NAME, "description": GRADER_TOOL_DESCRIPTION,
+                                                                 "parameters": GRADER_OUTPUT_SCHEMA, "strict": True}}]
+            params['tool_choice'] = {"type": "function", "function": {"name": GRADER_TOOL_NAME}}
+
+        return params
+
+    def parse_response(self, response, verbose=True):
+        if verbose and response.choices[0].finish_reason not in ('stop', 'tool_calls'):
+            warnings.warn(f"WARNING: Stop reason is {response.choices[0].finish_reason}")
+
+        # Forced tool calls (structured_output "tool") carry the grade as the call's arguments instead of content
+        texts = [choice.message.tool_calls[0].function.arguments if choice.message.tool_calls else choice.message.content
+                 for choice in response.choices]
+        response_dict = {}
+        response_dict["response_text"] = texts[0]
+        if len(texts) > 1:
+            response_dict["response_texts"] = texts
+            response_dict["stop_reasons"] = [choice.finish_reason for choice in response.choices]
+        response_dict["input_tokens"] = response.usage.prompt_tokens  # includes cached tokens
+        # OpenAI caches long prompt prefixes automatically and only reports the tokens read from the cache
+        prompt_tokens_details = getattr(response.usage, "prompt_tokens_details", None)
+        response_dict["cache_read_tokens"] = getattr(prompt_tokens_details, "cached_tokens", None) or 0
+        response_dict["cache_write_tokens"] = 0
+        response_dict["output_tokens"] = response.usage.completion_tokens
+        response_dict["stop_reason"] = response.choices[0].finish_reason
+        response_dict["model"] = response.model
+        response_dict["model_params"] = self.model_params
+        response_dict["system_prompt"] = self.system_prompt
+        return response_dict
+
+    def send_request(self, messages, verbose=True, samples=1):
+        params = self.build_request_params(messages)
+        if samples > 1:
+            params['n'] = samples
+        response = self.client.chat.completions.create(**params)
+        return self.parse_response(response, verbose)
+
+    def stream_request(self, messages, verbose=True, on_text=None):
+        started = time.perf_counter()
+        stream = self.client.chat.completions.create(**self.build_request_params(messages), stream=True,
+                                                     stream_options={"include_usage": True})
+        chunks, usage, model, stop_reason, ttft_seconds = [], None, self.model_name, None, None
+        try:
+            for chunk in stream:
+                model = chunk.model or model
+                usage = chunk.usage or usage
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                stop_reason = choice.finish_reason or stop_reason
+                delta = choice.delta.content if choice.delta else None
+                if choice.delta and choice.delta.tool_calls:
+                    delta = choice.delta.tool_calls[0].function.arguments
+                if delta:
+                    if ttft_seconds is None:
+                        ttft_seconds = time.perf_counter() - started
+                    chunks.append(delta)
+                    if on_text is not None and on_text(delta, "".join(chunks)):
+                        stop_reason = "early_stop"
+                        break
+        finally:
+            stream.close()
+
+        if verbose and stop_reason not in ('stop', 'tool_calls', 'early_stop'):
+            warnings.warn(f"WARNING: Stop reason is {stop_reason}")
+
+        response_dict = {}
+        response_dict["response_text"] = "".join(chunks)
+        if usage is not None:
+            prompt_tokens_details = getattr(usage, "prompt_tokens_details", None)
+            response_dict["input_tokens"] = usage.prompt_tokens
+            response_dict["cache_read_tokens"] = getattr(prompt_tokens_details, "cached_tokens", None) or 0
+            response_dict["output_tokens"] = usage.completion_tokens
+        else:
+            # Usage arrives in the final chunk, which an early stop never reads
+            response_dict["input_tokens"] = self.estimate_prompt_tokens(messages)
+            response_dict["cache_read_tokens"] = 0
+            response_dict["output_tokens"] = estimate_tokens(response_dict["response_text"])
+        response_dict["cache_write_tokens"] = 0
+        response_dict["stop_reason"] = stop_reason
+        response_dict["ttft_seconds"] = ttft_seconds
+        response_dict["model"] = model
+        response_dict["model_params"] = self.model_params
+        response_dict["system_prompt"] = self.system_prompt
+        return response_dict
+
+    def create_batch_transport(self):
+        return OpenAIBatchTransport(self)
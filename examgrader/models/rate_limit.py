@@ -0,0 +1,104 @@
+from typing import Dict, Optional
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at capacity_per_minute / 60 per second.
+
+    acquire() reserves the requested amount immediately (the balance may go negative) and then sleeps until the
+    balance would have been non-negative, so concurrent callers are served in arrival order and the long-run rate never
+    exceeds the configured limit.
+    """
+
+    def __init__(self, capacity_per_minute: float):
+        self.capacity = float(capacity_per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """
+        Reserve amount from the bucket, blocking until it is available. Returns the time spent waiting, in seconds.
+        """
+        with self._lock:
+            self._refill()
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def adjust(self, amount: float):
+        """
+        Return (positive) or additionally charge (negative) tokens once the real cost of a request is known.
+        """
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    """
+    Client-side limiter for requests per minute and tokens per minute. Either limit may be omitted.
+    """
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    def acquire(self, estimated_tokens: int = 0) -> float:
+        waited = 0.0
+        if self.requests is not None:
+            waited += self.requests.acquire(1)
+        if self.tokens is not None:
+            waited += self.tokens.acquire(estimated_tokens)
+        return waited
+
+    def settle(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        """
+        Correct the token bucket with the usage reported by the provider.
+        """
+        if self.tokens is not None and actual_tokens is not None:
+            self.tokens.adjust(estimated_tokens - actual_tokens)
+
+
+_rate_limiters: Dict[str, RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: str, rate_limits: Optional[Dict] = None) -> Optional[RateLimiter]:
+    """
+    Return the process-wide limiter for a provider, so every model instance and thread using the same provider
+    (and therefore the same API rate limits) draws from the same buckets.
+    """
+    if not rate_limits:
+        return None
+    with _rate_limiters_lock:
+        if provider not in _rate_limiters:
+            _rate_limiters[provider] = RateLimiter(rate_limits.get("requests_per_minute"),
+                                                   rate_limits.get("tokens_per_minute"))
+        return _rate_limiters[provider]
+
+
+_concurrency_limits: Dict[str, threading.BoundedSemaphore] = {}
+
+
+def get_concurrency_limit(provider: str, max_concurrency: Optional[int] = None) -> Optional[threading.BoundedSemaphore]:
+    """
+    Return the process-wide semaphore capping in-flight requests for a provider, shared like the rate limiter so that
+    several models of one provider running side by side stay within a single limit.
+    """
+    if not max_concurrency:
+        return None
+    with _rate_limiters_lock:
+        if provider not in _concurrency_limits:
+            _concurrency_limits[provider] = threading.BoundedSemaphore(max_concurrency)
+        return _concurrency_limits[provider]
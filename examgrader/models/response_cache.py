@@ -0,0 +1,82 @@
+from pathlib import Path
+from typing import Dict, Optional, Union
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+
+class ResponseCache:
+    """
+    SQLite-backed cache of model responses keyed by a stable hash of the full request: model name, model_params,
+    system prompt and messages (including encoded images). Least-recently-used entries are evicted once the stored
+    responses exceed max_bytes.
+
+    Modes (see BaseModel.generate_response):
+        "read": serve cached responses; request and store misses.
+        "write": always request and overwrite the cached response.
+        "off": no caching.
+    """
+    modes = ("read", "write", "off")
+
+    def __init__(self, cache_path: Union[str, Path], max_bytes: int = 1024 ** 3):
+        self.cache_path = Path(cache_path)
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.cache_path, check_same_thread=False)
+        self._connection.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access);
+        """)
+
+    @staticmethod
+    def request_key(model_name: str, model_params: Optional[Dict], system_prompt: Optional[str], messages,
+                    structured_output: Optional[str] = None) -> str:
+        request = {"model": model_name, "model_params": model_params, "system_prompt": system_prompt,
+                   "messages": messages}
+        # Only part of the key when set, so entries cached without structured output keep their keys
+        if structured_output:
+            request["structured_output"] = structured_output
+        serialized = json.dumps(request, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(serialized.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._connection.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._connection.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._connection.commit()
+        return json.loads(row[0])
+
+    def put(self, key: str, response_dict: Dict):
+        response = json.dumps(response_dict, default=str)
+        now = time.time()
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                                     (key, response, len(response), now, now))
+            self._evict()
+            self._connection.commit()
+
+    def _evict(self):
+        total_size = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total_size <= self.max_bytes:
+            return
+        for key, size in self._connection.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+            if total_size <= self.max_bytes:
+                break
+            self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total_size -= size
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
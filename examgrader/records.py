@@ -0,0 +1,157 @@
+from typing import Dict, Iterable, List
+
+import pandas as pd
+
+# Output columns added by each stage, in the order they appear in the output files
+STUDENT_COLUMNS = (
+    "student_response",
+    "student_response_time",
+    "student_prepare_seconds",
+    "student_latency_seconds",
+    "student_queue_seconds",
+    "student_ttft_seconds",
+    "student_retries",
+    "student_model_specified",
+    "student_model_used",
+    "student_input_tokens",
+    "student_cache_read_tokens",
+    "student_cache_write_tokens",
+    "student_history_tokens_saved",
+    "student_output_tokens",
+    "student_stop_reason",
+    "student_model_params",
+    "student_system_prompt",
+    "student_cache_hit",
+)
+
+GRADER_COLUMNS = (
+    "grader_response",
+    "grader_score",
+    "grader_justification",
+    "grader_parse_error",
+    "grader_reasks",
+    "grader_samples",
+    "grader_sample_scores",
+    "grader_score_median",
+    "grader_score_variance",
+    "grader_response_time",
+    "grader_prepare_seconds",
+    "grader_latency_seconds",
+    "grader_queue_seconds",
+    "grader_ttft_seconds",
+    "grader_retries",
+    "grader_model_specified",
+    "grader_model_used",
+    "grader_input_tokens",
+    "grader_cache_read_tokens",
+    "grader_cache_write_tokens",
+    "grader_history_tokens_saved",
+    "grader_output_tokens",
+    "grader_stop_reason",
+    "grader_model_params",
+    "grader_system_prompt",
+    "grader_cache_hit",
+)
+
+RESULT_COLUMNS = STUDENT_COLUMNS + GRADER_COLUMNS
+_RESULT_COLUMN_SET = frozenset(RESULT_COLUMNS)
+
+
+class ExamRecord:
+    """
+    One exam question and the results recorded for it while the exam is taken and graded.
+
+    The input row (index, question, answer, points, image, ...) is kept as the dict it was read as and is never
+    modified, so several models can share the same loaded exam. Student and grader results live in fixed slots, and
+    anything else is kept in a small overflow dict. Records support the mapping access used by the model adapters
+    (record['question'], record.get('image')) and dict(record), and are converted to a DataFrame only once per run
+    with records_to_frame.
+    """
+    __slots__ = ("fields", "extra") + RESULT_COLUMNS
+
+    def __init__(self, fields: Dict):
+        self.fields = fields
+        self.extra = None
+
+    @classmethod
+    def from_dict(cls, row: Dict) -> "ExamRecord":
+        """
+        Build a record from an exam row or from a previously written output row, whose result columns are moved back
+        into their slots.
+        """
+        if _RESULT_COLUMN_SET.isdisjoint(row):
+            return cls(row)
+        record = cls({key: value for key, value in row.items() if key not in _RESULT_COLUMN_SET})
+        for key in _RESULT_COLUMN_SET.intersection(row):
+            setattr(record, key, row[key])
+        return record
+
+    def __getitem__(self, key):
+        if key in _RESULT_COLUMN_SET:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self.extra is not None and key in self.extra:
+            return self.extra[key]
+        return self.fields[key]
+
+    def __setitem__(self, key, value):
+        if key in _RESULT_COLUMN_SET:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self) -> List[str]:
+        keys = list(self.fields)
+        keys += [column for column in RESULT_COLUMNS if hasattr(self, column)]
+        if self.extra is not None:
+            keys += [key for key in self.extra if key not in self.fields]
+        return keys
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def to_row(self, result_columns: Iterable[str]) -> Dict:
+        """
+        The record as an output row with every one of result_columns (None where unset), as records_to_frame writes
+        it, so rows written one at a time have the same columns as a DataFrame output.
+        """
+        result_columns = set(result_columns)
+        row = dict(self.fields)
+        row.update((column, getattr(self, column, None)) for column in RESULT_COLUMNS
+                   if column in result_columns or hasattr(self, column))
+        if self.extra is not None:
+            row.update((key, value) for key, value in self.extra.items() if key not in self.fields)
+        return row
+
+
+def records_from_frame(df: pd.DataFrame) -> List[ExamRecord]:
+    return [ExamRecord.from_dict(row) for row in df.to_dict('records')]
+
+
+def records_to_frame(records: List[ExamRecord], input_columns: Iterable[str], result_columns: Iterable[str]) -> pd.DataFrame:
+    """
+    Convert records to a DataFrame in one columnar pass. Columns are the input columns followed by the given result
+    columns not already among them (plus any overflow keys found on the first record).
+    """
+    columns = list(input_columns)
+    columns += [column for column in result_columns if column not in columns]
+    if records and records[0].extra:
+        columns += [column for column in records[0].extra if column not in columns]
+    return pd.DataFrame({column: [record.get(column) for record in records] for column in columns}, columns=columns)
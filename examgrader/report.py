@@ -0,0 +1,290 @@
+"""
+Score and usage report over graded runs.
+
+Reads graded_exam outputs (CSV, JSONL or Parquet) given as files or run directories, or selected from the run catalog,
+loading only the columns the report needs, and prints:
+    model totals: score per exam, student model and grader model, with bootstrap confidence intervals.
+    question difficulty: mean fraction of points earned per question, hardest first.
+    grader agreement: pairwise agreement between grader configs (by catalog config hash, labelled with their model)
+                      that graded the same student answers.
+    usage: token totals and estimated cost per model and role.
+
+Usage: examgrader report [paths ...] [--catalog responses/runs.sqlite] [--exam EXAM] [--model MODEL] [--since DATE]
+                        [--bootstrap 1000] [--confidence 0.95] [--output report.json]
+"""
+from concurrent.futures import ThreadPoolExecutor
+from itertools import combinations
+from pathlib import Path
+from typing import Dict, List, Optional
+import argparse
+import json
+
+import numpy as np
+import pandas as pd
+
+from examgrader.catalog import DEFAULT_CATALOG_PATH, RunCatalog, exam_from_path, saved_config_hash
+from examgrader.exam_io import OUTPUT_FORMATS, read_frame, scan_columns
+from examgrader.metrics import estimate_cost
+from examgrader.sharding import PARTS_DIR
+from examgrader.utils import ModelRegistry, model_registry
+
+TOKEN_COLUMNS = ("input_tokens", "cache_read_tokens", "cache_write_tokens", "output_tokens")
+
+# The only columns read from each output
+REPORT_COLUMNS = (["index", "points", "student_model_specified", "student_response_time", "student_cache_hit",
+                   "grader_model_specified", "grader_score", "grader_cache_hit"]
+                  + [f"{role}_{column}" for role in ("student", "grader") for column in TOKEN_COLUMNS])
+
+
+def find_outputs(paths: List[Path]) -> List[Path]:
+    """
+    Graded outputs among the given paths: files are taken as they are, directories are searched recursively (skipping
+    the parts of sharded runs, which are covered by their merged outputs).
+    """
+    outputs = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            outputs += sorted(file for file in path.rglob("graded_exam*.*")
+                              if file.suffix[1:] in OUTPUT_FORMATS and file.parent.name != PARTS_DIR)
+        else:
+            outputs.append(path)
+    return outputs
+
+
+def read_output(path: Path):
+    """
+    The report columns present in one output: an Arrow table for Parquet (read without going through pandas), a
+    DataFrame otherwise.
+    """
+    path = Path(path)
+    if path.suffix == ".parquet":
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(path)
+        names = set(parquet_file.schema_arrow.names)
+        return parquet_file.read(columns=[column for column in REPORT_COLUMNS if column in names])
+    columns = set(scan_columns(path))
+    return read_frame(path, [column for column in REPORT_COLUMNS if column in columns])
+
+
+def load_runs(outputs: Dict[Path, str], workers: int = 8,
+              config_hashes: Optional[Dict[Path, Optional[str]]] = None) -> pd.DataFrame:
+    """
+    Load the report columns of every output (mapped to its exam) into one DataFrame. Files are read in parallel,
+    Parquet outputs are concatenated as Arrow tables and converted once, and the repeated text columns are stored as
+    categoricals. The grader_config column identifies the grader config of each row: the output's config hash from
+    config_hashes, or the grader model name where it has none.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        parts = list(executor.map(read_output, outputs))
+    if not parts:
+        return pd.DataFrame(columns=["exam", "run", "grader_config"] + REPORT_COLUMNS)
+
+    # Parquet parts are converted together and come first, followed by the CSV and JSONL parts
+    order = sorted(zip(outputs, parts), key=lambda item: isinstance(item[1], pd.DataFrame))
+    tables = [part for _, part in order if not isinstance(part, pd.DataFrame)]
+    frames = [part for _, part in order if isinstance(part, pd.DataFrame)]
+    if tables:
+        import pyarrow as pa
+
+        frames.insert(0, pa.concat_tables(tables, promote_options="permissive").to_pandas())
+    df = pd.concat(frames, ignore_index=True).reindex(columns=REPORT_COLUMNS)
+
+    lengths = [len(part) for _, part in order]
+    df.insert(0, "run", pd.Categorical(np.repeat([str(path) for path, _ in order], lengths)))
+    df.insert(0, "exam", pd.Categorical(np.repeat([outputs[path] for path, _ in order], lengths)))
+    for column in ("student_model_specified", "grader_model_specified"):
+        df[column] = df[column].astype("category")
+    hashes = pd.Series(np.repeat([(config_hashes or {}).get(path) for path, _ in order], lengths), dtype=object)
+    df.insert(2, "grader_config", hashes.fillna(df["grader_model_specified"].astype(object)).astype("category"))
+    df["student_response_time"] = df["student_response_time"].astype(str)
+    for column in ["points", "grader_score"] + [f"{role}_{name}" for role in ("student", "grader") for name in TOKEN_COLUMNS]:
+        df[column] = pd.to_numeric(df[column], errors="coerce")
+    for column in ("student_cache_hit", "grader_cache_hit"):
+        df[column] = df[column].isin([True, "True", "true"])
+    return df
+
+
+def bootstrap_interval(scores: np.ndarray, points: np.ndarray, n_bootstrap: int, confidence: float,
+                       rng: np.random.Generator):
+    """
+    Percentile bootstrap interval of the overall score fraction sum(scores) / sum(points), resampling questions.
+    """
+    if len(scores) == 0 or n_bootstrap <= 0:
+        return np.nan, np.nan
+    samples = rng.integers(0, len(scores), size=(n_bootstrap, len(scores)))
+    fractions = scores[samples].sum(axis=1) / points[samples].sum(axis=1)
+    tail = (1 - confidence) / 2 * 100
+    low, high = np.nanpercentile(fractions, [tail, 100 - tail])
+    return float(low), float(high)
+
+
+def model_totals(df: pd.DataFrame, n_bootstrap: int = 1000, confidence: float = 0.95, seed: int = 0) -> pd.DataFrame:
+    """
+    Score per exam, student model and grader model: mean total score and points per run, the overall fraction of
+    points earned and its bootstrap confidence interval (questions resampled, scores averaged over runs). Ungraded
+    (NaN) scores count as zero.
+    """
+    keys = ["exam", "student_model_specified", "grader_model_specified"]
+    scored = df.assign(grader_score=df["grader_score"].fillna(0))
+    per_run = scored.groupby(keys + ["run"], observed=True).agg(score=("grader_score", "sum"), points=("points", "sum"))
+    totals = per_run.groupby(keys, observed=True).agg(runs=("score", "size"), mean_score=("score", "mean"),
+                                                      score_sd=("score", "std"), mean_points=("points", "mean"))
+
+    per_question = scored.groupby(keys + ["index"], observed=True).agg(score=("grader_score", "mean"),
+                                                                       points=("points", "mean"))
+    rng = np.random.default_rng(seed)
+    fractions, lows, highs = [], [], []
+    for key in totals.index:
+        questions = per_question.loc[key]
+        scores, points = questions["score"].to_numpy(float), questions["points"].to_numpy(float)
+        fractions.append(scores.sum() / points.sum() if points.sum() else np.nan)
+        low, high = bootstrap_interval(scores, points, n_bootstrap, confidence, rng)
+        lows.append(low)
+        highs.append(high)
+    totals["fraction"] = fractions
+    totals["ci_low"] = lows
+    totals["ci_high"] = highs
+    return totals.reset_index()
+
+
+def question_difficulty(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Mean fraction of points earned per exam question over all graded answers, hardest first.
+    """
+    graded = df[df["grader_score"].notna() & (df["points"] > 0)]
+    graded = graded.assign(fraction=graded["grader_score"] / graded["points"])
+    difficulty = graded.groupby(["exam", "index"], observed=True).agg(
+        points=("points", "first"), answers=("fraction", "size"), mean_fraction=("fraction", "mean"),
+        fraction_sd=("fraction", "std"), full_marks=("fraction", lambda fraction: (fraction >= 1).mean()))
+    return difficulty.reset_index().sort_values(["mean_fraction", "exam", "index"])
+
+
+def grader_agreement(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Pairwise agreement between grader configs (see load_runs) on the student answers they both graded (an answer is
+    identified by exam, question, student model and response time): number of shared answers, exact score agreement,
+    mean absolute score difference as a fraction of the points, and the correlation of the score fractions. Two
+    configs of the same model with different prompts or params are compared as separate graders.
+    """
+    graded = df[df["grader_score"].notna() & (df["points"] > 0)]
+    fractions = (graded.assign(fraction=graded["grader_score"] / graded["points"])
+                 .pivot_table(index=["exam", "index", "student_model_specified", "student_response_time"],
+                              columns="grader_config", values="fraction", aggfunc="mean", observed=True))
+    models = (graded.drop_duplicates("grader_config").set_index("grader_config", drop=False)["grader_model_specified"]
+              .astype(object).to_dict())
+
+    pairs = []
+    for first, second in combinations(fractions.columns, 2):
+        shared = fractions[[first, second]].dropna()
+        if shared.empty:
+            continue
+        a, b = shared[first].to_numpy(), shared[second].to_numpy()
+        pairs.append({
+            "grader_a": first,
+            "grader_a_model": models.get(first),
+            "grader_b": second,
+            "grader_b_model": models.get(second),
+            "shared_answers": len(shared),
+            "exact_agreement": float(np.isclose(a, b).mean()),
+            "mean_abs_difference": float(np.abs(a - b).mean()),
+            "correlation": float(np.corrcoef(a, b)[0, 1]) if len(shared) > 1 and a.std() and b.std() else np.nan,
+        })
+    return pd.DataFrame(pairs, columns=["grader_a", "grader_a_model", "grader_b", "grader_b_model", "shared_answers",
+                                        "exact_agreement", "mean_abs_difference", "correlation"])
+
+
+def model_pricing(registry: ModelRegistry, models) -> Dict:
+    """
+    (pricing, input_includes_cached_tokens) for each of models that is priced in the registry's library. Only the
+    model classes of providers with a priced model in models are imported.
+    """
+    pricing = {}
+    models = set(models)
+    for provider, provider_menu in registry.model_library.items():
+        priced = {model: prices for model, prices in provider_menu.get("pricing", {}).items() if model in models}
+        if not priced:
+            continue
+        includes_cached = getattr(registry.model_class(provider), "input_includes_cached_tokens", False)
+        pricing.update({model: (prices, includes_cached) for model, prices in priced.items()})
+    return pricing
+
+
+def usage_totals(df: pd.DataFrame, pricing: Dict) -> pd.DataFrame:
+    """
+    Token totals and estimated cost per model and role. A student answer graded by several graders (or in several
+    runs of grader_main.py) is counted once; responses served from the response cache are not billed.
+    """
+    student = df.drop_duplicates(["exam", "index", "student_model_specified", "student_response_time"])
+    usage = []
+    for role, rows in (("student", student), ("grader", df)):
+        tokens = rows[[f"{role}_{name}" for name in TOKEN_COLUMNS]].fillna(0).set_axis(TOKEN_COLUMNS, axis=1)
+        billed = tokens.mul((~rows[f"{role}_cache_hit"]).astype(int), axis=0).add_suffix("_billed")
+        models = rows[f"{role}_model_specified"]
+        totals = pd.concat([tokens, billed], axis=1).groupby(models, observed=True).sum()
+        answers = models.value_counts()
+        for model, row in totals.iterrows():
+            prices, includes_cached = pricing.get(model, (None, False))
+            usage.append({"role": role, "model": model, "answers": int(answers[model]),
+                          **{name: int(row[name]) for name in TOKEN_COLUMNS},
+                          "estimated_cost_usd": estimate_cost(prices, **{name: int(row[f"{name}_billed"]) for name in TOKEN_COLUMNS},
+                                                              input_includes_cached_tokens=includes_cached)})
+    return pd.DataFrame(usage, columns=["role", "model", "answers", *TOKEN_COLUMNS, "estimated_cost_usd"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score and usage report over graded runs.")
+    parser.add_argument("paths", type=Path, nargs="*",
+                        help="Graded outputs or directories containing them. Defaults to the graded runs in the catalog.")
+    parser.add_argument("--catalog", type=Path, default=DEFAULT_CATALOG_PATH, help="Filepath to the run catalog (SQLite).")
+    parser.add_argument("--exam", help="Only runs of this exam (catalog selection).")
+    parser.add_argument("--model", help="Only runs graded by this model (catalog selection).")
+    parser.add_argument("--since", help="Only runs created on or after this ISO date (catalog selection).")
+    parser.add_argument("--until", help="Only runs created on or before this ISO date (catalog selection).")
+    parser.add_argument("--bootstrap", type=int, default=1000, help="Bootstrap resamples for confidence intervals.")
+    parser.add_argument("--confidence", type=float, default=0.95, help="Confidence level of the intervals.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for bootstrap resampling.")
+    parser.add_argument("--output", type=Path, help="Also write the report tables to this JSON file.")
+    args = parser.parse_args(argv)
+
+    catalog = RunCatalog(args.catalog) if args.catalog.exists() else None
+    if args.paths:
+        outputs = {path: catalog.exam_of(path) if catalog else exam_from_path(path)
+                   for path in find_outputs(args.paths)}
+        config_hashes = {path: catalog.config_hash_of(path, "grader") if catalog else saved_config_hash(path, "grader")
+                         for path in outputs}
+    elif catalog:
+        runs = [run for run in catalog.runs(exam=args.exam, role="grader", model=args.model, since=args.since,
+                                            until=args.until)
+                if Path(run["output_file"]).exists()]
+        outputs = {Path(run["output_file"]): run["exam"] for run in runs}
+        config_hashes = {Path(run["output_file"]): run["config_hash"] for run in runs}
+    else:
+        parser.error(f"No paths given and no run catalog at {args.catalog}.")
+    if not outputs:
+        parser.error("No graded outputs found.")
+
+    df = load_runs(outputs, config_hashes=config_hashes)
+    tables = {
+        "model_totals": model_totals(df, args.bootstrap, args.confidence, args.seed),
+        "question_difficulty": question_difficulty(df),
+        "grader_agreement": grader_agreement(df),
+        "usage": usage_totals(df, model_pricing(model_registry(), set(df["student_model_specified"].dropna())
+                                                   | set(df["grader_model_specified"].dropna()))),
+    }
+
+    print(f"{len(outputs)} graded run(s), {len(df)} graded answers.")
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        for name, table in tables.items():
+            print(f"\n{name.replace('_', ' ').capitalize()}:")
+            print(table.to_string(index=False, max_rows=50) if not table.empty else "(none)")
+
+    if args.output:
+        args.output.write_text(json.dumps({name: json.loads(table.to_json(orient="records"))
+                                           for name, table in tables.items()}, indent=2))
+    if catalog:
+        catalog.close()
+
+
+if __name__ == "__main__":
+    main()
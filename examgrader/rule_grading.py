@@ -0,0 +1,89 @@
+"""
+Rule-based grading of true/false and multiple-choice questions, applied to a whole exam DataFrame before any grader
+request. A row is graded by rule only when the option chosen in the student response and the option in the answer key
+can both be read unambiguously; every other row is left to the grader model.
+"""
+import numpy as np
+import pandas as pd
+
+# Recorded as grader_model_used for rows graded by rule
+RULE_GRADER = "rules"
+
+# Per question type: the response is only the option, the response opens with the option, and the option is stated
+# as the answer somewhere in the response ("The answer is B."). Letters are only accepted in lowercase when they make
+# up the whole response, so the article "a" is never read as option A, and a stated letter must be followed by
+# punctuation or the end of the text, so "Answer: I think it's C" is not read as option I but left to the grader.
+_CHOICE_PATTERNS = {
+    "mcq": (r"^(?i:(?:option|choice)\s+)?[(\[]?([A-Ja-j])[)\].]?$",
+            r"^(?i:(?:option|choice)\s+)?[(\[]?([A-J])[)\].:](?:\s|$)",
+            r"(?i:\banswer\b)\s*(?:(?i:is)\s*)?:?\s*(?i:option\s+)?[(\[]?([A-J])(?=[).\]:,;]|\s*$)"),
+    "tf": (r"(?i)^(true|false|t|f)[.!]?$",
+           r"(?i)^(true|false)\b",
+           r"(?i)\banswer\s*(?:is\s*)?:?\s*(true|false)\b"),
+}
+_TF_VALUES = {"t": "TRUE", "f": "FALSE", "true": "TRUE", "false": "FALSE"}
+
+# A tf response that mentions both values ("True or false? False", "not true but false") is left to the grader model
+_TF_BOTH = r"(?is)\btrue\b.*\bfalse\b|\bfalse\b.*\btrue\b"
+
+
+def _normalize(choices: pd.Series, question_type: str) -> pd.Series:
+    choices = choices.str.upper() if question_type == "mcq" else choices.str.lower().map(_TF_VALUES)
+    return choices.astype(object)
+
+
+def extract_choices(texts: pd.Series, question_types: pd.Series) -> pd.Series:
+    """
+    The option selected in each text (a letter for "mcq", TRUE or FALSE for "tf"), or NaN where it cannot be read
+    unambiguously: other question types, no recognizable choice, answers stated as different options, or tf texts that
+    mention both true and false.
+    """
+    texts = texts.fillna("").astype(str).str.replace(r"[*_`]", "", regex=True).str.strip()
+    question_types = question_types.fillna("").astype(str).str.strip().str.lower()
+    choices = pd.Series(np.nan, index=texts.index, dtype=object)
+
+    for question_type, (whole, opening, stated) in _CHOICE_PATTERNS.items():
+        rows = question_types == question_type
+        if not rows.any():
+            continue
+        subset = texts[rows]
+        declared = subset.str.extract(whole, expand=False).fillna(subset.str.extract(opening, expand=False))
+        declared = _normalize(declared, question_type)
+
+        # Every option the text states as its answer; more than one distinct option makes the row ambiguous
+        mentions = subset.str.extractall(stated)
+        if len(mentions):
+            mentions = _normalize(mentions[0], question_type).groupby(level=0)
+            stated_choice = mentions.first().where(mentions.nunique() == 1, "").reindex(subset.index)
+        else:
+            stated_choice = pd.Series(np.nan, index=subset.index, dtype=object)
+
+        conflicting = declared.notna() & stated_choice.notna() & (declared != stated_choice)
+        if question_type == "tf":
+            conflicting |= subset.str.contains(_TF_BOTH, regex=True)
+        choice = declared.fillna(stated_choice).mask(conflicting).replace("", np.nan)
+        choices[rows] = choice
+    return choices
+
+
+def rule_grade(exam_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Grade the tf/mcq rows of an answered exam whose chosen option and answer key can both be read: full points if
+    they match, 0 otherwise. Returns grader_response, grader_score and grader_justification for those rows only
+    (indexed like exam_df), in one vectorized pass over the exam.
+    """
+    columns = ["grader_response", "grader_score", "grader_justification"]
+    if "question_type" not in exam_df.columns or "student_response" not in exam_df.columns:
+        return pd.DataFrame(columns=columns)
+
+    chosen = extract_choices(exam_df["student_response"], exam_df["question_type"])
+    keys = extract_choices(exam_df["answer"], exam_df["question_type"])
+    points = pd.to_numeric(exam_df["points"], errors="coerce").astype(float)
+    gradable = chosen.notna() & keys.notna() & points.notna()
+    chosen, keys, points = chosen[gradable], keys[gradable], points[gradable]
+
+    return pd.DataFrame({
+        "grader_response": chosen,
+        "grader_score": points.where(chosen == keys, 0.0),
+        "grader_justification": "Graded by rule: the response selects " + chosen + " and the answer key is " + keys + ".",
+    }, columns=columns)
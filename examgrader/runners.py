@@ -0,0 +1,782 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, List, Optional
+import queue
+import sys
+import threading
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from examgrader.checkpoint import RunJournal
+from examgrader.exam_io import RowWriter
+from examgrader.grader_output import GraderOutputError, extract_json_object, parse_grader_output
+from examgrader.metrics import StageMetrics
+from examgrader.models.base_model import BaseModel
+from examgrader.models.batch import BatchRequestError, BatchTransport
+from examgrader.records import ExamRecord, GRADER_COLUMNS, STUDENT_COLUMNS, records_from_frame, records_to_frame
+from examgrader.rule_grading import RULE_GRADER, rule_grade
+
+
+def student_answer_question(question: ExamRecord, student_model: BaseModel, student_history, verbose=False,
+                            print_stream=False):
+    """
+    Send a single question to the student model and record the response and metadata on the question record.
+    Timings are monotonic wall-clock seconds for building the payload and for the request (including retries).
+
+    With print_stream (verbose output for a streaming model answering one question at a time), the answer is printed
+    as it arrives instead of once it is complete.
+    """
+    started = time.perf_counter()
+    student_payload = student_model.prepare_student_input(question, student_history)
+    history_tokens_saved = student_model.history_tokens_saved
+    prepared = time.perf_counter()
+    if print_stream:
+        with tqdm.external_write_mode(file=sys.stdout):
+            sys.stdout.write(f"\nQuestion {question['index']}:\n{question['question']}\n\nStudent response:\n")
+            student_response = student_model.generate_response(student_payload, on_text=print_text)
+            sys.stdout.write("\n\n----------------------------------------------------------------------------------\n\n")
+    else:
+        student_response = student_model.generate_response(student_payload)
+    finished = time.perf_counter()
+
+    # Add model response and metadata to the question record
+    question.student_response = student_response["response_text"]
+    question.student_response_time = datetime.now().isoformat()
+    question.student_prepare_seconds = prepared - started
+    question.student_latency_seconds = finished - prepared
+    question.student_queue_seconds = student_response.get("queue_seconds")
+    question.student_ttft_seconds = student_response.get("ttft_seconds")
+    question.student_retries = student_response.get("retries", 0)
+    question.student_model_specified = student_model.model_name
+    question.student_model_used = student_response["model"]
+    question.student_input_tokens = student_response["input_tokens"]
+    question.student_cache_read_tokens = student_response.get("cache_read_tokens", 0)
+    question.student_cache_write_tokens = student_response.get("cache_write_tokens", 0)
+    question.student_history_tokens_saved = history_tokens_saved
+    question.student_output_tokens = student_response["output_tokens"]
+    question.student_stop_reason = student_response["stop_reason"]
+    question.student_model_params = student_response["model_params"]
+    question.student_system_prompt = student_response["system_prompt"]
+    question.student_cache_hit = student_response.get("cache_hit", False)
+
+    if verbose and not print_stream:
+        tqdm.write(f"\nQuestion {question['index']}:\n{question['question']}\n\n"
+                   f"Student response:\n{question.student_response}\n\n"
+                   f"----------------------------------------------------------------------------------\n")
+
+    return question
+
+
+def print_text(delta, text):
+    sys.stdout.write(delta)
+    sys.stdout.flush()
+
+
+def grading_json_complete(delta, text):
+    """
+    on_text callback for streamed grader responses: close the stream as soon as the grading JSON object is complete.
+    """
+    return "}" in delta and "grader_score" in (extract_json_object(text) or {})
+
+
+def grader_grade_question(question: ExamRecord, grader_model: BaseModel, grader_history, verbose=False, reask=False):
+    """
+    Send a single student answer to the grader model and record the score, justification and metadata on the
+    question record. With reask, a response that cannot be parsed is sent back to the grader right away (used when
+    rows are written as they finish and there is no second pass).
+
+    When the model streams its responses, the stream is closed as soon as the grading JSON object is complete, so any
+    text the grader adds after it is neither waited for nor paid for.
+    """
+    started = time.perf_counter()
+    grader_payload = grader_model.prepare_grader_input(question, grader_history)
+    history_tokens_saved = grader_model.history_tokens_saved
+    prepared = time.perf_counter()
+    grader_response = grader_model.generate_response(grader_payload, on_text=grading_json_complete)
+    finished = time.perf_counter()
+    question = record_grader_response(question, grader_model, grader_response, history_tokens_saved, verbose,
+                                      prepare_seconds=prepared - started, latency_seconds=finished - prepared)
+    if reask and question.grader_parse_error:
+        payload = grader_model.prepare_grader_reask_input(question, question.grader_parse_error)
+        question = record_grader_reask(question, grader_model, grader_model.generate_response(payload), verbose)
+    return question
+
+
+def record_grade(question: ExamRecord):
+    """
+    Parse question.grader_response into grader_score and grader_justification, or record why it could not be parsed
+    in grader_parse_error (the score is then NaN).
+    """
+    try:
+        question.grader_score, question.grader_justification = parse_grader_output(question.grader_response,
+                                                                                   question.get('points'))
+        question.grader_parse_error = None
+    except GraderOutputError as e:
+        warnings.warn(f"Could not parse the grader response for question [{question['index']}]: {e}.")
+        question.grader_score = np.nan
+        question.grader_justification = ""
+        question.grader_parse_error = str(e)
+
+
+def record_grader_response(question: ExamRecord, grader_model: BaseModel, grader_response, history_tokens_saved=0,
+                           verbose=False, prepare_seconds=None, latency_seconds=None):
+    """
+    Parse the grader response and record the score, justification and metadata on the question record. The timings
+    are left empty for batched requests, which have no per-request latency.
+    """
+    question.grader_response = grader_response["response_text"]
+    record_grade(question)
+    question.grader_reasks = 0
+
+    question.grader_response_time = datetime.now().isoformat()
+    question.grader_prepare_seconds = prepare_seconds
+    question.grader_latency_seconds = latency_seconds
+    question.grader_queue_seconds = grader_response.get("queue_seconds")
+    question.grader_ttft_seconds = grader_response.get("ttft_seconds")
+    question.grader_retries = grader_response.get("retries", 0)
+    question.grader_model_specified = grader_model.model_name
+    question.grader_model_used = grader_response["model"]
+    question.grader_input_tokens = grader_response["input_tokens"]
+    question.grader_cache_read_tokens = grader_response.get("cache_read_tokens", 0)
+    question.grader_cache_write_tokens = grader_response.get("cache_write_tokens", 0)
+    question.grader_history_tokens_saved = history_tokens_saved
+    question.grader_output_tokens = grader_response["output_tokens"]
+    question.grader_stop_reason = grader_response["stop_reason"]
+    question.grader_model_params = grader_response["model_params"]
+    question.grader_system_prompt = grader_response["system_prompt"]
+    question.grader_cache_hit = grader_response.get("cache_hit", False)
+
+    if verbose:
+        tqdm.write(f"\nQuestion {question['index']}:\n{question['question']}\n\n"
+                   f"Student answer:\n{question['student_response']}\n\n"
+                   f"Grader score: {question.grader_score}/{question['points']}\n"
+                   f"Grader justification: {question.grader_justification}\n"
+                   f"----------------------------------------------------------------------------------\n")
+
+    return question
+
+
+def record_grader_reask(question: ExamRecord, grader_model: BaseModel, grader_response, verbose=False):
+    """
+    Record the grader's answer to a re-ask (see BaseModel.prepare_grader_reask_input) on the question record: it
+    replaces the unparseable response, and its tokens and retries are added to those of the first request.
+    """
+    question.grader_response = grader_response["response_text"]
+    record_grade(question)
+    question.grader_reasks = (question.get('grader_reasks') or 0) + 1
+
+    question.grader_response_time = datetime.now().isoformat()
+    question.grader_retries = (question.get('grader_retries') or 0) + grader_response.get("retries", 0)
+    question.grader_model_used = grader_response["model"]
+    question.grader_input_tokens = (question.get('grader_input_tokens') or 0) + grader_response["input_tokens"]
+    question.grader_cache_read_tokens = ((question.get('grader_cache_read_tokens') or 0)
+                                         + grader_response.get("cache_read_tokens", 0))
+    question.grader_cache_write_tokens = ((question.get('grader_cache_write_tokens') or 0)
+                                          + grader_response.get("cache_write_tokens", 0))
+    question.grader_output_tokens = (question.get('grader_output_tokens') or 0) + grader_response["output_tokens"]
+    question.grader_stop_reason = grader_response["stop_reason"]
+
+    if verbose:
+        tqdm.write(f"\nQuestion {question['index']} (re-asked):\n"
+                   f"Grader score: {question.grader_score}/{question['points']}\n"
+                   f"Grader justification: {question.grader_justification}\n"
+                   f"----------------------------------------------------------------------------------\n")
+
+    return question
+
+
+def run_concurrently(questions, func, concurrency, progress: Optional[Dict] = None):
+    """
+    Apply func to every question using a pool of `concurrency` threads. Questions are dispatched independently
+    (without conversation history) and results are returned in the original question order.
+    """
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(tqdm(executor.map(func, questions), total=len(questions), **(progress or {})))
+
+
+def imap_ordered(func, items, concurrency):
+    """
+    Lazily apply func to items from a pool of `concurrency` threads, yielding results in input order. At most
+    2 * concurrency items are pulled from the iterable ahead of the consumer, so memory stays bounded for arbitrarily
+    long inputs.
+    """
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        in_flight = deque()
+        for item in items:
+            in_flight.append(executor.submit(func, item))
+            if len(in_flight) >= 2 * concurrency:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+def merge_completed(questions, completed, results):
+    """
+    Combine rows reused from the journal with newly processed rows (given in order for the remaining questions) into
+    one list of records in the original question order.
+    """
+    results = iter(results)
+    return [ExamRecord.from_dict(completed[question['index']]) if question['index'] in completed else next(results)
+            for question in questions]
+
+
+def run_exam(exam_df: pd.DataFrame, process_question, model: BaseModel, stage: str, concurrency=1,
+             journal: RunJournal = None, progress: Optional[Dict] = None, second_pass=None):
+    """
+    Run process_question(question, history) over every exam row and return the output DataFrame in question order.
+    Rows are handled as ExamRecords and converted to a DataFrame once at the end.
+
+    If a journal is given, each completed row is appended to it as soon as it finishes, and rows already journaled for
+    this stage and model (keyed by question index) are reused instead of being sent to the model again. Reused rows
+    are still part of the conversation history for the rows that follow.
+
+    progress holds extra tqdm options for the progress bar (e.g. desc and position when several runs share a console).
+    second_pass, if given, is called with all records (in question order) once every row has been processed, and may
+    update them before they are converted.
+    """
+    completed = journal.completed(stage, model.model_name) if journal else {}
+    if completed:
+        print(f"Resuming: {len(completed)} of {len(exam_df)} questions already completed.")
+
+    def process(question, history):
+        question = process_question(question, history)
+        if journal:
+            journal.append(stage, model.model_name, question)
+        return question
+
+    questions = records_from_frame(exam_df)
+    result_columns = STUDENT_COLUMNS if stage == "student" else GRADER_COLUMNS
+
+    if concurrency > 1:
+        pending = [question for question in questions if question['index'] not in completed]
+        results = run_concurrently(pending, lambda question: process(question, []), concurrency, progress)
+        records = merge_completed(questions, completed, results)
+    else:
+        records = []
+        for question in tqdm(questions, **(progress or {})):
+            if question['index'] in completed:
+                records.append(ExamRecord.from_dict(completed[question['index']]))
+            else:
+                records.append(process(question, records))
+
+    if second_pass:
+        second_pass(records)
+    return records_to_frame(records, exam_df.columns, result_columns)
+
+
+def student_take_exam(exam_df: pd.DataFrame, student_model: BaseModel, verbose=False, concurrency=1,
+                      journal: RunJournal = None, progress: Optional[Dict] = None):
+    print("Student taking exam...")
+    print_stream = verbose and concurrency == 1 and student_model.stream_responses
+    return run_exam(exam_df, lambda question, history: student_answer_question(question, student_model, history, verbose,
+                                                                               print_stream),
+                    student_model, "student", concurrency, journal, progress)
+
+
+def split_rule_graded(exam_df: pd.DataFrame):
+    """
+    Grade by rule the tf/mcq rows that allow it (see rule_grading.rule_grade). Returns the rule grades and the rows
+    left for the grader model.
+    """
+    ruled = rule_grade(exam_df)
+    print(f"Graded {len(ruled)} of {len(exam_df)} questions by rule; the rest go to the grader model.")
+    return ruled, exam_df.drop(index=ruled.index)
+
+
+def merge_rule_grades(exam_df: pd.DataFrame, ruled: pd.DataFrame, graded: pd.DataFrame, grader_model: BaseModel,
+                      ensemble=False) -> pd.DataFrame:
+    """
+    Combine the rule grades with the rows graded by the model (in order, all exam_df rows not graded by rule) into one
+    graded DataFrame in exam_df's order. Rule-graded rows record RULE_GRADER as grader_model_used and stop reason, the
+    grader's model params and system prompt, and use no tokens; in an ensemble they count as a single sample.
+    """
+    results = {"grader_parse_error": None, "grader_reasks": 0, "grader_response_time": datetime.now().isoformat(),
+               "grader_retries": 0, "grader_model_specified": grader_model.model_name, "grader_model_used": RULE_GRADER,
+               "grader_input_tokens": 0, "grader_cache_read_tokens": 0, "grader_cache_write_tokens": 0,
+               "grader_history_tokens_saved": 0, "grader_output_tokens": 0, "grader_stop_reason": RULE_GRADER,
+               "grader_model_params": [grader_model.model_params] * len(ruled),
+               "grader_system_prompt": grader_model.system_prompt, "grader_cache_hit": False}
+    if ensemble:
+        results.update(grader_samples=1, grader_sample_scores=ruled["grader_score"].map(lambda score: [score]),
+                       grader_score_median=ruled["grader_score"], grader_score_variance=0.0)
+    ruled = exam_df.loc[ruled.index].assign(**{column: ruled[column] for column in ruled}, **results)
+    graded = graded.set_axis(exam_df.index.drop(ruled.index))
+    # Empty frames are left out so their object columns do not change the dtypes of the other (e.g. index to float)
+    merged = pd.concat([frame for frame in (graded, ruled) if len(frame)] or [graded])
+    merged = merged.reindex(index=exam_df.index, columns=graded.columns)
+    input_dtypes = {column: dtype for column, dtype in exam_df.dtypes.items() if column not in GRADER_COLUMNS}
+    return merged.astype(input_dtypes).reset_index(drop=True)
+
+
+def empty_graded_frame(exam_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The graded DataFrame of an exam with no row left for the grader model (all graded by rule).
+    """
+    return records_to_frame([], exam_df.columns, GRADER_COLUMNS)
+
+
+def grader_grade_exam(exam_df: pd.DataFrame, grader_model: BaseModel, verbose=False, concurrency=1,
+                      journal: RunJournal = None, reask=True, rule_grading=False):
+    """
+    The grader model is expected to output a JSON-formatted string with the keys 'grader_score' and 'grader_justification'.
+    If the JSON containing these keys is not included in the grader output, the script will raise a warning and append
+    null responses for those keys in the grader_history. It will still record the grader_response.
+    These instructions should be included in the system prompt. The JSON can also be enforced by the provider with the
+    "structured_output" grader config key. The JSON may be wrapped in a code fence or surrounded by other text, and
+    the score must lie between 0 and the question's points (see grader_output.parse_grader_output).
+
+    With reask, rows whose response still cannot be parsed are sent back to the grader once, together, after the whole
+    exam has been graded (see reask_failed_grades).
+
+    With concurrency > 1, each question is graded independently (only its own student answer is sent, no grading
+    history) and the graded rows are returned in the original question order.
+
+    With rule_grading, tf/mcq questions whose chosen option can be read from the student response are graded against
+    the answer key without a grader request, and only the other rows are sent to the grader model.
+    """
+    if rule_grading:
+        ruled, remaining = split_rule_graded(exam_df)
+        graded = grader_grade_exam(remaining, grader_model, verbose, concurrency, journal, reask) if len(remaining) \
+            else empty_graded_frame(exam_df)
+        return merge_rule_grades(exam_df, ruled, graded, grader_model)
+
+    print("Grader grading exam...")
+    second_pass = (lambda records: reask_failed_grades(records, grader_model, verbose, concurrency, journal)) if reask else None
+    return run_exam(exam_df, lambda question, history: grader_grade_question(question, grader_model, history, verbose),
+                    grader_model, "grader", concurrency, journal, second_pass=second_pass)
+
+
+def stream_exam(questions, process_question, model: BaseModel, stage: str, writer: RowWriter, concurrency=1,
+                journal: RunJournal = None, progress: Optional[Dict] = None):
+    """
+    Streaming counterpart of run_exam: questions are pulled lazily from an iterable of dicts, processed and written
+    row-by-row to writer, and no DataFrame is built. Every row has all of the stage's result columns, as in run_exam's
+    output. Returns the stage's StageMetrics (token usage and timings).
+
+    Conversation history is only retained when it can be sent (serial dispatch in a "full" or "window" context mode);
+    with concurrency > 1 or a "stateless" context, memory stays flat regardless of exam size.
+    """
+    completed = journal.completed(stage, model.model_name) if journal else {}
+    if completed:
+        print(f"Resuming: {len(completed)} questions already completed.")
+
+    keep_history = concurrency == 1 and model.context.mode != "stateless"
+    history = []
+    result_columns = STUDENT_COLUMNS if stage == "student" else GRADER_COLUMNS
+
+    def process(question):
+        if question['index'] in completed:
+            return ExamRecord.from_dict(completed[question['index']])
+        question = process_question(ExamRecord.from_dict(question), history)
+        if journal:
+            journal.append(stage, model.model_name, question)
+        return question
+
+    metrics = StageMetrics(stage, model)
+    results = imap_ordered(process, questions, concurrency) if concurrency > 1 else map(process, questions)
+    for row in tqdm(results, **(progress or {})):
+        writer.write(row.to_row(result_columns))
+        metrics.add(row)
+        if keep_history:
+            history.append(row)
+
+    return metrics
+
+
+def student_take_exam_streaming(questions, student_model: BaseModel, writer: RowWriter, verbose=False, concurrency=1,
+                                journal: RunJournal = None, progress: Optional[Dict] = None):
+    print("Student taking exam (streaming)...")
+    print_stream = verbose and concurrency == 1 and student_model.stream_responses
+    return stream_exam(questions, lambda question, history: student_answer_question(question, student_model, history, verbose,
+                                                                                    print_stream),
+                       student_model, "student", writer, concurrency, journal, progress)
+
+
+def grader_grade_exam_streaming(questions, grader_model: BaseModel, writer: RowWriter, verbose=False, concurrency=1,
+                                journal: RunJournal = None, reask=True):
+    """
+    Streaming counterpart of grader_grade_exam. Rows are written as soon as they are graded, so with reask an
+    unparseable response is re-asked right away instead of in a second pass.
+    """
+    print("Grader grading exam (streaming)...")
+    return stream_exam(questions, lambda question, history: grader_grade_question(question, grader_model, history, verbose,
+                                                                                  reask),
+                       grader_model, "grader", writer, concurrency, journal)
+
+
+class _QueueWriter:
+    """
+    Student-stage writer for pipeline_exam: writes each answered row to the student output and hands a copy to the
+    grader stage. The queue is bounded, so the student stage never runs more than a few rows ahead of the grader.
+    """
+
+    def __init__(self, writer, rows: queue.Queue, stop: threading.Event):
+        self.writer = writer
+        self.rows = rows
+        self.stop = stop
+
+    def write(self, row):
+        self.writer.write(row)
+        row = dict(row)
+        while True:
+            if self.stop.is_set():
+                raise RuntimeError("Grader stage stopped; aborting the student stage.")
+            try:
+                self.rows.put(row, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+
+def pipeline_exam(questions, student_model: BaseModel, grader_model: BaseModel, student_writer, grader_writer,
+                  verbose=False, student_concurrency=1, grader_concurrency=1, journal: RunJournal = None, reask=True):
+    """
+    Take and grade the exam at the same time: the student stage runs in a background thread and puts each answered
+    row (in question order) on a queue, from which the grader stage grades it right away. Wall-clock time approaches
+    the slower of the two stages instead of their sum. Returns the (student, grader) StageMetrics.
+
+    Each stage behaves exactly like stream_exam with its own concurrency (history is kept only for serial dispatch),
+    so both output files match a non-pipelined run with the same settings. A failure in either stage stops the other.
+    As in grader_grade_exam_streaming, unparseable grades are re-asked right away when reask is set.
+    """
+    print("Student taking exam and grader grading exam (pipelined)...")
+    rows = queue.Queue(maxsize=2 * max(student_concurrency, grader_concurrency))
+    stop = threading.Event()
+    done = object()
+    student_result = {}
+
+    def run_student():
+        try:
+            student_result["metrics"] = stream_exam(
+                questions, lambda question, history: student_answer_question(question, student_model, history, verbose),
+                student_model, "student", _QueueWriter(student_writer, rows, stop), student_concurrency, journal,
+                {"desc": "student", "position": 0})
+        except BaseException as e:
+            student_result["error"] = e
+        finally:
+            while not stop.is_set():
+                try:
+                    rows.put(done, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+
+    def answered_rows():
+        while True:
+            row = rows.get()
+            if row is done:
+                return
+            yield row
+
+    student_thread = threading.Thread(target=run_student, name="student-stage", daemon=True)
+    student_thread.start()
+    try:
+        grader_metrics = stream_exam(
+            answered_rows(), lambda question, history: grader_grade_question(question, grader_model, history, verbose, reask),
+            grader_model, "grader", grader_writer, grader_concurrency, journal, {"desc": "grader", "position": 1})
+    finally:
+        stop.set()
+        student_thread.join()
+
+    if "error" in student_result:
+        raise student_result["error"]
+    return student_result["metrics"], grader_metrics
+
+
+def run_batches(transport: BatchTransport, requests, poll_interval=30, verbose=False):
+    """
+    Submit (custom_id, payload) requests in as few batches as the transport allows, poll until every batch has finished
+    and return the results keyed by custom_id (a response dict or a BatchRequestError). Nothing is submitted when
+    there are no requests.
+    """
+    if not requests:
+        return {}
+    batch_ids = [transport.submit(requests[start:start + transport.max_batch_size])
+                 for start in range(0, len(requests), transport.max_batch_size)]
+    print(f"Submitted {len(requests)} grading requests in {len(batch_ids)} batch(es): {', '.join(batch_ids)}")
+
+    unfinished = set(batch_ids)
+    while unfinished:
+        unfinished = {batch_id for batch_id in unfinished if not transport.poll(batch_id)}
+        if unfinished:
+            if verbose:
+                tqdm.write(f"Waiting for {len(unfinished)} batch(es) to finish...")
+            time.sleep(poll_interval)
+
+    batch_results = {}
+    for batch_id in batch_ids:
+        batch_results.update(transport.results(batch_id))
+    return batch_results
+
+
+def reask_failed_grades(questions, grader_model: BaseModel, verbose=False, concurrency=1, journal: RunJournal = None,
+                        transport: BatchTransport = None, poll_interval=30):
+    """
+    Second grading pass: every row whose grader response could not be parsed (and that was not re-asked before, e.g.
+    in a resumed run) is sent back to the grader once, with its unusable response and the parse error. The re-asks
+    are dispatched together, through the batch transport if one is given and otherwise from a pool of `concurrency`
+    threads, so a few bad rows never require regrading the whole exam. Rows are updated in place and re-journaled.
+    """
+    failed = [question for question in questions
+              if isinstance(question.get('grader_parse_error'), str) and not (question.get('grader_reasks') or 0) > 0]
+    if not failed:
+        return questions
+    print(f"Re-asking the grader for {len(failed)} response(s) that could not be parsed...")
+
+    payloads = [grader_model.prepare_grader_reask_input(question, question.grader_parse_error) for question in failed]
+    if transport is not None:
+        requests = [(f"reask-{position}", payload) for position, payload in enumerate(payloads)]
+        batch_results = run_batches(transport, requests, poll_interval, verbose)
+        responses = []
+        for (custom_id, payload), question in zip(requests, failed):
+            grader_response = batch_results.get(custom_id, BatchRequestError("missing from batch results"))
+            if isinstance(grader_response, BatchRequestError):
+                warnings.warn(f"Batch re-ask for question [{question['index']}] failed ({grader_response}); "
+                              f"retrying synchronously.")
+                grader_response = grader_model.generate_response(payload)
+            responses.append(grader_response)
+    else:
+        responses = run_concurrently(payloads, grader_model.generate_response, concurrency)
+
+    for question, grader_response in zip(failed, responses):
+        record_grader_reask(question, grader_model, grader_response, verbose)
+        if journal:
+            journal.append("grader", grader_model.model_name, question)
+    return questions
+
+
+def grader_grade_exam_batch(exam_df: pd.DataFrame, grader_model: BaseModel, verbose=False, journal: RunJournal = None,
+                            poll_interval=30, transport: BatchTransport = None, reask=True, rule_grading=False):
+    """
+    Grade the whole exam through the provider's batch interface: build every grader payload up front (stateless, i.e.
+    each question graded without grading history), submit them in as few batches as the transport allows, poll until
+    the batches finish and merge the results back in question order. Requests that fail inside the batch are retried
+    synchronously. Rows already in the journal are skipped as in grader_grade_exam, and with reask the rows that
+    could not be parsed are re-asked in one more batch. rule_grading is as in grader_grade_exam.
+    """
+    if rule_grading:
+        ruled, remaining = split_rule_graded(exam_df)
+        graded = grader_grade_exam_batch(remaining, grader_model, verbose, journal, poll_interval, transport, reask) \
+            if len(remaining) else empty_graded_frame(exam_df)
+        return merge_rule_grades(exam_df, ruled, graded, grader_model)
+
+    print("Grader grading exam (batch)...")
+
+    completed = journal.completed("grader", grader_model.model_name) if journal else {}
+    if completed:
+        print(f"Resuming: {len(completed)} of {len(exam_df)} questions already completed.")
+
+    questions = records_from_frame(exam_df)
+    pending = [question for question in questions if question['index'] not in completed]
+    payloads = [grader_model.prepare_grader_input(question, []) for question in pending]
+    requests = [(f"question-{position}", payload) for position, payload in enumerate(payloads)]
+
+    transport = transport or grader_model.create_batch_transport()
+    batch_results = run_batches(transport, requests, poll_interval, verbose)
+
+    graded = []
+    for (custom_id, payload), question in zip(tqdm(requests), pending):
+        grader_response = batch_results.get(custom_id, BatchRequestError("missing from batch results"))
+        if isinstance(grader_response, BatchRequestError):
+            warnings.warn(f"Batch request for question [{question['index']}] failed ({grader_response}); "
+                          f"retrying synchronously.")
+            grader_response = grader_model.generate_response(payload)
+        question = record_grader_response(question, grader_model, grader_response, verbose=verbose)
+        if journal:
+            journal.append("grader", grader_model.model_name, question)
+        graded.append(question)
+
+    records = merge_completed(questions, completed, graded)
+    if reask:
+        reask_failed_grades(records, grader_model, verbose, journal=journal, transport=transport,
+                            poll_interval=poll_interval)
+    return records_to_frame(records, exam_df.columns, GRADER_COLUMNS)
+
+
+def parse_grader_sample(question: ExamRecord, text: Optional[str]):
+    """
+    (score, justification, parse_error) of one grader sample; score is None if the sample could not be parsed.
+    """
+    try:
+        score, justification = parse_grader_output(text, question.get('points'))
+        return score, justification, None
+    except GraderOutputError as e:
+        warnings.warn(f"Could not parse a grader sample for question [{question['index']}]: {e}.")
+        return None, "", str(e)
+
+
+def grader_sample_question(question: ExamRecord, grader_model: BaseModel, samples: int, first_sample=0, reask=False):
+    """
+    Request `samples` grades of a single student answer (samples first_sample, first_sample + 1, ...), without grading
+    history, in one request, and parse each of them. With reask, a sample that cannot be parsed is sent back to the
+    grader once. Returns the parsed samples with every response dict received, to be recorded by
+    record_ensemble_grade once all samples of the question are in.
+    """
+    started = time.perf_counter()
+    grader_payload = grader_model.prepare_grader_input(question, [])
+    prepared = time.perf_counter()
+    grader_response = grader_model.generate_response(grader_payload, on_text=grading_json_complete, samples=samples,
+                                                     first_sample=first_sample)
+    responses = [grader_response]
+
+    parsed = []
+    texts = grader_response.get("response_texts", [grader_response["response_text"]])
+    stop_reasons = grader_response.get("stop_reasons", [grader_response["stop_reason"]])
+    for text, stop_reason in zip(texts, stop_reasons):
+        score, justification, parse_error = parse_grader_sample(question, text)
+        reasks = 0
+        if reask and parse_error:
+            payload = grader_model.prepare_grader_reask_input(question, parse_error, text)
+            reask_response = grader_model.generate_response(payload)
+            responses.append(reask_response)
+            text, stop_reason, reasks = reask_response["response_text"], reask_response["stop_reason"], 1
+            score, justification, parse_error = parse_grader_sample(question, text)
+        parsed.append({"response": text, "score": score, "justification": justification, "parse_error": parse_error,
+                       "stop_reason": stop_reason, "reasks": reasks})
+
+    return {"first_sample": first_sample, "samples": parsed, "responses": responses,
+            "prepare_seconds": prepared - started, "latency_seconds": time.perf_counter() - prepared}
+
+
+def record_ensemble_grade(question: ExamRecord, grader_model: BaseModel, chunks: List[Dict], verbose=False):
+    """
+    Record the samples of one question (the results of grader_sample_question) on the question record. grader_score
+    is the mean of the usable sample scores, next to their median and variance (ddof=1; 0 for a single sample) and
+    the list of all sample scores (None where unusable). grader_response and grader_justification are those of the
+    sample closest to the median. grader_parse_error is only set if no sample was usable. Tokens, retries and timings
+    are summed over every request made for the question.
+    """
+    chunks = sorted(chunks, key=lambda chunk: chunk["first_sample"])
+    samples = [sample for chunk in chunks for sample in chunk["samples"]]
+    responses = [response for chunk in chunks for response in chunk["responses"]]
+
+    scores = np.array([np.nan if sample["score"] is None else sample["score"] for sample in samples], dtype=float)
+    usable = scores[~np.isnan(scores)]
+    median = float(np.median(usable)) if len(usable) else np.nan
+    representative = samples[int(np.nanargmin(np.abs(scores - median)))] if len(usable) else samples[0]
+
+    question.grader_response = representative["response"]
+    question.grader_score = float(usable.mean()) if len(usable) else np.nan
+    question.grader_justification = representative["justification"]
+    question.grader_parse_error = None if len(usable) else representative["parse_error"]
+    question.grader_reasks = sum(sample["reasks"] for sample in samples)
+    question.grader_samples = len(samples)
+    question.grader_sample_scores = [sample["score"] for sample in samples]
+    question.grader_score_median = median
+    question.grader_score_variance = float(usable.var(ddof=1)) if len(usable) > 1 else (0.0 if len(usable) else np.nan)
+
+    question.grader_response_time = datetime.now().isoformat()
+    question.grader_prepare_seconds = sum(chunk["prepare_seconds"] for chunk in chunks)
+    question.grader_latency_seconds = sum(chunk["latency_seconds"] for chunk in chunks)
+    question.grader_queue_seconds = sum(response.get("queue_seconds") or 0 for response in responses)
+    question.grader_ttft_seconds = responses[0].get("ttft_seconds")
+    question.grader_retries = sum(response.get("retries", 0) for response in responses)
+    question.grader_model_specified = grader_model.model_name
+    question.grader_model_used = responses[0]["model"]
+    question.grader_input_tokens = sum(response["input_tokens"] for response in responses)
+    question.grader_cache_read_tokens = sum(response.get("cache_read_tokens", 0) for response in responses)
+    question.grader_cache_write_tokens = sum(response.get("cache_write_tokens", 0) for response in responses)
+    question.grader_history_tokens_saved = 0
+    question.grader_output_tokens = sum(response["output_tokens"] for response in responses)
+    question.grader_stop_reason = representative["stop_reason"]
+    question.grader_model_params = responses[0]["model_params"]
+    question.grader_system_prompt = responses[0]["system_prompt"]
+    question.grader_cache_hit = all(response.get("cache_hit", False) for response in responses)
+
+    if verbose:
+        tqdm.write(f"\nQuestion {question['index']} ({grader_model.model_name}, {len(samples)} sample(s)):\n"
+                   f"Grader scores: {question.grader_sample_scores} of {question['points']} "
+                   f"(mean {question.grader_score}, median {median}, variance {question.grader_score_variance})\n"
+                   f"Grader justification: {question.grader_justification}\n"
+                   f"----------------------------------------------------------------------------------\n")
+
+    return question
+
+
+def grader_grade_ensemble(exam_df: pd.DataFrame, grader_models: List[BaseModel], verbose=False, concurrency=1,
+                          journals: Optional[List[RunJournal]] = None, reask=True,
+                          rule_grading=False) -> List[pd.DataFrame]:
+    """
+    Grade the exam with an ensemble: several grader models (e.g. one per grader config), each taking its `samples`
+    grades per question. Returns one graded DataFrame per grader model, in the given order, with one row per question
+    (see record_ensemble_grade). Every question is graded independently, without grading history.
+
+    The requests of all graders go through one pool of `concurrency` threads, question by question, so the graders
+    progress together under the shared per-provider rate and concurrency limits. A provider that returns several
+    samples per request (max_samples_per_request, e.g. OpenAI's n) gets them in as few requests as possible, so the
+    prompt is paid for once; otherwise each sample is its own request. With reask, unparseable samples are re-asked
+    once. Each row is journaled as soon as all its samples are in, and rows already in a grader's journal are reused.
+    rule_grading is as in grader_grade_exam; a rule grade counts as one sample of every grader.
+    """
+    if rule_grading:
+        ruled, remaining = split_rule_graded(exam_df)
+        graded_frames = grader_grade_ensemble(remaining, grader_models, verbose, concurrency, journals, reask) \
+            if len(remaining) else [empty_graded_frame(exam_df)] * len(grader_models)
+        return [merge_rule_grades(exam_df, ruled, graded, grader_model, ensemble=True)
+                for graded, grader_model in zip(graded_frames, grader_models)]
+
+    print("Grader ensemble grading exam...")
+    journals = journals or [None] * len(grader_models)
+    rows = exam_df.to_dict('records')
+
+    records, tasks, expected = [], [], {}
+    for grader, (grader_model, journal) in enumerate(zip(grader_models, journals)):
+        completed = journal.completed("grader", grader_model.model_name) if journal else {}
+        if completed:
+            print(f"Resuming {grader_model.model_name}: {len(completed)} of {len(rows)} questions already completed.")
+        records.append([ExamRecord.from_dict(completed.get(row['index'], row)) for row in rows])
+        for position, row in enumerate(rows):
+            if row['index'] in completed:
+                continue
+            step = grader_model.max_samples_per_request
+            chunks = [(first_sample, min(step, grader_model.samples - first_sample))
+                      for first_sample in range(0, grader_model.samples, step)]
+            expected[grader, position] = len(chunks)
+            tasks += [(position, grader, first_sample, samples) for first_sample, samples in chunks]
+    # Question by question, so every grader's rows complete (and are journaled) at the same pace
+    tasks.sort(key=lambda task: task[:2])
+
+    received = {key: [] for key in expected}
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        futures = {executor.submit(grader_sample_question, records[grader][position], grader_models[grader], samples,
+                                   first_sample, reask): (grader, position)
+                   for position, grader, first_sample, samples in tasks}
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            grader, position = key = futures[future]
+            received[key].append(future.result())
+            if len(received[key]) == expected[key]:
+                question = record_ensemble_grade(records[grader][position], grader_models[grader], received.pop(key),
+                                                 verbose)
+                if journals[grader]:
+                    journals[grader].append("grader", grader_models[grader].model_name, question)
+    finally:
+        # On failure, drop the requests not started yet instead of waiting for them
+        executor.shutdown(cancel_futures=True)
+
+    return [records_to_frame(grader_records, exam_df.columns, GRADER_COLUMNS) for grader_records in records]
+
+
+def ensemble_scores(graded_frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Pool the usable sample scores of every grader in an ensemble (the outputs of grader_grade_ensemble) into per-question
+    mean, median and variance (ddof=1; 0 for a single sample), with the number of graders and samples they come from.
+    """
+    columns = ["index", "points", "grader_sample_scores"]
+    samples = pd.concat([df[columns].assign(grader=grader) for grader, df in enumerate(graded_frames)], ignore_index=True)
+    samples = samples.explode("grader_sample_scores").dropna(subset=["grader_sample_scores"])
+    samples["score"] = samples["grader_sample_scores"].astype(float)
+
+    scores = samples.groupby("index", sort=False).agg(
+        graders=("grader", "nunique"), samples=("score", "size"), grader_score_mean=("score", "mean"),
+        grader_score_median=("score", "median"), grader_score_variance=("score", "var"))
+    scores.loc[scores["samples"] == 1, "grader_score_variance"] = 0.0
+    questions = graded_frames[0][["index", "points"]].drop_duplicates("index").set_index("index")
+    scores = questions.join(scores)
+    scores[["graders", "samples"]] = scores[["graders", "samples"]].fillna(0).astype(int)
+    return scores.reset_index()
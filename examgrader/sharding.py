@@ -0,0 +1,347 @@
+"""
+Sharded execution of one run across several processes or hosts that share its output directory.
+
+Static shards split the exam into contiguous ranges of questions, in exam order; each process runs one of them:
+
+    examgrader run exam.jsonl student.json --output_path responses/run --shard 0/4
+    ...
+    examgrader run exam.jsonl student.json --output_path responses/run --shard 3/4
+
+Queue workers instead claim chunks of questions from a SQLite work queue in the output directory until the exam is
+done, so any number of them can be started (and restarted) on the same run:
+
+    examgrader run exam.jsonl student.json --output_path responses/run --queue
+
+Every shard or chunk writes its outputs, journal and a manifest under <output_path>/parts. The process that completes
+the last part merges them into the usual exam_responses/graded_exam outputs, run_metadata.json and run_metrics.json;
+the merge can also be run by hand (e.g. after a part failed and was rerun):
+
+    examgrader merge exam.jsonl responses/run
+
+Shards and chunks are contiguous, so with a "full" or "window" context each part replays the history of its own
+questions only: the history resets at every shard or chunk boundary. Runs that must match an unsharded run exactly
+should use a "stateless" context. Rate limits and max_concurrency are enforced per process, so N processes together
+send up to N times the configured provider rates.
+"""
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import time
+import warnings
+
+from examgrader.checkpoint import RunJournal
+from examgrader.exam_io import DEFAULT_OUTPUT_FORMAT, OUTPUT_FORMATS, read_frame, write_frame
+
+PARTS_DIR = "parts"
+QUEUE_FILE = "queue.sqlite"
+
+# Output name of each stage; parts are written to parts/<output name>.<part>.<format>
+OUTPUT_NAMES = {"student": "exam_responses", "grader": "graded_exam"}
+
+
+def parse_shard(text: str):
+    """
+    argparse type for --shard: "i/N" with 0 <= i < N, returned as (i, N).
+    """
+    try:
+        shard, shards = (int(part) for part in text.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/N (e.g. 0/4), got '{text}'")
+    if not 0 <= shard < shards:
+        raise argparse.ArgumentTypeError(f"shard {shard} is not in 0..{shards - 1}")
+    return shard, shards
+
+
+def shard_range(questions: int, shard: int, shards: int):
+    """
+    (start, stop) positions of shard `shard` of `shards` in an exam of `questions` questions: contiguous ranges in
+    exam order whose sizes differ by at most one.
+    """
+    return shard * questions // shards, (shard + 1) * questions // shards
+
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class WorkQueue:
+    """
+    SQLite queue of the chunks of one run. Workers claim a pending chunk (or one whose lease has expired, e.g. because
+    its worker died), run it and mark it done; a chunk that fails max_attempts times is marked failed and left for a
+    manual rerun. Claims take SQLite's write lock, so any number of processes, and hosts sharing the file on storage
+    with working file locks, can drain the same queue. The rollback journal is used rather than WAL, which needs
+    shared memory between the processes.
+    """
+
+    def __init__(self, queue_path: Path, lease_seconds: float = 3600, max_attempts: int = 3):
+        self.queue_path = Path(queue_path)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._connection = sqlite3.connect(self.queue_path, timeout=60, isolation_level=None)
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS job (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk INTEGER PRIMARY KEY,
+                indices TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                worker TEXT,
+                claimed_at REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT
+            );
+        """)
+
+    def _transaction(self, func):
+        # BEGIN IMMEDIATE takes the write lock up front, so concurrent claims are serialized
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            result = func()
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
+        return result
+
+    def populate(self, job: Dict, chunks: List[List]):
+        """
+        Fill the queue with the chunks of a job, unless another worker already did. job describes the run (exam,
+        chunk size, ...); a worker started with a different job on the same queue is refused with a ValueError.
+        """
+        serialized = json.dumps(job, sort_keys=True)
+
+        def populate():
+            row = self._connection.execute("SELECT value FROM job WHERE key = 'job'").fetchone()
+            if row is not None:
+                if row[0] != serialized:
+                    raise ValueError(f"The work queue {self.queue_path} belongs to a different job: {row[0]}")
+                return
+            self._connection.execute("INSERT INTO job VALUES ('job', ?)", (serialized,))
+            self._connection.executemany("INSERT INTO chunks (chunk, indices) VALUES (?, ?)",
+                                         [(chunk, json.dumps(indices)) for chunk, indices in enumerate(chunks)])
+
+        self._transaction(populate)
+
+    def claim(self, worker: str):
+        """
+        Claim the next chunk for worker. Returns (chunk, question indices), or None when no chunk is left to claim.
+        """
+        def claim():
+            now = time.time()
+            row = self._connection.execute(
+                "SELECT chunk, indices FROM chunks WHERE status = 'pending' OR (status = 'claimed' AND claimed_at < ?) "
+                "ORDER BY chunk LIMIT 1", (now - self.lease_seconds,)).fetchone()
+            if row is None:
+                return None
+            self._connection.execute("UPDATE chunks SET status = 'claimed', worker = ?, claimed_at = ?, "
+                                     "attempts = attempts + 1 WHERE chunk = ?", (worker, now, row[0]))
+            return row[0], json.loads(row[1])
+
+        return self._transaction(claim)
+
+    def complete(self, chunk: int):
+        self._transaction(lambda: self._connection.execute(
+            "UPDATE chunks SET status = 'done', error = NULL WHERE chunk = ?", (chunk,)))
+
+    def fail(self, chunk: int, error: str):
+        """
+        Return a chunk to the queue after an error, or mark it failed once it has used up its attempts.
+        """
+        self._transaction(lambda: self._connection.execute(
+            "UPDATE chunks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, error = ? "
+            "WHERE chunk = ?", (self.max_attempts, error, chunk)))
+
+    def counts(self) -> Dict[str, int]:
+        """
+        Number of chunks per status (pending, claimed, done, failed).
+        """
+        rows = self._connection.execute("SELECT status, COUNT(*) FROM chunks GROUP BY status").fetchall()
+        return {"pending": 0, "claimed": 0, "done": 0, "failed": 0, **dict(rows)}
+
+    def close(self):
+        self._connection.close()
+
+
+def part_manifest_path(output_path: Path, part: str) -> Path:
+    return Path(output_path) / PARTS_DIR / f"{part}.json"
+
+
+def run_part(output_path: Path, part: str, exam_df, take_exam: Callable, output_format: str = DEFAULT_OUTPUT_FORMAT,
+             worker: Optional[str] = None) -> bool:
+    """
+    Run one part (a static shard or a queue chunk) of a sharded run. take_exam(exam_df, journal) runs the exam rows
+    of the part and returns the output DataFrame of each stage ({"student": ..., "grader": ...}). The outputs are
+    written under <output_path>/parts, followed by the part's manifest, which marks the part as complete. A part
+    whose manifest already exists is skipped; an interrupted part resumes from its journal.
+
+    Returns True if the part was run, False if it was already complete.
+    """
+    parts_dir = Path(output_path) / PARTS_DIR
+    parts_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = part_manifest_path(output_path, part)
+    if manifest_path.exists():
+        return False
+
+    worker = worker or worker_name()
+    started_at = time.time()
+    outputs = take_exam(exam_df, RunJournal(parts_dir / f"journal.{part}.jsonl"))
+
+    files = {}
+    for stage, df in outputs.items():
+        # Written under a worker-specific name and renamed, so a part rerun elsewhere never leaves a torn file
+        output_file = parts_dir / f"{OUTPUT_NAMES[stage]}.{part}.{output_format}"
+        temporary_file = parts_dir / f"{OUTPUT_NAMES[stage]}.{part}.{worker}.tmp.{output_format}"
+        write_frame(df, temporary_file)
+        os.replace(temporary_file, output_file)
+        files[stage] = output_file.name
+
+    manifest = {"part": part, "worker": worker, "questions": len(exam_df), "started_at": started_at,
+                "finished_at": time.time(), "outputs": files}
+    temporary_manifest = manifest_path.with_name(f"{manifest_path.stem}.{worker}.tmp")
+    temporary_manifest.write_text(json.dumps(manifest, indent=4))
+    os.replace(temporary_manifest, manifest_path)
+    return True
+
+
+def run_shard(output_path: Path, exam_df, shard: int, shards: int, take_exam: Callable,
+              output_format: str = DEFAULT_OUTPUT_FORMAT) -> bool:
+    """
+    Run static shard `shard` of `shards` (the questions of its shard_range, in exam order). Returns True once every
+    shard of the run is complete.
+    """
+    start, stop = shard_range(len(exam_df), shard, shards)
+    selected = exam_df.iloc[start:stop].reset_index(drop=True)
+    run_part(output_path, f"shard-{shard:03d}-of-{shards:03d}", selected, take_exam, output_format)
+    return all(part_manifest_path(output_path, f"shard-{other:03d}-of-{shards:03d}").exists()
+               for other in range(shards))
+
+
+def run_queue_worker(output_path: Path, exam_df, take_exam: Callable, output_format: str = DEFAULT_OUTPUT_FORMAT,
+                     chunk_size: int = 25, lease_seconds: float = 3600, max_attempts: int = 3) -> bool:
+    """
+    Claim and run chunks of chunk_size questions from the run's work queue (<output_path>/queue.sqlite, created and
+    filled by the first worker) until none is left. A chunk that raises is returned to the queue and the error is
+    re-raised. Returns True once every chunk of the run is done.
+    """
+    worker = worker_name()
+    queue = WorkQueue(Path(output_path) / QUEUE_FILE, lease_seconds, max_attempts)
+    indices = exam_df["index"].tolist()
+    queue.populate({"questions": len(indices), "chunk_size": chunk_size, "output_format": output_format},
+                   [indices[start:start + chunk_size] for start in range(0, len(indices), chunk_size)])
+    try:
+        while True:
+            claimed = queue.claim(worker)
+            if claimed is None:
+                break
+            chunk, chunk_indices = claimed
+            selected = exam_df[exam_df["index"].isin(chunk_indices)].reset_index(drop=True)
+            try:
+                run_part(output_path, f"chunk-{chunk:05d}", selected, take_exam, output_format, worker)
+            except BaseException as e:
+                queue.fail(chunk, f"{type(e).__name__}: {e}")
+                raise
+            queue.complete(chunk)
+        counts = queue.counts()
+    finally:
+        queue.close()
+    if counts["failed"]:
+        warnings.warn(f"{counts['failed']} chunk(s) of {output_path} failed {max_attempts} times; see "
+                      f"{Path(output_path) / QUEUE_FILE}. Rerun a worker after fixing the cause, then merge.")
+    return counts["done"] == sum(counts.values())
+
+
+def claim_merge(output_path: Path) -> bool:
+    """
+    True for exactly one of the processes that call it on a run, so only one of the workers finishing last merges.
+    """
+    try:
+        descriptor = os.open(Path(output_path) / PARTS_DIR / "merged", os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    with os.fdopen(descriptor, "w") as lock_file:
+        lock_file.write(worker_name())
+    return True
+
+
+def merge_parts(output_path: Path, order: Sequence, output_format: str = DEFAULT_OUTPUT_FORMAT,
+                models: Optional[Dict] = None) -> Dict:
+    """
+    Combine the completed parts of a sharded run into <output_path>/exam_responses.<format> and
+    graded_exam.<format> (rows in the given question-index order; a question run by several parts, e.g. a re-claimed
+    chunk, is taken from the part that finished last), and write run_metadata.json and run_metrics.json. models maps
+    each stage to its model, used for cost estimates. Both stages are timed over the interval from the first part's
+    start to the last part's end.
+
+    Returns the outputs written and their StageMetrics summaries: {stage: (output file, summary)}.
+    """
+    import pandas as pd
+    from examgrader.metrics import StageMetrics
+    from examgrader.utils import save_json
+
+    output_path = Path(output_path)
+    manifests = sorted((json.loads(path.read_text()) for path in (output_path / PARTS_DIR).glob("*.json")),
+                       key=lambda manifest: manifest["finished_at"])
+    if not manifests:
+        raise FileNotFoundError(f"No completed parts under {output_path / PARTS_DIR}.")
+    wall_seconds = max(manifest["finished_at"] for manifest in manifests) - min(manifest["started_at"]
+                                                                              for manifest in manifests)
+    position = {index: i for i, index in enumerate(order)}
+
+    merged = {}
+    run_metadata = {}
+    run_metrics = {}
+    for stage, output_name in OUTPUT_NAMES.items():
+        frames = [read_frame(output_path / PARTS_DIR / manifest["outputs"][stage])
+                  for manifest in manifests if stage in manifest["outputs"]]
+        if not frames:
+            continue
+        df = pd.concat(frames, ignore_index=True).drop_duplicates("index", keep="last")
+        df = df.iloc[df["index"].map(position).argsort(kind="stable")].reset_index(drop=True)
+        missing = len(position) - int(df["index"].isin(position).sum())
+        if missing:
+            warnings.warn(f"{missing} of {len(position)} questions have no {stage} output in the parts of "
+                          f"{output_path}; the merged output is incomplete.")
+
+        output_file = output_path / f"{output_name}.{output_format}"
+        write_frame(df, output_file)
+        metrics = StageMetrics.from_frame(df, stage, (models or {}).get(stage))
+        run_metadata[stage] = metrics.usage()
+        run_metrics[stage] = metrics.summary(wall_seconds)
+        merged[stage] = (output_file, run_metrics[stage])
+
+    save_json(run_metadata, output_path / 'run_metadata.json')
+    save_json(run_metrics, output_path / 'run_metrics.json')
+    return merged
+
+
+def main(argv=None):
+    from examgrader.catalog import DEFAULT_CATALOG_PATH, RunCatalog
+    from examgrader.utils import load_config, model_factory
+
+    parser = argparse.ArgumentParser(description="Merge the parts of a sharded run into the run outputs.")
+    parser.add_argument("exam_path", type=Path, help="Filepath to the input exam (JSONL), for the question order.")
+    parser.add_argument("output_path", type=Path, help="Output directory of the sharded run.")
+    parser.add_argument("--output_format", choices=OUTPUT_FORMATS, default=DEFAULT_OUTPUT_FORMAT,
+                        help="File format of the merged outputs.")
+    parser.add_argument("--catalog", type=Path, default=DEFAULT_CATALOG_PATH,
+                        help="Run catalog (SQLite) to which the merged outputs are added.")
+    args = parser.parse_args(argv)
+
+    # The role configs saved in the run directory give the models (for pricing) and the catalog entries
+    configs = {stage: load_config(args.output_path / f"{stage}.json") for stage in OUTPUT_NAMES
+               if (args.output_path / f"{stage}.json").exists()}
+    models = {stage: model_factory(config) for stage, config in configs.items()}
+    merged = merge_parts(args.output_path, read_frame(args.exam_path)["index"].tolist(), args.output_format, models)
+
+    catalog = RunCatalog(args.catalog)
+    for stage, (output_file, summary) in merged.items():
+        catalog.record(output_file, args.exam_path.stem, stage, configs.get(stage), summary)
+        print(f"Merged {summary['questions']} {stage} rows into {output_file}.")
+    catalog.close()
+
+
+if __name__ == "__main__":
+    main()
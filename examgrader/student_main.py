@@ -0,0 +1,151 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+import sys
+import time
+import traceback
+from examgrader.utils import *
+from examgrader.catalog import DEFAULT_CATALOG_PATH, RunCatalog
+from examgrader.exam_io import DEFAULT_OUTPUT_FORMAT, OUTPUT_FORMATS, RowWriter, iter_rows, scan_columns, write_frame
+from examgrader.models.image_cache import image_cache
+from examgrader.checkpoint import RunJournal
+from examgrader.models.response_cache import ResponseCache
+import shutil
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("exam_path", type=Path, help="Filepath to the input exam (JSONL).")
+    parser.add_argument("student_config", type=lambda s: [Path(item) for item in s.split(',')],
+                        help="Filepath to student config files (JSON), separated by commas (no space).")
+    parser.add_argument("--output_path", type=Path,
+                        help="Directory to save the processed exams. If not provided, defaults to the exam name with a timestamp.")
+    parser.add_argument("--verbose", action='store_true', help="Enable verbose output.", default=False)
+    parser.add_argument("--log_config", action='store_true',
+                        help="Log model configurations to output .csv and .jsonl files", default=False)
+    parser.add_argument("--resume", type=Path,
+                        help="Output directory of an interrupted run to resume. Rows already recorded in its journal are skipped.")
+    parser.add_argument("--image_cache_dir", type=Path,
+                        help="Directory for an on-disk store of encoded images, reused across runs. Images are always cached in memory within a run.")
+    parser.add_argument("--cache", choices=ResponseCache.modes, default="off",
+                        help="Response cache mode: 'read' reuses cached responses for identical requests and stores new ones, "
+                             "'write' always calls the API and refreshes the cache, 'off' disables caching.")
+    parser.add_argument("--cache_path", type=Path, default=Path('.cache') / 'responses.sqlite',
+                        help="SQLite file for the response cache.")
+    parser.add_argument("--cache_max_mb", type=int, default=1024,
+                        help="Maximum size of cached responses in MB; least recently used entries are evicted.")
+    parser.add_argument("--stream", action='store_true', default=False,
+                        help="Read questions lazily and write each output row as soon as it is ready, without building "
+                             "DataFrames. Memory stays flat with --concurrency > 1 or a stateless context.")
+    parser.add_argument("--output_format", choices=OUTPUT_FORMATS, default=DEFAULT_OUTPUT_FORMAT,
+                        help="File format of the output files.")
+    parser.add_argument("--catalog", type=Path, default=DEFAULT_CATALOG_PATH,
+                        help="Run catalog (SQLite) to which the outputs of this run are added.")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="Number of questions to send to the model API in parallel. Values above 1 dispatch "
+                             "questions independently, without conversation history.")
+    parser.add_argument("--stream_responses", action='store_true', default=False,
+                        help="Stream model responses token by token: records time to first token and, with --verbose, prints "
+                             "answers as they arrive.")
+
+    args = parser.parse_args(argv)
+
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1.")
+
+    # Resuming writes back into the interrupted run's output directory
+    if args.resume is not None:
+        if args.output_path is not None and args.output_path != args.resume:
+            parser.error("--output_path and --resume must refer to the same directory.")
+        args.output_path = args.resume
+
+    # Set default output_path after parsing if it wasn't explicitly provided
+    if args.output_path is None:
+        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        # Construct the default output_path based on exam_path and timestamp
+        default_output_name = args.exam_path.stem + f"_output_{timestamp}"
+        args.output_path = Path('responses') / default_output_name
+
+    return args
+
+def main(argv=None):
+    args = parse_arguments(argv)
+
+    # pandas and the runners load only once the arguments are valid, keeping --help fast
+    import pandas as pd
+    from tqdm import tqdm
+    from examgrader.runners import student_take_exam, student_take_exam_streaming
+    from examgrader.metrics import StageMetrics
+
+    # Make output directory; save student and grader config
+    args.output_path.mkdir(parents=True, exist_ok=args.resume is not None)
+
+    if args.image_cache_dir:
+        image_cache.configure(sidecar_dir=args.image_cache_dir)
+
+    # Load exam once for all configs (streamed runs re-read it lazily for each config instead)
+    if not args.stream:
+        df_exam = pd.read_json(args.exam_path, lines=True)
+
+    response_cache = ResponseCache(args.cache_path, args.cache_max_mb * 1024 ** 2) if args.cache != "off" else None
+    catalog = RunCatalog(args.catalog)
+
+    def run_student_config(position, student_config_path):
+        STUDENT_CONFIG = load_config(student_config_path)
+        student_model = model_factory(STUDENT_CONFIG)
+        student_model.use_response_cache(response_cache, args.cache)
+        student_model.stream_responses = args.stream_responses
+        shutil.copy(student_config_path, args.output_path / student_config_path.name)
+
+        # One journal per config, since several configs may use the same model
+        journal = RunJournal(args.output_path / f'journal_{student_config_path.stem}.jsonl')
+        progress = {"desc": student_config_path.stem, "position": position}
+        df_exam_responses_output_path = args.output_path / f'exam_responses_{student_config_path.stem}.{args.output_format}'
+        started = time.perf_counter()
+        try:
+            if args.stream:
+                with RowWriter(df_exam_responses_output_path, scan_columns(args.exam_path)) as writer:
+                    student_metrics = student_take_exam_streaming(iter_rows(args.exam_path), student_model, writer,
+                                                                  args.verbose, args.concurrency, journal, progress)
+            else:
+                df_exam_responses = student_take_exam(df_exam, student_model, args.verbose, args.concurrency, journal,
+                                                      progress)
+                write_frame(df_exam_responses, df_exam_responses_output_path)
+                student_metrics = StageMetrics.from_frame(df_exam_responses, "student", student_model)
+        finally:
+            student_model.close()
+        summary = student_metrics.summary(time.perf_counter() - started)
+        catalog.record(df_exam_responses_output_path, args.exam_path.stem, "student", STUDENT_CONFIG, summary)
+        return student_metrics.usage(), summary
+
+    # Run every student config side by side. They share the loaded exam, the image cache and the per-provider rate
+    # and concurrency limits; a config that fails is reported without interrupting the others.
+    run_metadata = {}
+    run_metrics = {}
+    failed = []
+    with ThreadPoolExecutor(max_workers=len(args.student_config)) as executor:
+        futures = {executor.submit(run_student_config, position, student_config_path): student_config_path
+                   for position, student_config_path in enumerate(args.student_config)}
+        for future in as_completed(futures):
+            student_config_path = futures[future]
+            try:
+                run_metadata[student_config_path.stem], run_metrics[student_config_path.stem] = future.result()
+            except Exception as e:
+                tqdm.write(f"\nStudent config {student_config_path} failed:\n{traceback.format_exc()}")
+                run_metadata[student_config_path.stem] = {"error": f"{type(e).__name__}: {e}"}
+                run_metrics[student_config_path.stem] = run_metadata[student_config_path.stem]
+                failed.append(student_config_path)
+
+    # Keep the metadata in config order
+    run_metadata = {path.stem: run_metadata[path.stem] for path in args.student_config}
+    run_metrics = {path.stem: run_metrics[path.stem] for path in args.student_config}
+    save_json(run_metadata, args.output_path / 'run_metadata.json')
+    save_json(run_metrics, args.output_path / 'run_metrics.json')
+    catalog.close()
+
+    if failed:
+        sys.exit(f"{len(failed)} of {len(args.student_config)} student configs failed: "
+                 f"{', '.join(str(path) for path in failed)}. Rerun with --resume {args.output_path} to retry them.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+from functools import lru_cache
+import importlib
+import json
+from pathlib import Path
+import os
+
+# Library of all models implemented, resolved relative to this file so the scripts can be run from any directory
+MODEL_LIBRARY_PATH = Path(__file__).resolve().parent / 'models' / 'model_library.json'
+
+
+def load_system_prompt(filepath: Path) -> str:
+    with open(filepath, 'r') as file:
+        data = json.load(file)
+        return data.get("task_description", "")
+
+def load_config(config_path):
+    with open(config_path, 'r') as config_file:
+        return json.load(config_file)
+
+def save_json(data, json_file_path):
+    with open(json_file_path, 'w') as file:
+        json.dump(data, file, indent=4)
+
+def save_dict_to_jsonl(data_dict, jsonl_file_path):
+    # Open the file in write mode
+    with open(jsonl_file_path, 'w') as file:
+        # If 'data_dict' is actually a list of dictionaries:
+        for item in data_dict:
+            json.dump(item, file)
+            file.write('\n')
+        # If 'data_dict' is a single dictionary and you want it as a single line:
+        # json.dump(data_dict, file)
+        # file.write('\n')
+
+
+class ModelRegistry:
+    """
+    The models of a model library indexed by name. A provider's model class, and with it the provider SDK, is only
+    imported when the first model of that provider is created.
+    """
+
+    def __init__(self, model_library):
+        self.model_library = model_library
+        self.providers = {model_name: provider for provider, provider_menu in model_library.items()
+                          for model_name in provider_menu["models"]}
+        self._model_classes = {}
+
+    def model_class(self, provider):
+        if provider not in self._model_classes:
+            provider_menu = self.model_library[provider]
+            module = importlib.import_module(provider_menu["model_module"])
+            self._model_classes[provider] = getattr(module, provider_menu["model_class"])
+        return self._model_classes[provider]
+
+    def create(self, model_config):
+        provider = self.providers.get(model_config['model_name'])
+        if provider is None:
+            raise ValueError(f"Model {model_config['model_name']} is not supported.")
+        provider_menu = self.model_library[provider]
+
+        # Local providers (e.g. the mock) have no api_key_env_var and need no key
+        api_key_env_var = provider_menu.get("api_key_env_var")
+        api_key = os.getenv(api_key_env_var) if api_key_env_var else None
+        if api_key_env_var and not api_key:
+            raise ValueError(
+                f"No API key found for {provider}. Please set the {api_key_env_var} environment variable.")
+
+        # Check if the model has vision capabilities
+        vision = model_config['model_name'] in provider_menu["models_with_vision"]
+        context_window = provider_menu.get("context_windows", {}).get(model_config['model_name'])
+
+        # Initialize and return the model instance
+        model_class = self.model_class(provider)
+        return model_class(api_key=api_key, model_name=model_config["model_name"], vision=vision, system_prompt=model_config["system_prompt"], model_params=model_config["model_params"],
+                           client_params=model_config.get("client_params"), context_params=model_config.get("context"),
+                           context_window=context_window, provider=provider, rate_limits=provider_menu.get("rate_limits"),
+                           retry_params=provider_menu.get("retry"), max_concurrency=provider_menu.get("max_concurrency"),
+                           prompt_caching=provider_menu.get("prompt_caching", False),
+                           pricing=provider_menu.get("pricing", {}).get(model_config['model_name']),
+                           structured_output=model_config.get("structured_output"),
+                           samples=model_config.get("samples", 1),
+                           image_profile=provider_menu.get("image_profile"))
+
+
+@lru_cache(maxsize=None)
+def model_registry(model_library_path=MODEL_LIBRARY_PATH) -> ModelRegistry:
+    """
+    Registry of the model library at model_library_path, read once per process.
+    """
+    return ModelRegistry(load_config(model_library_path))
+
+
+def model_factory(model_config, model_library=None):
+    """
+    Create the model of a role config from the default model library (or the given one).
+    """
+    registry = model_registry() if model_library is None else ModelRegistry(model_library)
+    return registry.create(model_config)